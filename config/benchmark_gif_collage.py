@@ -0,0 +1,92 @@
+"""
+Benchmark of gif_to_collage on generated animated GIFs of varying length.
+
+For each GIF, it reports the time of the frame count read from the
+headers (count_gif_frames) and of a count that decodes every frame
+(the previous approach), then the time of gif_to_collage with the
+middle frame (as used by resize-graphic) and with a 4-frame collage.
+
+Usage (from the repository root):
+    python -m config.benchmark_gif_collage --frames 10 50 200 500
+"""
+
+import argparse
+import logging
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from config.process_image import count_gif_frames, gif_to_collage
+
+
+def make_gif(num_frames: int, width: int, height: int, seed: int = 0):
+    """
+    Encode a GIF in which every frame redraws a few random blocks of the
+    previous one, like a typical animation.
+    """
+    rng = np.random.default_rng(seed)
+    palette = rng.integers(0, 256, 256 * 3, dtype=np.uint8).tolist()
+    canvas = rng.integers(0, 256, (height, width), dtype=np.uint8)
+    frames = []
+    for _ in range(num_frames):
+        for _ in range(4):
+            y = int(rng.integers(0, height - height // 8))
+            x = int(rng.integers(0, width - width // 8))
+            canvas[y:y + height // 8, x:x + width // 8] = rng.integers(256)
+        frame = Image.fromarray(canvas, mode="L").convert("P")
+        frame.putpalette(palette)
+        frames.append(frame)
+    buffer = BytesIO()
+    frames[0].save(buffer, format="GIF", save_all=True,
+                   append_images=frames[1:], duration=40, loop=0)
+    return buffer.getvalue()
+
+
+def count_frames_by_decoding(gif: Image.Image) -> int:
+    total_frames = 0
+    try:
+        while True:
+            gif.seek(total_frames)
+            total_frames += 1
+    except EOFError:
+        pass
+    return total_frames
+
+
+def timed(func, data: bytes, repeat: int, **kwargs) -> float:
+    times = []
+    for _ in range(repeat):
+        gif = Image.open(BytesIO(data))
+        start = time.perf_counter()
+        func(gif, **kwargs)
+        times.append(time.perf_counter() - start)
+    return 1000 * float(np.median(times))
+
+
+def run(frame_counts, width: int, height: int, repeat: int):
+    print(f"{'frames':>6} {'size':>8} {'count hdr':>10} {'count dec':>10} "
+          f"{'middle':>9} {'4-frame':>9}  (median ms)")
+    for num_frames in frame_counts:
+        data = make_gif(num_frames, width, height)
+        count_header = timed(count_gif_frames, data, repeat)
+        count_decode = timed(count_frames_by_decoding, data, repeat)
+        middle = timed(gif_to_collage, data, repeat, max_frames=1)
+        collage = timed(gif_to_collage, data, repeat, max_frames=4)
+        print(f"{num_frames:>6} {len(data) // 1024:>6}kB "
+              f"{count_header:>10.1f} {count_decode:>10.1f} "
+              f"{middle:>9.1f} {collage:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--frames", type=int, nargs="+",
+                        default=[10, 50, 200, 500])
+    parser.add_argument("--width", type=int, default=480)
+    parser.add_argument("--height", type=int, default=360)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    run(args.frames, args.width, args.height, args.repeat)
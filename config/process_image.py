@@ -3,7 +3,14 @@ import base64
 from io import BytesIO
 import logging
 import math
-from typing import Optional, Literal
+import struct
+from typing import Optional, Literal, Sequence, Tuple
+
+# JPEG start-of-frame markers, which hold the image dimensions
+_JPEG_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+# MIME types of the output formats
+IMAGE_MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg",
+                    "WEBP": "image/webp", "GIF": "image/gif"}
 
 
 def process_image(base64_image_str, output_size, output_format=None):
@@ -83,15 +90,261 @@ def process_image(base64_image_str, output_size, output_format=None):
         raise
 
 
+def probe_image_header(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Read the format and dimensions of an image from its header bytes,
+    without decoding it.
+
+    Only still PNG, JPEG and WebP images are recognized. Animated images
+    (APNG, animated WebP) and files without their end marker return None,
+    as do other formats, so that callers fall back to a full decode.
+
+    :param data: Encoded image bytes
+    :return: (format, width, height) as named by PIL, or None
+    """
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n"):
+            return _probe_png(data)
+        if data.startswith(b"\xff\xd8"):
+            return _probe_jpeg(data)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            return _probe_webp(data)
+    except (struct.error, IndexError):
+        pass
+    return None
+
+
+def _probe_png(data: bytes) -> Optional[Tuple[str, int, int]]:
+    if data[12:16] != b"IHDR" or not data.endswith(b"IEND\xaeB`\x82"):
+        return None
+    width, height = struct.unpack(">II", data[16:24])
+    # walk the chunks before the image data, looking for animation control
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk_type = struct.unpack(">I4s", data[pos:pos + 8])
+        if chunk_type == b"acTL":
+            return None
+        if chunk_type == b"IDAT":
+            return "PNG", width, height
+        pos += 12 + length
+    return None
+
+
+def _probe_jpeg(data: bytes) -> Optional[Tuple[str, int, int]]:
+    if not data.rstrip(b"\x00").endswith(b"\xff\xd9"):
+        return None
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            # markers without a segment
+            pos += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[pos + 5:pos + 9])
+            return "JPEG", width, height
+        (length,) = struct.unpack(">H", data[pos + 2:pos + 4])
+        pos += 2 + length
+    return None
+
+
+def _probe_webp(data: bytes) -> Optional[Tuple[str, int, int]]:
+    chunk = data[12:16]
+    if chunk == b"VP8 ":
+        width, height = struct.unpack("<HH", data[26:30])
+        return "WEBP", width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L":
+        (bits,) = struct.unpack("<I", data[21:25])
+        return "WEBP", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b"VP8X":
+        if data[20] & 0x02:
+            # animated
+            return None
+        width = int.from_bytes(data[24:27], "little") + 1
+        height = int.from_bytes(data[27:30], "little") + 1
+        return "WEBP", width, height
+    return None
+
+
+def encode_image(
+    image: Image.Image,
+    output_format: str = "PNG",
+    png_compress_level: int = 6,
+    quality: int = 90
+) -> bytes:
+    """
+    Encode an image, converting its mode if the format requires it.
+
+    :param image: PIL Image
+    :param output_format: 'PNG', 'JPEG' or 'WEBP'
+    :param png_compress_level: zlib level of PNG output (0-9); lower
+                               levels are faster but larger
+    :param quality: Quality of JPEG and WebP output (1-100)
+    :return: Encoded image bytes
+    """
+    output_format = output_format.upper()
+    options = {}
+    if output_format == "PNG":
+        options["compress_level"] = png_compress_level
+    elif output_format == "JPEG":
+        options["quality"] = quality
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+    elif output_format == "WEBP":
+        options["quality"] = quality
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert(
+                "RGBA" if "transparency" in image.info
+                or image.mode in ("LA", "PA") else "RGB"
+            )
+    buffer = BytesIO()
+    image.save(buffer, format=output_format, **options)
+    return buffer.getvalue()
+
+
+def resize_encoded_image(
+    base64_image_str: str,
+    output_size: Tuple[int, int],
+    output_format: str = "PNG",
+    passthrough_formats: Sequence[str] = ("PNG",),
+    png_compress_level: int = 6,
+    quality: int = 90
+) -> Tuple[str, str]:
+    """
+    Fit a base64 encoded image within output_size, decoding and encoding
+    it at most once.
+
+    Images that are already within output_size and in one of
+    passthrough_formats are returned unchanged, after reading only their
+    header. Other images are decoded once, converted to a collage if they
+    are GIFs (like process_image), thumbnailed if needed and encoded once
+    in output_format.
+
+    :param base64_image_str: Base64 encoded image string
+    :param output_size: Maximum size (width, height) of the output image
+    :param output_format: Format of re-encoded images ('PNG', 'JPEG',
+                          'WEBP')
+    :param passthrough_formats: Formats that are kept as is when the image
+                                does not need resizing
+    :param png_compress_level: zlib level of PNG output (0-9)
+    :param quality: Quality of JPEG and WebP output (1-100)
+    :return: (base64 encoded image, format of the image)
+    """
+    image_data = base64.b64decode(base64_image_str)
+
+    header = probe_image_header(image_data)
+    if header is not None:
+        image_format, width, height = header
+        logging.info(f'Original size - width: {width}, height: {height}')
+        logging.info(f'Original format: {image_format}')
+        if image_format in passthrough_formats and \
+                width <= output_size[0] and height <= output_size[1]:
+            logging.info("Image is within limits and in an accepted "
+                         "format, passing it through.")
+            return base64_image_str, image_format
+
+    image = Image.open(BytesIO(image_data))
+    if header is None:
+        logging.info(f'Original size - width: {image.width}, '
+                     f'height: {image.height}')
+        logging.info(f'Original format: {image.format}')
+
+    if image.format == 'GIF':
+        logging.info("Converting GIF into a collage.")
+        # single frame, see process_image
+        image = gif_to_collage(image, max_frames=1)
+
+    if image.width > output_size[0] or image.height > output_size[1]:
+        logging.info("Image needs resizing (maintaining aspect ratio).")
+        # also lets the JPEG decoder downscale while decoding
+        image.thumbnail(output_size)
+
+    encoded = encode_image(
+        image, output_format, png_compress_level, quality
+    )
+    logging.info(f'Final size - width: {image.width}, '
+                 f'height: {image.height}')
+    logging.info(f'Final image format: {output_format.upper()}')
+    return base64.b64encode(encoded).decode('utf-8'), output_format.upper()
+
+
+# Maximum number of pixels decoded to sample the frames of a GIF
+GIF_MAX_DECODED_PIXELS = 100_000_000
+
+
+def count_gif_frames(gif: Image.Image) -> int:
+    """
+    Number of frames of a GIF, read from the frame headers without
+    decoding the frames.
+    """
+    n_frames = getattr(gif, "n_frames", None)
+    if n_frames is not None:
+        return n_frames
+    # fallback for image objects without n_frames: decode every frame
+    total_frames = 0
+    try:
+        while True:
+            gif.seek(total_frames)
+            total_frames += 1
+    except EOFError:
+        pass
+    gif.seek(0)
+    return total_frames
+
+
+def select_frames(
+    total_frames: int,
+    max_frames: Optional[int],
+    sample_method: Literal['interval', 'sequential'] = 'interval'
+) -> list:
+    """
+    Indices of the frames to include in a collage, in increasing order.
+
+    :param total_frames: Number of frames available
+    :param max_frames: Maximum number of frames (None = all frames)
+    :param sample_method: 'interval' (evenly spaced)
+                          or 'sequential' (first N frames)
+    """
+    if max_frames is None or max_frames >= total_frames:
+        return list(range(total_frames))
+    if sample_method == 'interval':
+        # Sample frames at equal intervals across the entire GIF
+        if max_frames == 1:
+            return [total_frames // 2]  # Middle frame
+        # Calculate interval to spread frames evenly
+        interval = (total_frames - 1) / (max_frames - 1)
+        frame_indices = [round(i * interval) for i in range(max_frames)]
+        # Ensure we don't exceed bounds and remove duplicates
+        return sorted(
+            set(min(idx, total_frames - 1) for idx in frame_indices)
+        )
+    # sequential
+    return list(range(min(max_frames, total_frames)))
+
+
 def gif_to_collage(
     gif: Image.Image,
     max_frames: Optional[int] = None,
     grid_cols: Optional[int] = None,
-    sample_method: Literal['interval', 'sequential'] = 'interval'
+    sample_method: Literal['interval', 'sequential'] = 'interval',
+    max_decoded_pixels: Optional[int] = GIF_MAX_DECODED_PIXELS
 ) -> Image.Image:
     """
     Convert a GIF to a PNG collage showing multiple frames.
 
+    The frame count is read from the frame headers, and frames are decoded
+    in a single forward pass that stops at the last selected frame. Frames
+    before a selected frame are still decoded, as GIF frames are drawn
+    over the previous ones. To bound the work on GIFs with many or large
+    frames, frames are only sampled among the first ones whose total size
+    fits in max_decoded_pixels.
+
     Args:
         gif: original GIF Image object
         max_frames: Maximum number of frames to include (None = all frames)
@@ -99,6 +352,8 @@ def gif_to_collage(
             (None = auto-calculate square-ish grid)
         sample_method: 'interval' (evenly spaced)
             or 'sequential' (first N frames)
+        max_decoded_pixels: Maximum number of pixels decoded
+            (None = no limit)
     Returns:
         Collage Image object in RGB mode
     """
@@ -106,44 +361,31 @@ def gif_to_collage(
     # Set loading strategy for consistent RGB mode
     GifImagePlugin.LOADING_STRATEGY = GifImagePlugin.LoadingStrategy.RGB_ALWAYS
 
-    # First pass: count total frames
-    total_frames = 0
-    try:
-        while True:
-            gif.seek(total_frames)
-            total_frames += 1
-    except EOFError:
-        pass
-
+    total_frames = count_gif_frames(gif)
     logging.info(f"Total frames in GIF: {total_frames}")
 
     if total_frames == 1:
         logging.info("GIF has only one frame, returning as is.")
         return gif
 
-    # Determine which frames to extract
-    if max_frames is None or max_frames >= total_frames:
-        frame_indices = list(range(total_frames))
-    elif sample_method == 'interval':
-        # Sample frames at equal intervals across the entire GIF
-        if max_frames == 1:
-            frame_indices = [total_frames // 2]  # Middle frame
-        else:
-            # Calculate interval to spread frames evenly
-            interval = (total_frames - 1) / (max_frames - 1)
-            frame_indices = [round(i * interval) for i in range(max_frames)]
-            # Ensure we don't exceed bounds and remove duplicates
-            frame_indices = sorted(
-                list(
-                    set([min(idx, total_frames - 1) for idx in frame_indices])
-                    )
+    # Frames that can be decoded within the pixel budget
+    decodable_frames = total_frames
+    if max_decoded_pixels is not None:
+        frame_pixels = max(1, gif.width * gif.height)
+        decodable_frames = max(
+            1, min(total_frames, max_decoded_pixels // frame_pixels)
+        )
+        if decodable_frames < total_frames:
+            logging.warning(
+                f"GIF too large to decode entirely, sampling frames among "
+                f"the first {decodable_frames} of {total_frames}"
             )
-    else:  # sequential
-        frame_indices = list(range(min(max_frames, total_frames)))
 
+    # Determine which frames to extract
+    frame_indices = select_frames(decodable_frames, max_frames, sample_method)
     logging.info(f"Extracting frames at indices: {frame_indices}")
 
-    # Second pass: extract the selected frames
+    # Extract the selected frames, seeking forward only
     frames = []
     for frame_idx in frame_indices:
         gif.seek(frame_idx)
@@ -14,13 +14,19 @@
 # If not, see
 # <https://github.com/Shared-Reality-Lab/IMAGE-server/blob/main/LICENSE>.
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import time
 import logging
 import sys
 from datetime import datetime
 from config.logging_utils import configure_logging
-from utils.llm import LLMClient, CATEGORISER_PROMPT
+from utils.llm import (
+    LLMClient,
+    CATEGORISER_PROMPT,
+    GRAPHIC_DESCRIPTION_FUSED,
+    describe_graphic,
+    render_metrics
+)
 
 from utils.validation import Validator
 import json
@@ -44,7 +50,7 @@ logging.debug(f"Possible categories: {POSSIBLE_CATEGORIES}")
 PREPROCESSOR_NAME = "ca.mcgill.a11y.image.preprocessor.contentCategoriser"
 
 try:
-    llm_client = LLMClient()
+    llm_client = LLMClient(preprocessor=PREPROCESSOR_NAME)
     validator = Validator(data_schema=DATA_SCHEMA)
     logging.debug("LLM client and validator initialized")
 except Exception as e:
@@ -78,13 +84,24 @@ def categorise():
     source = content["graphic"]
     base64_image = source.split(",")[1]
 
-    graphic_category = llm_client.chat_completion(
-        prompt=f"{CATEGORISER_PROMPT} {POSSIBLE_CATEGORIES}",
-        image_base64=base64_image,
-        temperature=0.0,
-        json_schema=CATEGORISER_RESPONSE_SCHEMA,
-        parse_json=True
-    )
+    graphic_category = None
+    if GRAPHIC_DESCRIPTION_FUSED:
+        # categories and caption in one request shared with graphic-caption
+        description = describe_graphic(
+            llm_client, base64_image, CATEGORISER_RESPONSE_SCHEMA
+        )
+        if description is not None:
+            graphic_category = {"categories": description["categories"]}
+
+    if graphic_category is None:
+        graphic_category = llm_client.chat_completion(
+            prompt=f"{CATEGORISER_PROMPT} {POSSIBLE_CATEGORIES}",
+            image_base64=base64_image,
+            temperature=0.0,
+            json_schema=CATEGORISER_RESPONSE_SCHEMA,
+            parse_json=True,
+            canonical_image=True
+        )
 
     if graphic_category is None:
         logging.error("Failed to receive response from LLM.")
@@ -116,14 +133,27 @@ def categorise():
 @app.route("/health", methods=["GET"])
 def health():
     """
-    Health check endpoint to verify if the service is running
+    Health check endpoint to verify if the service is running.
+    Reports "degraded" while the circuit breaker guarding the LLM backend
+    is not closed, in which case LLM requests fail fast.
     """
+    llm_health = llm_client.health()
+    breaker_closed = llm_health["circuit_breaker"]["state"] == "closed"
     return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "status": "healthy" if breaker_closed else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "llm": llm_health
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    LLM client metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """
@@ -19,6 +19,8 @@
 
 import cv2
 import argparse
+import os
+import threading
 import numpy as np
 import torch
 import torchvision.transforms as transforms
@@ -36,6 +38,20 @@ configure_logging()
 
 app = Flask(__name__)
 
+DEPTH_CHECKPOINT = os.environ.get("DEPTH_CHECKPOINT", "/app/res101.pth")
+
+# Choose GPU for processing if available, unless a device is forced
+if os.environ.get("DEPTH_DEVICE"):
+    DEVICE = torch.device(os.environ["DEPTH_DEVICE"])
+elif torch.cuda.is_available():
+    DEVICE = torch.device("cuda:0")
+else:
+    DEVICE = torch.device("cpu")
+
+# depth model is loaded once per worker and reused across requests
+_depth_model = None
+_depth_model_lock = threading.Lock()
+
 # Initialize shared validator
 VALIDATOR = Validator(
     data_schema='./schemas/preprocessors/depth-map-generator.schema.json'
@@ -86,6 +102,54 @@ def scale_torch(img):
     return img
 
 
+def load_depth_model():
+    """
+    Build the LeReS depth model and load its checkpoint onto DEVICE.
+    :return: the model in eval mode.
+    """
+    logging.pii(f"Initializing RelDepthModel with resnext101 \
+                and loading weights from {DEPTH_CHECKPOINT}")
+    model = RelDepthModel(backbone='resnext101')
+    model.eval()
+    checkpoint = torch.load(DEPTH_CHECKPOINT, map_location=DEVICE)
+    try:
+        model.load_state_dict(strip_prefix_if_present(
+                              checkpoint['depth_model'], "module."),
+                              strict=True)
+    finally:
+        del checkpoint
+    model.to(DEVICE)
+    if DEVICE.type == "cuda":
+        torch.cuda.empty_cache()
+    logging.info(f"Depth model loaded on {DEVICE}")
+    return model
+
+
+def get_depth_model():
+    """
+    Return the resident depth model, loading it on first use.
+    """
+    global _depth_model
+    if _depth_model is None:
+        with _depth_model_lock:
+            if _depth_model is None:
+                _depth_model = load_depth_model()
+    return _depth_model
+
+
+def predict_depth(model, img_torch):
+    """
+    Run the forward pass on DEVICE.
+    RelDepthModel.inference hardcodes .cuda(), so the same
+    post-processing is done here to also allow running on CPU.
+    :param img_torch: normalized image batch in shape [N, C, H, W]
+    :return: relative depth in shape [N, 1, H, W] on DEVICE
+    """
+    with torch.inference_mode():
+        depth = model.depth_model(img_torch.to(DEVICE))
+        return depth - depth.min() + 0.01
+
+
 @app.route("/preprocessor", methods=['POST', ])
 def depthgenerator():
     logging.debug("Received request")
@@ -130,31 +194,20 @@ def depthgenerator():
     image = np.asarray(bytearray(binary), dtype="uint8")
     img = cv2.imdecode(image, cv2.IMREAD_COLOR)
 
-    # create depth model
-    depth_model = RelDepthModel(backbone='resnext101')
-    depth_model.eval()
-
-    # load checkpoint
+    # get resident depth model
     try:
-        checkpoint = torch.load("/app/res101.pth")
-        depth_model.load_state_dict(strip_prefix_if_present(
-                                    checkpoint['depth_model'], "module."),
-                                    strict=True)
+        depth_model = get_depth_model()
     except Exception as e:
         logging.error("Error loading model checkpoint")
         logging.pii(f"Checkpoint load error: {e}")
         return jsonify("Depth Model cannot complete"), 500
-    finally:
-        del checkpoint
-        torch.cuda.empty_cache()
-
-    depth_model.cuda()
 
     rgb_c = img[:, :, ::-1].copy()
     A_resize = cv2.resize(rgb_c, (448, 448))
     try:
         img_torch = scale_torch(A_resize)[None, :, :, :]
-        pred_depth = depth_model.inference(img_torch).cpu().numpy().squeeze()
+        pred_depth = predict_depth(depth_model, img_torch)
+        pred_depth = pred_depth.cpu().numpy().squeeze()
         pred_depth_ori = cv2.resize(pred_depth, (img.shape[1], img.shape[0]))
         pred_depth_ori = pred_depth_ori/np.max(pred_depth_ori) * 255
 
@@ -186,7 +239,6 @@ def depthgenerator():
     if not ok:
         return jsonify("Invalid Preprocessor JSON format"), 500
 
-    torch.cuda.empty_cache()
     logging.debug("Sending response")
     return response
 
@@ -205,19 +257,12 @@ def health():
 @app.route("/warmup", methods=["GET"])
 def warmup():
     try:
-        logging.pii("[WARMUP] Initializing RelDepthModel with resnext101 \
-                    and loading weights from /app/res101.pth")
-        model = RelDepthModel(backbone='resnext101').eval().cuda()
-        model.load_state_dict(
-            strip_prefix_if_present(
-                torch.load("/app/res101.pth")['depth_model'], "module."),
-            strict=True
-        )
+        model = get_depth_model()
 
         # simulating a single RGB image input to the model
         # 1: one image; 3: RGB; 448 and 448: height and width
-        dummy = torch.ones((1, 3, 448, 448), dtype=torch.float32).cuda()
-        _ = model.inference(dummy)
+        dummy = torch.ones((1, 3, 448, 448), dtype=torch.float32)
+        _ = predict_depth(model, dummy)
         return jsonify({"status": "warmed"}), 200
 
     except Exception as e:
@@ -14,7 +14,8 @@
 # If not, see
 # <https://github.com/Shared-Reality-Lab/IMAGE-server/blob/main/LICENSE>.
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
+import json
 import sys
 import time
 import logging
@@ -22,7 +23,10 @@ from datetime import datetime
 from config.logging_utils import configure_logging
 from utils.llm import (
     LLMClient,
-    GRAPHIC_CAPTION_PROMPT
+    GRAPHIC_CAPTION_PROMPT,
+    GRAPHIC_DESCRIPTION_FUSED,
+    describe_graphic,
+    render_metrics
 )
 from utils.validation import Validator
 
@@ -31,11 +35,17 @@ configure_logging()
 app = Flask(__name__)
 
 DATA_SCHEMA = './schemas/preprocessors/caption.schema.json'
+# categories of the fused request shared with content-categoriser
+CATEGORISER_SCHEMA = './schemas/preprocessors/content-categoriser.schema.json'
 PREPROCESSOR_NAME = "ca.mcgill.a11y.image.preprocessor.graphic-caption"
 
 try:
-    llm_client = LLMClient()
+    llm_client = LLMClient(preprocessor=PREPROCESSOR_NAME)
     VALIDATOR = Validator(data_schema=DATA_SCHEMA)
+    CATEGORISER_RESPONSE_SCHEMA = None
+    if GRAPHIC_DESCRIPTION_FUSED:
+        with open(CATEGORISER_SCHEMA, 'r') as f:
+            CATEGORISER_RESPONSE_SCHEMA = json.load(f)
     logging.debug("LLM client and validator initialized")
 except Exception as e:
     logging.error(f"Failed to initialize clients: {e}")
@@ -70,11 +80,22 @@ def categorise():
     source = content["graphic"]
     base64_image = source.split(",")[1]
 
-    graphic_caption = llm_client.chat_completion(
-        prompt=GRAPHIC_CAPTION_PROMPT,
-        image_base64=base64_image,
-        temperature=0.0
-    )
+    graphic_caption = None
+    if GRAPHIC_DESCRIPTION_FUSED:
+        # categories and caption in one request shared with
+        # content-categoriser
+        description = describe_graphic(
+            llm_client, base64_image, CATEGORISER_RESPONSE_SCHEMA)
+        if description is not None:
+            graphic_caption = description["caption"]
+
+    if graphic_caption is None:
+        graphic_caption = llm_client.chat_completion(
+            prompt=GRAPHIC_CAPTION_PROMPT,
+            image_base64=base64_image,
+            temperature=0.0,
+            canonical_image=True
+        )
 
     if graphic_caption is None:
         logging.error("Failed to receive response from LLM.")
@@ -110,14 +131,27 @@ def categorise():
 @app.route("/health", methods=["GET"])
 def health():
     """
-    Health check endpoint to verify if the service is running
+    Health check endpoint to verify if the service is running.
+    Reports "degraded" while the circuit breaker guarding the LLM backend
+    is not closed, in which case LLM requests fail fast.
     """
+    llm_health = llm_client.health()
+    breaker_closed = llm_health["circuit_breaker"]["state"] == "closed"
     return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "status": "healthy" if breaker_closed else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "llm": llm_health
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    LLM client metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """
@@ -62,24 +62,11 @@ def unique(ar, return_index=False, return_inverse=False, return_counts=False):
 def colorEncode(labelmap, colors, mode='RGB'):
 
     labelmap = labelmap.astype(np.int32)
-    labelmap_rgb = np.zeros(
-        (labelmap.shape[0], labelmap.shape[1], 3), dtype=np.uint8)
+    palette = np.asarray(colors, dtype=np.uint8)
 
-    labels = unique(labelmap)
-    for label in labels:
-        if label < 0:
-            continue
-        labelmap_rgb += (
-            (labelmap == label)[
-                :,
-                :,
-                np.newaxis] *
-            np.tile(
-                colors[label],
-                (labelmap.shape[0],
-                 labelmap.shape[1],
-                 1))).astype(
-            np.uint8)
+    # single palette lookup; negative labels are left black
+    labelmap_rgb = palette[np.clip(labelmap, 0, None)]
+    labelmap_rgb[labelmap < 0] = 0
 
     if mode == 'BGR':
         return labelmap_rgb[:, :, ::-1]
@@ -103,93 +90,78 @@ def visualize_result(pred, index=None):
 
     return pred_color, object_name
 
-# takes the colored segment(determined in visualise_reslt function and
-# compressed the segment to 100 pixels
+# Builds one binary mask per requested class directly from the label map,
+# without going through the color encoding. Returns a uint8 array of shape
+# (len(class_ids), height, width) holding 1 where the pixel is of that class.
 
 
-def findContour(pred_color, width, height):
-    image = pred_color
-    dummy = pred_color.copy()
+def class_masks(pred, class_ids):
+    class_ids = np.asarray(class_ids, dtype=np.intp)
+    num_labels = max(int(pred.max()), int(class_ids.max())) + 1
 
-    gray_image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, thresh = cv2.threshold(gray_image, 10, 255, cv2.THRESH_BINARY)
+    # map every label to its slot in class_ids (-1 for the other classes)
+    lut = np.full(num_labels, -1, dtype=np.int16)
+    lut[class_ids] = np.arange(len(class_ids), dtype=np.int16)
+    slots = lut[pred]
 
-    contours, _ = cv2.findContours(
-        thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+    masks = slots[np.newaxis] == np.arange(
+        len(class_ids), dtype=np.int16)[:, np.newaxis, np.newaxis]
+    return masks.view(np.uint8)
 
-    logging.info("Total contours detected are: {}".format(len(contours)))
+# takes the binary mask of a segment (determined in class_masks function)
+# and computes its contours, normalized to the image dimensions
 
-    cv2.drawContours(image, contours, -1, (0, 255, 0), 2)
 
-    # removes the remaining part of image and keeps the contours of segments
-    logging.info("deleting remainder of the image except the contours")
+def findContour(mask, width, height):
+    contours, _ = cv2.findContours(
+        mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_NONE)
+
+    logging.info("Total contours detected are: {}".format(len(contours)))
 
-    image = image - dummy
+    scale = np.array([width, height], dtype=np.float64)
     centres = []
     area = []
     totArea = 0
     send_contour = []
-    flag = False
 
     # calculate the centre and area of individual contours
     logging.info("computing individual contour metrics")
 
-    for i in range(len(contours)):
-        moments = cv2.moments(contours[i])
+    for contour in contours:
+        moments = cv2.moments(contour)
 
         if moments['m00'] == 0:
             continue
         # if contour area for a given class is very small then omit that
-        if cv2.contourArea(contours[i]) < 2000:
+        area_indi = cv2.contourArea(contour)
+        if area_indi < 2000:
             continue
 
-        totArea = totArea + cv2.contourArea(contours[i])
-        area.append(cv2.contourArea(contours[i]))
-        centres.append(
-            (int(moments['m10'] / moments['m00']),
-             int(moments['m01'] / moments['m00'])))
-
-        area_indi = cv2.contourArea(contours[i])
         centre_indi = (int(moments['m10'] / moments['m00']),
                        int(moments['m01'] / moments['m00']))
-        contour_indi = [list(x) for x in contours[i]]
-        contour_indi = np.squeeze(contour_indi)
+        totArea = totArea + area_indi
+        area.append(area_indi)
+        centres.append(centre_indi)
+
+        contour_indi = (contour.reshape(-1, 2) / scale).tolist()
         centre_down = [centre_indi[0] / width, centre_indi[1] / height]
         area_down = area_indi / (width * height)
 
-        contour_indi = contour_indi.tolist()
-        logging.info("Iterating through individual contours")
-        for j in range(len(contour_indi)):
-            contour_indi[j][0] = float(float(contour_indi[j][0]) / width)
-            contour_indi[j][1] = float(float(contour_indi[j][1]) / height)
-
-        logging.info("End contour iteration ")
         send_contour.append({"coordinates": contour_indi,
                             "centroid": centre_down, "area": area_down})
 
     logging.info("computed all metrics!!")
 
     if not area:
-        flag = True
-    else:
-        max_value = max(area)
-    if flag is True:
         return ([0, 0], [0, 0], 0)
 
     logging.info("generating overall centroid and area")
-    centre1 = centres[area.index(max_value)][0] / width
-    centre2 = centres[area.index(max_value)][1] / height
-    centre = [centre1, centre2]
+    largest = centres[area.index(max(area))]
+    centre = [largest[0] / width, largest[1] / height]
     totArea = totArea / (width * height)
-    result = np.concatenate(contours, dtype=np.float32)
 
     # if contour is very small then delete it
     if totArea < 0.05:
         return ([0, 0], [0, 0], 0)
 
-    result = np.squeeze(result)
-    result = np.swapaxes(result, 0, 1)
-    result[0] = result[0] / float(width)
-    result[1] = result[1] / float(height)
-    # send = np.swapaxes(result, 0, 1).tolist()
     return send_contour, centre, totArea
@@ -18,8 +18,9 @@
 # https://github.com/open-mmlab/mmsegmentation
 
 from flask import Flask, request, jsonify
-import gc
 import base64
+import os
+import threading
 
 import torch
 from mmseg.apis import inference_segmentor, init_segmentor
@@ -27,7 +28,7 @@ import mmseg
 import numpy as np
 import cv2
 
-from mmseg_utils import visualize_result, findContour
+from mmseg_utils import class_masks, findContour
 
 from time import time
 import logging
@@ -47,12 +48,49 @@ configure_logging()
 BEIT_CONFIG = "/app/config/upernet_beit-base_8x2_640x640_160k_ade20k.py"
 BEIT_CHECKPOINT = "/app/upernet_beit-base_8x2_640x640_160k_ade20k-eead221d.pth"
 
+# device the segmentor runs on, e.g. "cuda:0" or "cpu" for testing
+SEGMENTOR_DEVICE = os.environ.get(
+    "SEGMENTOR_DEVICE",
+    "cuda:0" if torch.cuda.is_available() else "cpu"
+)
+# load the segmentor when the worker starts instead of on first use
+PRELOAD_SEGMENTOR = os.environ.get(
+    "PRELOAD_SEGMENTOR", "false").lower() == "true"
+
 # get the color palette used and class names
 COLORS = mmseg.core.evaluation.get_palette("ade20k")
 CLASS_NAMES = mmseg.core.evaluation.get_classes("ade20k")
 
 app = Flask(__name__)
 
+# segmentor is created once per worker and reused across requests
+_segmentor = None
+_segmentor_lock = threading.Lock()
+
+
+def get_segmentor():
+    """Returns the resident segmentor, creating it on first use."""
+    global _segmentor
+    if _segmentor is None:
+        with _segmentor_lock:
+            if _segmentor is None:
+                logging.info(
+                    "Loading segmentor on {}".format(SEGMENTOR_DEVICE))
+                _segmentor = init_segmentor(
+                    BEIT_CONFIG, BEIT_CHECKPOINT, device=SEGMENTOR_DEVICE)
+                logging.info("Model loaded")
+    return _segmentor
+
+
+def segmentor_ready():
+    """True once the segmentor has been loaded in this worker."""
+    return _segmentor is not None
+
+
+def empty_cuda_cache():
+    if SEGMENTOR_DEVICE.startswith("cuda"):
+        torch.cuda.empty_cache()
+
 
 def run_segmentation(url, model, dictionary):
     # convert an image from base64 format
@@ -95,14 +133,17 @@ def run_segmentation(url, model, dictionary):
 
     # extracting contours
     pred = result[0].astype(np.int32)
-    predicted_classes = np.bincount(pred.flatten()).argsort()[::-1]
-    logging.info("main classes detected : {}".format(predicted_classes[:5]))
+    predicted_classes = np.bincount(pred.flatten()).argsort()[::-1][:5]
+    logging.info("main classes detected : {}".format(predicted_classes))
+
+    # binary masks of the top classes, built in one pass over the labels
+    masks = class_masks(pred, predicted_classes)
 
-    for class_id in predicted_classes[:5]:
+    for class_id, mask in zip(predicted_classes, masks):
         logging.info("extracting contours for class: {}".format(str(class_id)))
 
-        pred_color, class_name = visualize_result(pred, index=class_id)
-        contour, center, area = findContour(pred_color, width, height)
+        class_name = CLASS_NAMES[class_id]
+        contour, center, area = findContour(mask, width, height)
 
         logging.info("contour extraction finished")
 
@@ -122,19 +163,8 @@ def run_segmentation(url, model, dictionary):
 @app.route("/preprocessor", methods=["POST", "GET"])
 def segment():
     logging.debug("Received request")
-    gc.collect()
-    torch.cuda.empty_cache()
     dictionary = []
 
-    # load the model
-    try:
-        model = init_segmentor(BEIT_CONFIG, BEIT_CHECKPOINT, device='cuda:0')
-    except RuntimeError as e:
-        if 'out of memory' in str(e):
-            logging.error('CUDA out of memory.')
-            return jsonify({"error": "CUDA out of memory."}), 500
-    logging.info("Model loaded")
-
     # get the request
     request_json = request.get_json()
 
@@ -147,6 +177,16 @@ def segment():
         logging.info("Not image content. Skipping ...")
         return '', 204
 
+    # load the model, or reuse the one already resident in this worker
+    try:
+        model = get_segmentor()
+    except RuntimeError as e:
+        if 'out of memory' in str(e):
+            logging.error('CUDA out of memory.')
+            return jsonify({"error": "CUDA out of memory."}), 500
+        logging.pii(f"Segmentor load error: {e}")
+        return jsonify("Error while loading the segmentation model"), 500
+
     request_uuid = request_json["request_uuid"]
     timestamp = time()
 
@@ -201,7 +241,7 @@ def segment():
             logging.pii(f"Segmentation error: {e}")
             return jsonify("Error while running the segmentation"), 500
 
-    torch.cuda.empty_cache()
+    empty_cuda_cache()
 
     # validate the data format for the output
     ok, _ = validator.check_data(segment)
@@ -233,6 +273,21 @@ def health():
     }), 200
 
 
+@app.route("/ready", methods=["GET"])
+def ready():
+    """Readiness check: only succeeds once the segmentor is loaded"""
+    if not segmentor_ready():
+        return jsonify({
+            "status": "loading",
+            "timestamp": datetime.now().isoformat()
+        }), 503
+    return jsonify({
+        "status": "ready",
+        "device": SEGMENTOR_DEVICE,
+        "timestamp": datetime.now().isoformat()
+    }), 200
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """Warms up the segmentation model by running a dummy inference."""
@@ -240,10 +295,11 @@ def warmup():
         # dummy black image (512×512)
         dummy_img = np.zeros((512, 512, 3), dtype=np.uint8)
 
-        # runs inference_segmentor(): model weight loading/memory allocation
-        model = init_segmentor(BEIT_CONFIG, BEIT_CHECKPOINT, device='cuda:0')
+        # loads the resident segmentor if needed, then runs
+        # inference_segmentor() to allocate memory
+        model = get_segmentor()
         _ = inference_segmentor(model, dummy_img)
-        torch.cuda.empty_cache()
+        empty_cuda_cache()
         return jsonify({
             "status": "warmup successful",
             "timestamp": datetime.now().isoformat()
@@ -257,5 +313,9 @@ def warmup():
         }), 500
 
 
+if PRELOAD_SEGMENTOR:
+    get_segmentor()
+
+
 if __name__ == "__main__":
     app.run(host='0.0.0.0', port=5000, debug=True)
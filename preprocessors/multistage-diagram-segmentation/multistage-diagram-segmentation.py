@@ -16,19 +16,27 @@
 # <https://github.com/Shared-Reality-Lab/IMAGE-server/blob/main/LICENSE>.
 
 import logging
+import os
 import time
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
 from config.logging_utils import configure_logging
 import sys
 from utils.image_processing import decode_and_resize_image
 from utils.llm import (
     LLMClient,
+    render_metrics,
     MULTISTAGE_DIAGRAM_BASE_PROMPT,
     BOUNDING_BOX_PROMPT_TEMPLATE,
     BOUNDING_BOX_PROMPT_EXAMPLE
     )
-from utils.segmentation import SAMClient
+from utils.segmentation import (
+    get_sam_client,
+    DEFAULT_SIMPLIFY_TOLERANCE,
+    DEFAULT_MIN_CONTOUR_AREA,
+    DEFAULT_MAX_POINTS
+    )
 from utils.validation import Validator
 import json
 
@@ -49,20 +57,83 @@ DATA_SCHEMA = './schemas/preprocessors/multistage-diagram.schema.json'
 
 STAGE_SCHEMA = 'stages.schema.json'
 BBOX_SCHEMA = 'bboxes.schema.json'
+# Encode the graphic with SAM while the LLM calls are in flight
+PIPELINE_SAM_ENCODING = os.getenv(
+    "PIPELINE_SAM_ENCODING", "true").lower() == "true"
+# Add per-stage timings to the response, under "debug"
+DEBUG_TIMINGS = os.getenv("DEBUG_TIMINGS", "false").lower() == "true"
+
+# Contour reduction options a request may set in its "segmentation"
+# object: (default, minimum, maximum). The maximum tolerance is the one
+# reduce_contours goes up to when meeting the point budget.
+CONTOUR_OPTIONS = {
+    "simplify_tolerance": (DEFAULT_SIMPLIFY_TOLERANCE, 0.0, 0.02),
+    "min_contour_area": (DEFAULT_MIN_CONTOUR_AREA, 0.0, 1.0),
+    "max_points": (DEFAULT_MAX_POINTS, 3, 20000),
+}
+
 with open(STAGE_SCHEMA, 'r') as f:
     STAGE_RESPONSE_SCHEMA = json.load(f)
 with open(BBOX_SCHEMA, 'r') as f:
     BBOX_RESPONSE_SCHEMA = json.load(f)
 
 try:
-    llm_client = LLMClient()
-    sam_client = SAMClient()
+    llm_client = LLMClient(preprocessor=PREPROCESSOR_NAME)
+    sam_client = get_sam_client()
     validator = Validator(data_schema=DATA_SCHEMA)
     logging.debug("LLM, SAM clients and validator initialized")
 except Exception as e:
     logging.error(f"Failed to initialize clients: {e}")
     sys.exit(1)
 
+# SAM inference is serialized per client, so one thread is enough
+sam_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="sam-encode")
+
+
+def contour_options(content):
+    """
+    Contour reduction arguments of segment_with_boxes, from the optional
+    "segmentation" object of the request, e.g.
+    {"simplify_tolerance": 0.001, "min_contour_area": 0, "max_points": 500}
+    Missing options take their default value.
+
+    Returns:
+        Tuple of (keyword arguments, error message or None)
+    """
+    requested = content.get("segmentation", {})
+    if not isinstance(requested, dict):
+        return None, "segmentation must be an object"
+    unknown = set(requested) - set(CONTOUR_OPTIONS)
+    if unknown:
+        return None, f"Unknown segmentation options: {sorted(unknown)}"
+
+    options = {}
+    for name, (default, minimum, maximum) in CONTOUR_OPTIONS.items():
+        value = requested.get(name, default)
+        integer = isinstance(default, int)
+        if (
+            isinstance(value, bool)
+            or not isinstance(value, int if integer else (int, float))
+            or not minimum <= value <= maximum
+        ):
+            kind = "an integer" if integer else "a number"
+            return None, (
+                f"segmentation.{name} must be {kind} "
+                f"between {minimum} and {maximum}"
+            )
+        options[name] = value
+    return options, None
+
+
+def timed(func, *args, **kwargs):
+    """
+    Call func and return its result with the elapsed time in milliseconds.
+    """
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, round((time.perf_counter() - start) * 1000, 1)
+
 
 @app.route("/preprocessor", methods=['POST'])
 def process_diagram():
@@ -108,18 +179,36 @@ def process_diagram():
             logging.info("Not a multistage diagram. Skipping...")
             return "", 204
 
+    options, error = contour_options(content)
+    if error:
+        logging.info(f"Invalid segmentation options: {error}")
+        return jsonify({"error": error}), 400
+
     request_uuid = content["request_uuid"]
     timestamp = time.time()
 
+    timings = {}
+
     # 2. Resize Base64 Image + create PIL Image
     source = content["graphic"]
-    base64_image, pil_image, error = decode_and_resize_image(source)
+    (base64_image, pil_image, error), timings["decode"] = timed(
+        decode_and_resize_image, source
+    )
     if error:
         return jsonify(error), error["code"]
 
+    # The SAM image embedding does not depend on the LLM output:
+    # compute it in the background while the LLM calls are running
+    encode_future = None
+    if PIPELINE_SAM_ENCODING:
+        encode_future = sam_executor.submit(
+            timed, sam_client.encode_image, pil_image
+        )
+
     try:
         # 3. Get base diagram info
-        base_json = llm_client.chat_completion(
+        base_json, timings["llm_stages"] = timed(
+            llm_client.chat_completion,
             prompt=MULTISTAGE_DIAGRAM_BASE_PROMPT,
             image_base64=base64_image,
             json_schema=STAGE_RESPONSE_SCHEMA,
@@ -156,7 +245,8 @@ def process_diagram():
         bbox_prompt += BOUNDING_BOX_PROMPT_EXAMPLE
 
         # 5. Get Bounding Boxes from LLM
-        bounding_boxes_data = llm_client.chat_completion(
+        bounding_boxes_data, timings["llm_bboxes"] = timed(
+            llm_client.chat_completion,
             prompt=bbox_prompt,
             image_base64=base64_image,
             json_schema=BBOX_RESPONSE_SCHEMA,
@@ -167,14 +257,29 @@ def process_diagram():
         if bounding_boxes_data is None:
             logging.info("Failed to get bounding boxes from LLM.")
 
+        # Join the background SAM encoding; if it failed, the embedding
+        # is computed again by segment_with_boxes
+        embedding = None
+        if encode_future is not None:
+            start = time.perf_counter()
+            try:
+                embedding, timings["sam_encode"] = encode_future.result()
+            except Exception as e:
+                logging.error(f"Background SAM encoding failed: {e}")
+            timings["sam_encode_wait"] = round(
+                (time.perf_counter() - start) * 1000, 1)
+
         # 6.Segment the graphic and return contours
-        final_data_json = sam_client.segment_with_boxes(
+        final_data_json, timings["sam_segment"] = timed(
+            sam_client.segment_with_boxes,
             pil_image,
             bounding_boxes_data,
             use_prompts=True,  # Set to True to enable prompted segmentation
             aggregate_by_label=True,
             return_structured=True,  # Return data in schema-compatible format
-            base_data=base_json
+            base_data=base_json,
+            embedding=embedding,
+            **options
             )
 
         if not final_data_json:
@@ -202,6 +307,9 @@ def process_diagram():
         logging.info(
             f"Successfully processed diagram for request {request_uuid}."
             )
+        logging.debug(f"Stage timings (ms): {timings}")
+        if DEBUG_TIMINGS:
+            response["debug"] = {"timings_ms": timings}
 
         return jsonify(response), 200
 
@@ -215,18 +323,40 @@ def process_diagram():
             {"error": "An unexpected internal server error occurred"}
             ), 500
 
+    finally:
+        # The early returns (LLM failure, no stage labels, errors) do not
+        # wait for the background SAM encoding: cancel it if it is still
+        # queued, so that it does not delay the next request on the
+        # single sam_executor thread. An encoding already running
+        # completes, and its embedding is cached.
+        if encode_future is not None:
+            encode_future.cancel()
+
 
 @app.route("/health", methods=["GET"])
 def health():
     """
-    Health check endpoint to verify if the service is running
+    Health check endpoint to verify if the service is running.
+    Reports "degraded" while the circuit breaker guarding the LLM backend
+    is not closed, in which case LLM requests fail fast.
     """
+    llm_health = llm_client.health()
+    breaker_closed = llm_health["circuit_breaker"]["state"] == "closed"
     return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "status": "healthy" if breaker_closed else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "llm": llm_health
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    LLM client metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """
@@ -17,13 +17,13 @@
 
 import logging
 import time
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from datetime import datetime
 from config.logging_utils import configure_logging
 import sys
 from utils.image_processing import decode_and_resize_image
 from utils.llm import (
-    LLMClient, OBJECT_DETECTION_PROMPT
+    LLMClient, OBJECT_DETECTION_PROMPT, render_metrics
     )
 from utils.validation import Validator
 import json
@@ -36,6 +36,9 @@ logging.debug("Starting Object Detection LLM Preprocessor...")
 app = Flask(__name__)
 
 CONF_THRESHOLD = float(os.environ.get('CONF_THRESHOLD', '0.9'))
+# generation stops once this many objects have been produced
+# (0: no limit, every object the model lists is returned)
+MAX_OBJECTS = int(os.environ.get('MAX_OBJECTS', '0'))
 
 PREPROCESSOR_NAME = \
     "ca.mcgill.a11y.image.preprocessor.objectDetection"
@@ -47,7 +50,7 @@ with open(BBOX_SCHEMA, 'r') as f:
     BBOX_RESPONSE_SCHEMA = json.load(f)
 
 try:
-    llm_client = LLMClient()
+    llm_client = LLMClient(preprocessor=PREPROCESSOR_NAME)
     validator = Validator(data_schema=DATA_SCHEMA)
     logging.debug("LLM client and validator initialized")
 except Exception as e:
@@ -170,13 +173,14 @@ def detect_objects():
     ]
 
     try:
-        # Get object info
-        qwen_output = llm_client.chat_completion(
+        # Get object info, streamed so that generation stops at the end
+        # of the JSON list, or after MAX_OBJECTS objects if set
+        qwen_output = llm_client.chat_completion_json_stream(
             prompt=OBJECT_DETECTION_PROMPT,
             image_base64=base64_image,
             json_schema=BBOX_RESPONSE_SCHEMA,
+            max_items=MAX_OBJECTS or None,
             temperature=0.5,
-            parse_json=True,
             stop=stop_tokens
         )
 
@@ -239,14 +243,27 @@ def detect_objects():
 @app.route("/health", methods=["GET"])
 def health():
     """
-    Health check endpoint to verify if the service is running
+    Health check endpoint to verify if the service is running.
+    Reports "degraded" while the circuit breaker guarding the LLM backend
+    is not closed, in which case LLM requests fail fast.
     """
+    llm_health = llm_client.health()
+    breaker_closed = llm_health["circuit_breaker"]["state"] == "closed"
     return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "status": "healthy" if breaker_closed else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "llm": llm_health
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    LLM client metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """
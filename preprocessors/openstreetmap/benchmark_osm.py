@@ -0,0 +1,472 @@
+"""
+Benchmarks and regression checks of the OpenStreetMap preprocessor.
+
+They run on synthetic cities, a jittered grid of streets sharing their
+intersection nodes with amenity nodes and buildings, and on recorded
+Overpass responses. Both are [out:json] responses of the street and
+amenity queries, so no Overpass server is needed.
+
+Usage (from preprocessors/openstreetmap):
+    python benchmark_osm.py nearest --blocks 10 20 40
+    python benchmark_osm.py parse --fixtures montreal.json --blocks 20 40
+    python benchmark_osm.py geodesy --segments 20000
+    python benchmark_osm.py record --lat 45.5017 --lon -73.5673 \\
+        --distance 300 --output montreal.json
+    git show <commit>:preprocessors/openstreetmap/osm_service.py \\
+        > /tmp/osm_service_reference.py
+    python benchmark_osm.py compare /tmp/osm_service_reference.py \\
+        --fixtures montreal.json --blocks 5 10 20
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", ".."))
+os.environ.setdefault("SERVERS", "http://localhost")
+
+import haversine as hs  # noqa: E402
+import numpy as np  # noqa: E402
+import overpy  # noqa: E402
+import requests  # noqa: E402
+from geographiclib.geodesic import Geodesic  # noqa: E402
+
+import osm_service  # noqa: E402
+from osm_service import (  # noqa: E402
+    allot_intersection,
+    amenities_query,
+    create_bbox_coordinates,
+    enlist_POIs,
+    extract_street,
+    OSM_preprocessor,
+    process_streets_data,
+    streets_query,
+)
+from geodesy import initial_bearings, polyline_lengths  # noqa: E402
+from overpass_reader import read_response  # noqa: E402
+from spatial_index import NodeGrid  # noqa: E402
+
+LAT, LON = 45.5017, -73.5673
+# Distance between two streets, and between two nodes of a street, in m
+BLOCK = 80
+NODE_SPACING = 20
+STREET_TYPES = ["residential", "primary", "secondary", "footway", "service"]
+AMENITIES = ["restaurant", "cafe", "bank", "pharmacy", "bench", "parking"]
+
+
+def make_city(blocks, amenities_per_block=2, seed=0, relations=True):
+    """
+    Synthetic city of blocks x blocks blocks centred on (LAT, LON).
+    Without relations, amenities are only nodes and ways.
+
+    Returns:
+        (street response, amenity response, bbox of the request)
+    """
+    rng = random.Random(seed)
+    # degrees per metre
+    m_lat = 1 / 111_195
+    m_lon = m_lat / math.cos(math.radians(LAT))
+    size = blocks * BLOCK
+    bbox = create_bbox_coordinates(size / 2 * 0.9, LAT, LON)
+
+    def coords(x, y):
+        return (LAT + (y - size / 2) * m_lat + rng.uniform(-1, 1) * m_lat,
+                LON + (x - size / 2) * m_lon + rng.uniform(-1, 1) * m_lon)
+
+    nodes, ways, ids = {}, [], iter(range(1, 10 ** 9))
+    crossings = {}
+
+    def node_at(x, y, tags=None):
+        key = (round(x), round(y))
+        if key not in crossings:
+            lat, lon = coords(x, y)
+            crossings[key] = next(ids)
+            nodes[crossings[key]] = {
+                "type": "node", "id": crossings[key],
+                "lat": round(lat, 7), "lon": round(lon, 7)}
+            if tags:
+                nodes[crossings[key]]["tags"] = tags
+        return crossings[key]
+
+    for i in range(blocks + 1):
+        for vertical in (False, True):
+            street = []
+            for k in range(blocks * BLOCK // NODE_SPACING + 1):
+                t = k * NODE_SPACING
+                x, y = (i * BLOCK, t) if vertical else (t, i * BLOCK)
+                tags = {"highway": "traffic_signals"} \
+                    if t % BLOCK == 0 and rng.random() < 0.2 else None
+                street.append(node_at(x, y, tags))
+            tags = {"highway": rng.choice(STREET_TYPES)}
+            if rng.random() < 0.8:
+                tags["name"] = f"{'Avenue' if vertical else 'Street'} {i}"
+            if rng.random() < 0.3:
+                tags["lanes"] = str(rng.randint(1, 4))
+            if rng.random() < 0.2:
+                tags["oneway"] = "yes"
+            ways.append({"type": "way", "id": next(ids), "nodes": street,
+                         "tags": tags})
+    # closed ways around some blocks (e.g. squares and roundabouts)
+    for i in range(0, blocks, 3):
+        corners = [(i, i), (i + 1, i), (i + 1, i + 1), (i, i + 1), (i, i)]
+        ways.append({
+            "type": "way", "id": next(ids),
+            "nodes": [node_at(x * BLOCK, y * BLOCK) for x, y in corners],
+            "tags": {"highway": "pedestrian", "area": "yes"}})
+    streets = {"version": 0.6, "elements": list(nodes.values()) + ways}
+
+    elements = []
+    for _ in range(blocks * blocks * amenities_per_block):
+        lat, lon = coords(rng.uniform(0, size), rng.uniform(0, size))
+        tags = {"amenity": rng.choice(AMENITIES)}
+        if rng.random() < 0.7:
+            tags["name"] = f"Place {len(elements)}"
+        if rng.random() < 0.05:
+            tags["highway"] = "bus_stop"
+        if rng.random() < 0.05 and relations:
+            elements.append({
+                "type": "relation", "id": next(ids), "members": [],
+                "center": {"lat": round(lat, 7), "lon": round(lon, 7)},
+                "tags": tags})
+        elif rng.random() < 0.3:
+            elements.append({
+                "type": "way", "id": next(ids),
+                "center": {"lat": round(lat, 7), "lon": round(lon, 7)},
+                "tags": dict(tags, building="yes")})
+        else:
+            elements.append({
+                "type": "node", "id": next(ids),
+                "lat": round(lat, 7), "lon": round(lon, 7), "tags": tags})
+    amenities = {"version": 0.6, "elements": elements}
+    return streets, amenities, bbox
+
+
+def overpy_response(text):
+    """An [out:json] response parsed by overpy, as Overpass.query does."""
+    return overpy.Overpass().parse_json(text)
+
+
+def parse_response(service, text):
+    """An [out:json] response parsed as the service does."""
+    # osm_service.py read overpy objects before overpass_reader
+    if hasattr(service, "read_response"):
+        return service.read_response(text)
+    return overpy_response(text)
+
+
+def amenity_list(amenity_text, bbox, service=osm_service):
+    """The amenity records of get_amenities, without the Overpass query."""
+    server_config2 = service.server_config2
+    service.server_config2 = \
+        lambda url, bbox: parse_response(service, amenity_text)
+    try:
+        return service.get_amenities(bbox)
+    finally:
+        service.server_config2 = server_config2
+
+
+def prepare(blocks):
+    """Inputs of OSM_preprocessor for a synthetic city."""
+    streets, amenities, bbox = make_city(blocks)
+    processed = process_streets_data(
+        read_response(json.dumps(streets)), bbox)
+    amenity = amenity_list(json.dumps(amenities), bbox)
+    intersections = extract_street(processed)
+    POIs = enlist_POIs(allot_intersection(processed, intersections), amenity)
+    return processed, POIs, amenity
+
+
+def brute_force_nearest(processed_OSM_data, POIs):
+    """Nearest node ids of the amenities, as computed before NodeGrid."""
+    nearest = []
+    for POI in POIs:
+        if "intersection" in POI:
+            continue
+        minimum_distance = None
+        for street in processed_OSM_data:
+            for node in street["nodes"]:
+                distance = hs.haversine(
+                    (float(node["lat"]), float(node["lon"])),
+                    (float(POI["lat"]), float(POI["lon"])))
+                if minimum_distance is None or distance < minimum_distance:
+                    minimum_distance = distance
+                    reference_id = node["id"]
+        nearest.append(reference_id)
+    return nearest
+
+
+def grid_nearest(processed_OSM_data, POIs):
+    street_nodes = [
+        node for street in processed_OSM_data for node in street["nodes"]]
+    grid = NodeGrid(
+        [(float(node["lat"]), float(node["lon"])) for node in street_nodes])
+    nearest = grid.nearest_many([
+        (float(POI["lat"]), float(POI["lon"]))
+        for POI in POIs if "intersection" not in POI])
+    return [street_nodes[index]["id"] for index in nearest]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, 1000 * (time.perf_counter() - start)
+
+
+def run_nearest(block_counts):
+    print(f"{'blocks':>6} {'nodes':>7} {'POIs':>6} {'brute force':>12} "
+          f"{'grid':>8} {'OSM_preprocessor':>17}  (ms)")
+    for blocks in block_counts:
+        processed, POIs, amenity = prepare(blocks)
+        expected, brute_ms = timed(brute_force_nearest, processed, POIs)
+        nearest, grid_ms = timed(grid_nearest, processed, POIs)
+        assert nearest == expected, "grid and brute force disagree"
+        _, total_ms = timed(OSM_preprocessor, processed, POIs, amenity)
+        node_count = sum(len(street["nodes"]) for street in processed)
+        print(f"{blocks:>6} {node_count:>7} {len(nearest):>6} "
+              f"{brute_ms:>12.1f} {grid_ms:>8.1f} {total_ms:>17.1f}")
+
+
+def run_geodesy(segment_count, seed=0):
+    """
+    Bearings and lengths of random street segments (1 m to 10 km)
+    by geodesy.py, against geographiclib and hs.haversine one segment
+    at a time: largest differences and durations.
+    """
+    rng = random.Random(seed)
+    starts = [(rng.uniform(-80, 80), rng.uniform(-179, 179))
+              for _ in range(segment_count)]
+    # from 1 m to 10 km, in any direction
+    ends = []
+    for lat, lon in starts:
+        span = 10 ** rng.uniform(-5, -1)
+        direction = rng.uniform(0, 2 * math.pi)
+        ends.append((lat + span * math.cos(direction),
+                     lon + span * math.sin(direction)
+                     / math.cos(math.radians(lat))))
+    lat1, lon1 = zip(*starts)
+    lat2, lon2 = zip(*ends)
+
+    expected, geographiclib_ms = timed(lambda: [
+        Geodesic.WGS84.Inverse(*a, *b)["azi1"] for a, b in zip(starts, ends)])
+    bearings, numpy_ms = timed(initial_bearings, lat1, lon1, lat2, lon2)
+    error = np.abs((bearings - np.array(expected) + 180) % 360 - 180).max()
+    print(f"bearings: largest difference {error:.1e} degrees, "
+          f"{geographiclib_ms:.1f} ms -> {numpy_ms:.1f} ms")
+
+    # segments as polylines of two points
+    expected, haversine_ms = timed(lambda: [
+        hs.haversine(a, b) * 1000 for a, b in zip(starts, ends)])
+    lengths, numpy_ms = timed(
+        polyline_lengths, [lat for start, end in zip(lat1, lat2)
+                           for lat in (start, end)],
+        [lon for start, end in zip(lon1, lon2) for lon in (start, end)],
+        [2] * segment_count)
+    error = max(abs(length - e) / e for length, e in zip(lengths, expected))
+    print(f"lengths: largest relative difference {error:.1e}, "
+          f"{haversine_ms:.1f} ms -> {numpy_ms:.1f} ms")
+
+
+def record(lat, lon, distance, server, output):
+    """Record the Overpass responses of a request, as a fixture."""
+    bbox = create_bbox_coordinates(distance, lat, lon)
+    fixture = {"bbox": bbox}
+    for name, query in (("streets", streets_query(bbox)),
+                        ("amenities", amenities_query(bbox))):
+        response = requests.post(
+            server, data={"data": "[out:json];" + query}, timeout=180)
+        response.raise_for_status()
+        fixture[name] = response.json()
+    with open(output, "w") as f:
+        json.dump(fixture, f)
+
+
+def record_city(blocks, relations, output):
+    """Record a synthetic city, as a fixture."""
+    streets, amenities, bbox = make_city(blocks, relations=relations)
+    with open(output, "w") as f:
+        json.dump({"bbox": bbox, "streets": streets, "amenities": amenities},
+                  f)
+
+
+def expect(reference_path, fixture_path, output):
+    """
+    Save the output of every stage of a reference implementation of
+    osm_service.py on a fixture, as expected by the regression tests.
+    """
+    with open(fixture_path) as f:
+        fixture = json.load(f)
+    stages = run_pipeline(load_reference(reference_path), fixture)
+    with open(output, "w") as f:
+        json.dump({stage: result for stage, (result, _) in stages.items()},
+                  f, indent=1)
+
+
+def load_reference(reference_path):
+    spec = importlib.util.spec_from_file_location(
+        "osm_service_reference", reference_path)
+    reference = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(reference)
+    return reference
+
+
+def load_fixtures(paths, block_counts):
+    """(name, fixture) of the recorded fixtures and synthetic cities."""
+    for path in paths:
+        with open(path) as f:
+            yield os.path.basename(path), json.load(f)
+    for blocks in block_counts:
+        streets, amenities, bbox = make_city(blocks)
+        yield f"city-{blocks}", {
+            "bbox": bbox, "streets": streets, "amenities": amenities}
+
+
+def run_pipeline(service, fixture):
+    """
+    Outputs and durations (ms) of every stage of a request. The parsing
+    of the responses is part of process_streets_data and get_amenities.
+    """
+    bbox = fixture["bbox"]
+    streets_text = json.dumps(fixture["streets"])
+    stages = {}
+    stages["process_streets_data"] = timed(
+        lambda: service.process_streets_data(
+            parse_response(service, streets_text), bbox))
+    processed = stages["process_streets_data"][0]
+    stages["get_amenities"] = timed(
+        amenity_list, json.dumps(fixture["amenities"]), bbox, service)
+    amenity = stages["get_amenities"][0]
+    stages["extract_street"] = timed(service.extract_street, processed)
+    stages["allot_intersection"] = timed(
+        service.allot_intersection, processed, stages["extract_street"][0])
+    stages["enlist_POIs"] = timed(
+        service.enlist_POIs, stages["allot_intersection"][0], amenity)
+    POIs = stages["enlist_POIs"][0]
+    stages["OSM_preprocessor"] = timed(
+        service.OSM_preprocessor, processed, POIs, amenity)
+    return stages
+
+
+def parsed(parse, text):
+    """Duration (ms) of a parse, and memory (MB) held by its result."""
+    _, duration = timed(parse, text)
+    tracemalloc.start()
+    result = parse(text)
+    size = tracemalloc.get_traced_memory()[0] / 2 ** 20
+    tracemalloc.stop()
+    del result
+    return duration, size
+
+
+def run_parse(fixture_paths, block_counts):
+    print(f"{'response':<24} {'elements':>8} {'overpy':>9} {'reader':>9} "
+          f"{'overpy':>9} {'reader':>9}")
+    for name, fixture in load_fixtures(fixture_paths, block_counts):
+        for query in ("streets", "amenities"):
+            text = json.dumps(fixture[query])
+            overpy_ms, overpy_mb = parsed(overpy_response, text)
+            reader_ms, reader_mb = parsed(read_response, text)
+            print(f"{name + ' ' + query:<24} "
+                  f"{len(fixture[query]['elements']):>8} "
+                  f"{overpy_ms:>6.1f} ms {reader_ms:>6.1f} ms "
+                  f"{overpy_mb:>6.1f} MB {reader_mb:>6.1f} MB")
+
+
+def equal(actual, expected, tolerance=0):
+    """Equality of outputs, with floats within tolerance of each other."""
+    if isinstance(actual, float) and isinstance(expected, float):
+        return abs(actual - expected) <= tolerance
+    if isinstance(actual, dict) and isinstance(expected, dict):
+        return actual.keys() == expected.keys() and all(
+            equal(actual[key], expected[key], tolerance) for key in actual)
+    if isinstance(actual, list) and isinstance(expected, list):
+        return len(actual) == len(expected) and all(
+            equal(a, e, tolerance) for a, e in zip(actual, expected))
+    return actual == expected
+
+
+def run_compare(reference_path, fixture_paths, block_counts, tolerance=0):
+    """
+    Compare the output of every stage with a reference implementation
+    of osm_service.py (e.g. a previous commit), on each fixture. Floats
+    (i.e. coordinates and lengths) may differ by up to tolerance.
+    """
+    reference = load_reference(reference_path)
+    failures = 0
+    for name, fixture in load_fixtures(fixture_paths, block_counts):
+        expected = run_pipeline(reference, fixture)
+        actual = run_pipeline(osm_service, fixture)
+        print(name)
+        for stage, (output, duration) in actual.items():
+            same = equal(output, expected[stage][0], tolerance)
+            failures += not same
+            print(f"  {stage:<22} {'same' if same else 'DIFFERENT':<10}"
+                  f"{expected[stage][1]:>10.1f} ms -> {duration:>8.1f} ms")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    nearest_parser = subparsers.add_parser(
+        "nearest", help="nearest street node of every amenity")
+    nearest_parser.add_argument(
+        "--blocks", type=int, nargs="+", default=[10, 20, 40])
+    parse_parser = subparsers.add_parser(
+        "parse", help="parsing of the Overpass responses, overpy or reader")
+    parse_parser.add_argument("--fixtures", nargs="*", default=[])
+    parse_parser.add_argument(
+        "--blocks", type=int, nargs="*", default=[10, 20, 40])
+    geodesy_parser = subparsers.add_parser(
+        "geodesy", help="bearings and lengths, geodesy.py or per segment")
+    geodesy_parser.add_argument("--segments", type=int, default=20000)
+    record_parser = subparsers.add_parser(
+        "record", help="record the Overpass responses of a request")
+    record_parser.add_argument("--lat", type=float, default=LAT)
+    record_parser.add_argument("--lon", type=float, default=LON)
+    record_parser.add_argument("--distance", type=float, default=100)
+    record_parser.add_argument("--server", default=osm_service.SERVERS[0])
+    record_parser.add_argument(
+        "--blocks", type=int,
+        help="record a synthetic city instead of querying a server")
+    record_parser.add_argument(
+        "--no-relations", action="store_true",
+        help="synthetic city without relations")
+    record_parser.add_argument("--output", required=True)
+    expect_parser = subparsers.add_parser(
+        "expect", help="save the output of a reference osm_service.py")
+    expect_parser.add_argument("reference")
+    expect_parser.add_argument("fixture")
+    expect_parser.add_argument("--output", required=True)
+    compare_parser = subparsers.add_parser(
+        "compare", help="compare every stage with a reference osm_service.py")
+    compare_parser.add_argument("reference")
+    compare_parser.add_argument("--fixtures", nargs="*", default=[])
+    compare_parser.add_argument(
+        "--blocks", type=int, nargs="*", default=[5, 10, 20])
+    compare_parser.add_argument("--tolerance", type=float, default=0)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    if args.benchmark == "nearest":
+        run_nearest(args.blocks)
+    elif args.benchmark == "parse":
+        run_parse(args.fixtures, args.blocks)
+    elif args.benchmark == "geodesy":
+        run_geodesy(args.segments)
+    elif args.benchmark == "record" and args.blocks:
+        record_city(args.blocks, not args.no_relations, args.output)
+    elif args.benchmark == "record":
+        record(args.lat, args.lon, args.distance, args.server, args.output)
+    elif args.benchmark == "expect":
+        expect(args.reference, args.fixture, args.output)
+    elif args.benchmark == "compare":
+        sys.exit(1 if run_compare(
+            args.reference, args.fixtures, args.blocks,
+            args.tolerance) else 0)
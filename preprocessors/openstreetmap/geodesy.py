@@ -0,0 +1,132 @@
+import haversine as hs
+import numpy as np
+
+# Flattening of the WGS84 ellipsoid, as used by geographiclib's
+# Geodesic.WGS84
+WGS84_F = 1 / 298.257223563
+# Convergence of the longitude on the auxiliary sphere, in radians
+VINCENTY_TOLERANCE = 1e-12
+VINCENTY_MAX_ITERATIONS = 50
+
+
+def segment_lengths(lats, lons):
+    """
+    Lengths in metres of the segments between consecutive points, by
+    the haversine distance of the haversine package (its NumPy kernel,
+    equal to hs.haversine up to rounding).
+    """
+    points = np.column_stack((
+        np.asarray(lats, dtype=float), np.asarray(lons, dtype=float)))
+    if len(points) < 2:
+        return np.zeros(0)
+    return hs.haversine_vector(points[:-1], points[1:]) * 1000
+
+
+def polyline_lengths(lats, lons, counts):
+    """
+    Lengths in metres of polylines stored end to end in lats and lons,
+    with counts[k] points in polyline k. The segments of all the
+    polylines are computed at once, and summed in order for each
+    polyline, as a loop over hs.haversine would.
+    """
+    segments = segment_lengths(lats, lons).tolist()
+    lengths = []
+    start = 0
+    for count in counts:
+        # the segment from the last point to the next polyline is left out
+        lengths.append(sum(segments[start:start + count - 1]))
+        start += count
+    return lengths
+
+
+def initial_bearings(lat1, lon1, lat2, lon2):
+    """
+    Azimuths in degrees, clockwise from north in [-180, 180], of the
+    WGS84 geodesics from (lat1, lon1) to (lat2, lon2). They are solved
+    by Vincenty's inverse formula, and agree with geographiclib's
+    Geodesic.WGS84.Inverse(...)["azi1"] within 1e-6 degrees for
+    segments of 1 m or more (180 for coincident points, as
+    geographiclib). Nearly antipodal points, where Vincenty's formula
+    does not converge, are out of scope.
+    """
+    lat1, lon1, lat2, lon2 = (
+        np.asarray(value, dtype=float) for value in (lat1, lon1, lat2, lon2))
+    # in degrees first, for the precision of short segments
+    longitude = np.radians(np.remainder(lon2 - lon1 + 180, 360) - 180)
+    lat1, lat2 = np.radians(lat1), np.radians(lat2)
+    # reduced latitudes
+    u1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    u2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(u1), np.cos(u1)
+    sin_u2, cos_u2 = np.sin(u2), np.cos(u2)
+    sin_u2_u1 = np.sin(u2 - u1)
+
+    def northing(lam):
+        # cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos(lam), without the
+        # cancellation of its terms on short segments
+        return sin_u2_u1 + 2 * sin_u1 * cos_u2 * np.sin(lam / 2) ** 2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lam = longitude
+        for _ in range(VINCENTY_MAX_ITERATIONS):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, northing(lam))
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(
+                sin_sigma == 0, 0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # zero on the equator
+            cos_2sigma_m = np.where(
+                cos2_alpha == 0, 0,
+                cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = WGS84_F / 16 * cos2_alpha * (
+                4 + WGS84_F * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = longitude + (1 - c) * WGS84_F * sin_alpha * (
+                sigma + c * sin_sigma * (
+                    cos_2sigma_m
+                    + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            if np.all(np.abs(lam - previous) <= VINCENTY_TOLERANCE):
+                break
+
+    azimuths = np.degrees(np.arctan2(cos_u2 * np.sin(lam), northing(lam)))
+    coincident = (lat1 == lat2) & (longitude == 0)
+    return np.where(coincident, 180.0, azimuths)
+
+
+def boundary_nodes(lat1, lon1, lat2, lon2, bbox_coordinates):
+    """
+    Nodes where the segments from (lat1, lon1), within the bounding
+    box, towards (lat2, lon2) leave it: (lats, lons).
+
+    The side of the bounding box is chosen by the bearing of the
+    segment: the top (or bottom) side first, then the right (or left)
+    side if the node is not on the bounding box. The node is placed on
+    the side along the bearing, on a local equirectangular projection.
+    With bearings from initial_bearings, the nodes are within 1e-9
+    degrees (about 0.1 mm) of the per-node computation with
+    geographiclib, for segments of up to 10 km.
+    """
+    lat_min, lon_min, lat_max, lon_max = bbox_coordinates[:4]
+    lat1 = np.asarray(lat1, dtype=float)
+    lon1 = np.asarray(lon1, dtype=float)
+    angles = initial_bearings(lat1, lon1, lat2, lon2)
+    angles = np.where(angles < 0, angles + 360, angles)
+    tan_angles = np.tan(np.radians(angles))
+    cos_lat1 = np.cos(np.radians(lat1))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Bearings in [0, 90) and [270, 360] go through the top side or,
+        # failing that, through the right and left sides respectively.
+        # Bearings in [90, 270) go through the bottom side or, failing
+        # that, through the right and left sides respectively.
+        side_lats = np.where(
+            (angles < 90) | (angles >= 270), lat_max, lat_min)
+        side_lons = tan_angles * (side_lats - lat1) / cos_lat1 + lon1
+        on_side = ((side_lats >= lat_min) & (side_lats <= lat_max)
+                   & (side_lons >= lon_min) & (side_lons <= lon_max))
+        other_lons = np.where(angles < 180, lon_max, lon_min)
+        other_lats = (other_lons - lon1) * cos_lat1 / tan_angles + lat1
+    return (np.where(on_side, side_lats, other_lats),
+            np.where(on_side, side_lons, other_lons))
@@ -1,5 +1,6 @@
 from flask import Flask, jsonify, request
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from osm_service import (
     get_streets,
@@ -27,6 +28,9 @@ VALIDATOR = Validator(
     data_schema='./schemas/preprocessors/openstreetmap.schema.json'
 )
 
+# Runs the street and amenity queries of a request concurrently
+fetch_executor = ThreadPoolExecutor(max_workers=2)
+
 
 @app.route('/preprocessor', methods=['POST', ])
 def get_map_data():
@@ -76,8 +80,10 @@ def get_map_data():
             "max": bbox_coordinates[3]
         }
     }
-    OSM_data = get_streets(bbox_coordinates)
+    # The two queries are independent: send them together
+    streets_future = fetch_executor.submit(get_streets, bbox_coordinates)
     amenity = get_amenities(bbox_coordinates)
+    OSM_data = streets_future.result()
 
     # initialize empty response
     response = {
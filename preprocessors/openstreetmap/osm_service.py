@@ -1,17 +1,21 @@
-import overpy
-from copy import deepcopy
-import haversine as hs
+import json
 from math import radians, degrees, cos
 from datetime import datetime
 from flask import jsonify
 import jsonschema
 import logging
-import math
 import os
 import requests
-from geographiclib.geodesic import Geodesic
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import traceback
 from config.logging_utils import configure_logging
+from overpass_reader import (
+    OverpassError, check_remark, read_elements, read_response)
+from geodesy import boundary_nodes, polyline_lengths
+from spatial_index import NodeGrid
+from tile_cache import tile_bbox, tile_cache_from_env, tiles, OSM_TILE_SIZE
 
 configure_logging()
 
@@ -26,6 +30,25 @@ LOGGER = logging.getLogger(__name__)
 LOGGER.setLevel(logging.DEBUG)
 
 SERVERS = os.environ['SERVERS'].split(",")
+# Seconds before also querying the next server, while waiting for one
+# (0 disables hedging: the next server is only queried after a failure).
+# Off by default: each hedged query is sent to two public servers.
+OSM_HEDGE_DELAY = float(os.environ.get('OSM_HEDGE_DELAY', '0'))
+# Seconds during which a server that failed is queried after the others
+OSM_SERVER_PENALTY = float(os.environ.get('OSM_SERVER_PENALTY', '300'))
+# Timeout of the queries sent by the tile cache, in seconds
+OSM_QUERY_TIMEOUT = float(os.environ.get('OSM_QUERY_TIMEOUT', '60'))
+
+# Queries in flight, including those that lost a hedged race
+SERVER_EXECUTOR = ThreadPoolExecutor(max_workers=4 * len(SERVERS))
+# Time of the last failure of the servers, by url
+server_failures = {}
+server_failures_lock = threading.Lock()
+
+# Overpass responses by tile (None if disabled)
+TILE_CACHE = tile_cache_from_env()
+# Order of the element types in Overpass responses
+ELEMENT_ORDER = {"node": 0, "way": 1, "relation": 2}
 
 
 def create_bbox_coordinates(distance, lat, lon):
@@ -51,34 +74,22 @@ def create_bbox_coordinates(distance, lat, lon):
     return bbox_coordinates
 
 
-def server_config1(url, bbox_coord):
-    # Get street data from the
-    # specified url.
-
+def streets_query(bbox_coord):
+    # Overpass query of the streets (ways) and their nodes
     lat_min, lon_min = bbox_coord[0], bbox_coord[1]
     lat_max, lon_max = bbox_coord[2], bbox_coord[3]
-    """ fetch all ways and nodes """
-
-    api = overpy.Overpass(url=url)
-    street_data = api.query(
-        f"""
+    return f"""
     way({lat_min},{lon_min},{lat_max},{lon_max})[highway];
     (._;>;);
     out body;
     """
-    )
-    return street_data
-
 
-def server_config2(url, bbox_coord):
-    # Get amenities from
-    # the specified url.
 
+def amenities_query(bbox_coord):
+    # Overpass query of the amenities and buildings
     lat_min, lon_min = bbox_coord[0], bbox_coord[1]
     lat_max, lon_max = bbox_coord[2], bbox_coord[3]
-    api = overpy.Overpass(url=url)
-    street_amenities = api.query(
-        f"""
+    return f"""
     (node({lat_min},{lon_min},{lat_max},{lon_max}) ["amenity"];
     way({lat_min},{lon_min},{lat_max},{lon_max}) ["amenity"];
     rel({lat_min},{lon_min},{lat_max},{lon_max}) ["amenity"];
@@ -86,28 +97,163 @@ def server_config2(url, bbox_coord):
     );
     out center;
     """
-    )
-    return street_amenities
+
+
+def fetch_json(url, query):
+    # Send a query to the specified url, and return the JSON response
+    # if it has no error
+    response = requests.post(
+        url, data=f"[out:json];{query}".encode("utf-8"),
+        timeout=OSM_QUERY_TIMEOUT)
+    response.raise_for_status()
+    check_remark(response.text)
+    return response.text
+
+
+def tiles_query(query, tile_list):
+    # Overpass query of several tiles at once: the output of each tile
+    # is followed by a derived "tile" element holding its position
+    return "".join(
+        f"{query(tile_bbox(tile))}"
+        f"make tile position=\"{tile[0]}:{tile[1]}\";\nout;\n"
+        for tile in tile_list)
+
+
+def split_tiles(text, tile_list):
+    # Elements of each tile in the response to tiles_query
+    tile_elements = {}
+    elements = []
+    for element in json.loads(text)["elements"]:
+        if element["type"] == "tile":
+            tile_elements[element["tags"]["position"]] = elements
+            elements = []
+        else:
+            elements.append(element)
+    missing = [
+        tile for tile in tile_list
+        if f"{tile[0]}:{tile[1]}" not in tile_elements]
+    if missing:
+        raise OverpassError(f"Incomplete response, missing tiles {missing}")
+    return [tile_elements[f"{tile[0]}:{tile[1]}"] for tile in tile_list]
+
+
+def query_tiles(url, bbox_coord, query):
+    # Run a query over the tiles covering the bounding box, from the
+    # tile cache or the specified url, and merge their elements.
+    # The tiles that are not cached are fetched in a single query.
+    # Elements outside the bounding box are filtered out by the
+    # processing, as elements of the query over the bounding box
+    # that are outside of it are.
+    elements = {}
+
+    def merge(tile_elements):
+        for element in tile_elements:
+            elements.setdefault((element["type"], element["id"]), element)
+
+    missing = []
+    for tile in tiles(bbox_coord):
+        key = f"{query.__name__}:{OSM_TILE_SIZE}:{tile[0]}:{tile[1]}"
+        text = TILE_CACHE.get(key)
+        if text is None:
+            missing.append((tile, key))
+        else:
+            # Parsed for every request: the processing modifies the tags
+            merge(json.loads(text)["elements"])
+    if missing:
+        tile_list = [tile for tile, _ in missing]
+        text = fetch_json(url, tiles_query(query, tile_list))
+        for (_, key), tile_elements in zip(
+                missing, split_tiles(text, tile_list)):
+            TILE_CACHE.set(key, json.dumps({"elements": tile_elements}))
+            merge(tile_elements)
+    # Sort the elements as Overpass does
+    return read_elements(sorted(
+        elements.values(),
+        key=lambda element: (
+            ELEMENT_ORDER.get(element["type"], 3), element["id"])
+    ))
+
+
+def server_config1(url, bbox_coord):
+    # Get street data from the
+    # specified url.
+    if TILE_CACHE is not None:
+        return query_tiles(url, bbox_coord, streets_query)
+    return read_response(fetch_json(url, streets_query(bbox_coord)))
+
+
+def server_config2(url, bbox_coord):
+    # Get amenities from
+    # the specified url.
+    if TILE_CACHE is not None:
+        return query_tiles(url, bbox_coord, amenities_query)
+    return read_response(fetch_json(url, amenities_query(bbox_coord)))
+
+
+def ordered_servers():
+    # Servers that failed recently are tried last
+    now = time.time()
+    with server_failures_lock:
+        failing = {
+            url for url, failed in server_failures.items()
+            if now - failed < OSM_SERVER_PENALTY}
+    return ([url for url in SERVERS if url not in failing]
+            + [url for url in SERVERS if url in failing])
+
+
+def record_server_outcome(url, future):
+    # Remember the servers that fail, including those whose answer
+    # is no longer awaited
+    with server_failures_lock:
+        if future.exception() is None:
+            server_failures.pop(url, None)
+        else:
+            server_failures[url] = time.time()
+
+
+def query_servers(server_config, bbox_coord):
+    # Send a query to the servers, with hedged failover: the next server
+    # is also queried if the current ones fail or have not answered
+    # after OSM_HEDGE_DELAY seconds. The first answer is returned.
+    servers = ordered_servers()
+    pending = {}
+
+    def query_next_server():
+        url = servers.pop(0)
+        future = SERVER_EXECUTOR.submit(server_config, url, bbox_coord)
+        future.add_done_callback(
+            lambda future: record_server_outcome(url, future))
+        pending[future] = url
+
+    query_next_server()
+    while pending:
+        done, _ = wait(
+            pending,
+            timeout=OSM_HEDGE_DELAY
+            if servers and OSM_HEDGE_DELAY > 0 else None,
+            return_when=FIRST_COMPLETED)
+        if not done:
+            LOGGER.debug(
+                f"{', '.join(pending.values())} not responding yet, "
+                f"so also connecting to {servers[0]}")
+            query_next_server()
+            continue
+        for future in done:
+            url = pending.pop(future)
+            if future.exception() is None:
+                return future.result()
+            error = f"{url} not responding ({str(future.exception())})"
+            if servers:
+                error += f", so connecting to {servers[0]}"
+                query_next_server()
+            LOGGER.debug(error)
+    LOGGER.debug("Unable to get data. All servers down!")
+    return None
 
 
 def get_streets(bbox_coord):
     """ fetch all ways and nodes """
-    # loop through all provided servers
-    for i in range(len(SERVERS)):
-        try:
-            OSM_data = server_config1(SERVERS[i], bbox_coord)
-            break
-        except Exception as e:
-            if (i+1) < len(SERVERS):
-                error = error = (
-                        f"{SERVERS[i]} not responding ({str(e)}), "
-                        f"so connecting to {SERVERS[i+1]}")
-            else:
-                error = (f"{SERVERS[i]} not responding ({str(e)}). "
-                         "Unable to get data. All servers down!")
-                OSM_data = None
-            LOGGER.debug(error)
-    return (OSM_data)
+    return query_servers(server_config1, bbox_coord)
 
 
 def get_timestamp():
@@ -120,42 +266,41 @@ def process_streets_data(OSM_data, bbox_coordinates):
     """Retrieve inteterested street information from the requested OSM data"""
     try:
         processed_OSM_data = []
+        # Segments of the streets leaving the bounding box
+        crossings = []
         lat_min = bbox_coordinates[0]
         lat_max = bbox_coordinates[2]
         lon_min = bbox_coordinates[1]
         lon_max = bbox_coordinates[3]
         for way in OSM_data.ways:
-            # List contains only nodes of a street within the bounding box.
-            bounded_nodes = []
-            # List contains all the nodes of a street (i.e., no boundary
-            # restriction).
-            unbounded_nodes = []
+            # Nodes of a street within the bounding box, by id, in order.
+            bounded_nodes = {}
+            # All the nodes of a street (i.e., no boundary restriction),
+            # by id, in order.
+            unbounded_nodes = {}
             for node in way.nodes:
                 # Extract all nodes of a street.
                 node_object = {
-                    "id": int(node.id),
-                    "lat": float(node.lat),
-                    "lon": float(node.lon),
+                    "id": node.id,
+                    "lat": node.lat,
+                    "lon": node.lon,
                 }
                 # Include tags for a street node if available
                 node_object.update(node.tags)
-                if node_object not in unbounded_nodes:
-                    unbounded_nodes.append(node_object)
+                unbounded_nodes.setdefault(node_object["id"], node_object)
                 # Apply the boundary conditions to extract only nodes
                 # of a street that are within the bounding box.
                 if node.lat >= lat_min and node.lat <= lat_max:
                     if node.lon >= lon_min and node.lon <= lon_max:
-                        if node_object not in bounded_nodes:
-                            bounded_nodes.append(node_object)
-            # After the boundary restrictions are applied, it is
-            # possible that the list containing the bounded_nodes of
-            # a street may no longer have enough points
-            # (nodes) to represent the street shape.
-            # This is addressed by the function "get_new_nodes",
-            # which creates more possible points for the path
-            # within the boundary conditions.
-            node_list = get_new_nodes(
-                bounded_nodes, unbounded_nodes, bbox_coordinates)
+                        bounded_nodes.setdefault(
+                            node_object["id"], node_object)
+            # The nodes where the street leaves the bounding box are
+            # added to node_list by "add_boundary_nodes", for all the
+            # streets at once.
+            node_list = list(bounded_nodes.values())
+            for inside, outside, at_end in boundary_segments(
+                    bounded_nodes, unbounded_nodes):
+                crossings.append((node_list, inside, outside, at_end))
             # Check if the "bounded_nodes" for a street/way is not empty.
             # Otherwise all its nodes might have fallen outside the boundary.
             if node_list:
@@ -168,7 +313,7 @@ def process_streets_data(OSM_data, bbox_coordinates):
                 if oneway is not None:
                     oneway = bool(oneway)
                 way_object = {
-                    "street_id": int(way.id),
+                    "street_id": way.id,
                     "street_name": way.tags.get("name"),
                     "street_type": way.tags.get("highway"),
                     "oneway": oneway,
@@ -176,11 +321,14 @@ def process_streets_data(OSM_data, bbox_coordinates):
                 }
                 # Delete key if value is empty
                 way_object = dict(x for x in way_object.items() if all(x))
+                # The street as first added, if it was
+                added_way_object = None
                 if "street_id" in way_object and (
                                                   "street_name" in way_object
                                                   or
                                                   "street_type" in way_object):
                     processed_OSM_data.append(way_object)
+                    added_way_object = way_object
 
                 # Remove name, highway, lanes, and oneway tags from the tag
                 # list
@@ -195,13 +343,16 @@ def process_streets_data(OSM_data, bbox_coordinates):
                 way_object["nodes"] = node_list
                 # Delete key if value is empty
                 way_object = dict(x for x in way_object.items() if all(x))
-                if (way_object not in processed_OSM_data and
+                # Other streets have other ids: only the street as first
+                # added can be the same
+                if (way_object != added_way_object and
                     "street_id" in way_object and (
                                                    "street_name" in way_object
                                                    or
                                                    "street_type"
                                                    in way_object)):
                     processed_OSM_data.append(way_object)
+        add_boundary_nodes(crossings, bbox_coordinates)
     except AttributeError:
         error = 'Overpass Attibute error. Retry again'
         LOGGER.debug(error)
@@ -210,470 +361,203 @@ def process_streets_data(OSM_data, bbox_coordinates):
         return processed_OSM_data
 
 
-def get_new_nodes(bounded_nodes, unbounded_nodes, bbox_coordinates):
-    # Bounded_nodes is a list of only nodes of a street that fall within
-    # the bounding box.
-    # Unbounded_nodes is a list of all the nodes of a street.
-    number_of_nodes_in_bounded_nodes = len(bounded_nodes)
-    number_of_nodes_in_unbounded_nodes = len(unbounded_nodes)
-    if bounded_nodes:
-        if (number_of_nodes_in_bounded_nodes > 0 and
-                number_of_nodes_in_unbounded_nodes >
-                number_of_nodes_in_bounded_nodes):
-            # Set "there_is_a_succeding_node" flag variable to True.
-            there_is_a_succeeding_node = True
-            if number_of_nodes_in_bounded_nodes == 1:
-                # The condition above is true when the
-                # "bounded" list has just a node element.
-
-                # Variable index gives the position of this node in
-                # the unbounded_nodes.
-                index = unbounded_nodes.index(bounded_nodes[0])
-                if (index < number_of_nodes_in_unbounded_nodes - 1 and
-                        index > 0):
-                    # The above condition is true for
-                    # a node element that has both the succeeding
-                    # and preceding nodes.
-                    # So, estimate a value for the succeeding node.
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-                    # Set "there_is_a_succeeding_node" flag to False
-                    # to estimate a value for the preceding node.
-                    there_is_a_succeeding_node = False
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-                elif index < number_of_nodes_in_unbounded_nodes - 1:
-                    # This above condition holds if
-                    # a node element has just the succeeding node.
-                    # Estimate a value for the succeeding node.
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-                else:
-                    # This holds if the node has only a
-                    # preceding node. So, set "there_is_a_succeeding_node"
-                    # flag variable to False to get the preceding node.
-                    there_is_a_succeeding_node = False
-                    # So, estimate value for the preceding node.
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-
-            elif number_of_nodes_in_bounded_nodes > 1:
-                # This is the case when the " bounded" list has
-                # more than one node element.
-                # Here we will only consider only the
-                # last and the first node element of
-                # the list.
-                # Variable index gives the position of the last node element of
-                # the "bounded" in the "unbounded" list.
-                index = unbounded_nodes.index(
-                    bounded_nodes[number_of_nodes_in_bounded_nodes - 1])
-                if index < number_of_nodes_in_unbounded_nodes - \
-                        1:
-                    # If true, there is a succeeding node.
-                    # Estimate a value for a succeeding node.
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-                # Variable index gives the position of the first node element
-                # of the "bounded" in the "unbounded" list.
-                index = unbounded_nodes.index(bounded_nodes[0])
-                if index > 0:
-                    # If the above condition holds true,
-                    # then the node has a preceding node. So, estimate a value
-                    # for the preceding node.
-                    there_is_a_succeeding_node = False
-                    bounded_nodes = add_new_node(
-                        there_is_a_succeeding_node, index, bounded_nodes,
-                        unbounded_nodes, bbox_coordinates)
-    return bounded_nodes
-
-
-def add_new_node(
-        there_is_a_succeeding_node, index, bounded_nodes,
-        unbounded_nodes, bbox_coordinates):
-    # Latitude of the node element.
-    lat1 = unbounded_nodes[index]["lat"]
-    # Longitude of the node element.
-    lon1 = unbounded_nodes[index]["lon"]
-    a = (lat1, lon1)
-    if there_is_a_succeeding_node:  # Do for a succeeding node
-        index = index + 1  # Get the position of the succeeding node
-        # The original/initial latitude of the succeeding node
-        lat2 = unbounded_nodes[index]["lat"]
-        # The original/initial longitude of the succeeding node
-        lon2 = unbounded_nodes[index]["lon"]
-        b = (lat2, lon2)
-        result = Geodesic.WGS84.Inverse(*a, *b)
-        # street_boundingbox_angle of the succeeding node from the node element
-        # in degrees.
-        street_boundingbox_angle = result["azi1"]
-        node_parameters = {
-            "id": unbounded_nodes[index]["id"],
-            "lat1": lat1,
-            "lon1": lon1,
-            "lat2": lat2,
-            "lon2": lon2
+def boundary_segments(bounded_nodes, unbounded_nodes):
+    # Bounded_nodes are only the nodes of a street that fall within
+    # the bounding box, by id.
+    # Unbounded_nodes are all the nodes of a street, by id.
+    # Returns the segments of the street that leave the bounding box,
+    # as (node within, node outside, at the end of the street): from
+    # the last bounded node to the succeeding node, and from the first
+    # bounded node to the preceding node, if any.
+    segments = []
+    if bounded_nodes and len(unbounded_nodes) > len(bounded_nodes):
+        # Position of each node in the street
+        positions = {
+            node_id: position
+            for position, node_id in enumerate(unbounded_nodes)}
+        nodes = list(unbounded_nodes.values())
+        first = positions[next(iter(bounded_nodes))]
+        last = positions[next(reversed(bounded_nodes))]
+        if last < len(nodes) - 1:
+            segments.append((nodes[last], nodes[last + 1], True))
+        if first > 0:
+            segments.append((nodes[first], nodes[first - 1], False))
+    return segments
+
+
+def add_boundary_nodes(crossings, bbox_coordinates):
+    # After the boundary restrictions are applied, the nodes of a
+    # street within the bounding box may no longer be enough to
+    # represent the street shape. A node is added where each of its
+    # segments leaving the bounding box crosses the boundary, with the
+    # id of the node outside. Crossings are (node list of the street,
+    # node within, node outside, at the end of the street), of all the
+    # streets: their nodes are computed at once.
+    if not crossings:
+        return
+    lats, lons = boundary_nodes(
+        [inside["lat"] for _, inside, _, _ in crossings],
+        [inside["lon"] for _, inside, _, _ in crossings],
+        [outside["lat"] for _, _, outside, _ in crossings],
+        [outside["lon"] for _, _, outside, _ in crossings],
+        bbox_coordinates)
+    for (node_list, _, outside, at_end), lat, lon in zip(
+            crossings, lats.tolist(), lons.tolist()):
+        new_node = {
+            "id": outside["id"],
+            "node_type": "displaced",
+            "lat": lat,
+            "lon": lon
         }
-        succeeding_node = compute_new_node(
-            node_parameters, street_boundingbox_angle, bbox_coordinates)
-        bounded_nodes.append(succeeding_node)
-
-    else:  # Do for a preceeding node
-        index = index - 1  # Get the position of the preceeding node
-        # The real latitude of the preceeding node
-        lat2 = unbounded_nodes[index]["lat"]
-        # The real longitude of the preceeding node
-        lon2 = unbounded_nodes[index]["lon"]
-        b = (lat2, lon2)
-        result = Geodesic.WGS84.Inverse(*a, *b)
-        # Angular difference between a street and the intersecting side
-        # of the bounding box in degrees.
-        street_boundingbox_angle = result["azi1"]
-        node_parameters = {
-            "id": unbounded_nodes[index]["id"],
-            "lat1": lat1,
-            "lon1": lon1,
-            "lat2": lat2,
-            "lon2": lon2
+        if at_end:
+            node_list.append(new_node)
+        else:
+            node_list.insert(0, new_node)
+
+
+def copy_streets(processed_OSM_data):
+    # Copy the streets and their nodes, which are modified in place, as
+    # deepcopy would: every other value is immutable or a flat list.
+    return [
+        {
+            key: [
+                {k: (list(v) if isinstance(v, list) else v)
+                 for k, v in node.items()}
+                for node in value
+            ] if key == "nodes" else value
+            for key, value in street.items()
         }
-        preceding_node = compute_new_node(
-            node_parameters, street_boundingbox_angle, bbox_coordinates)
-        bounded_nodes.insert(0, preceding_node)
-    return bounded_nodes
-
-
-def compute_new_node(
-        node_parameters,
-        street_boundingbox_angle,
-        bbox_coordinates):
-    lat_min = bbox_coordinates[0]
-    lat_max = bbox_coordinates[2]
-    lon_min = bbox_coordinates[1]
-    lon_max = bbox_coordinates[3]
-    if street_boundingbox_angle < 0:
-        street_boundingbox_angle = street_boundingbox_angle + 360
-    # Latitude of the node element
-    lat1 = node_parameters["lat1"]
-    # Longitude of the node element
-    lon1 = node_parameters["lon1"]
-    # Latitude of either the preceding or the succeeding node.
-    lat2 = node_parameters["lat2"]
-    # Longitude of either the preceding or the succeeding node.
-    lon2 = node_parameters["lon2"]
-    top_side_intersection = True
-    bottom_side_intersection = True
-    # The street_boundingbox_angle indicates the side of the bounding
-    # box that intercepts the street.
-    if (street_boundingbox_angle >= 0 and
-            street_boundingbox_angle < 90):
-        # If a street makes an angular intersection of
-        # between 0 and 90 with the
-        # bounding box, it is likely such a street passes through either the
-        # top side or the right side of the bounding box.
-        # Validation is used to determine which of the two
-        # gives the true result.
-        # We first assume the street passes via the top side and validate.
-        # If validation fails, then it is the right side.
-        lat2 = lat_max
-        # Get longitude for the new node
-        lon2 = get_new_node_coordinates(
-            top_side_intersection,
-            lat1,
-            lon1,
-            lat2,
-            street_boundingbox_angle)
-        # Validate the latitude/longitude pair. # If validation fails,
-        # then intersection will be at the right side.
-        validated = validate_new_node_coordinates(lat2, lon2, bbox_coordinates)
-        if not validated:  # If validation fails,
-            # Set the top_side intersection to False.
-            top_side_intersection = False
-            lon2 = lon_max
-            lat2 = get_new_node_coordinates(
-                top_side_intersection, lat1, lon1,
-                lon2, street_boundingbox_angle)
-    elif (street_boundingbox_angle >= 90 and
-          street_boundingbox_angle < 180):
-        # If a street makes an angular intersection of
-        # between 90 and 180 with the
-        # bounding box, it is likely such a street passes through either the
-        # bottom side or the right side of the bounding box.
-        # Validation is used to determine which of the two
-        # gives the true result.
-        # We first assume the street passes via the bottom side and validate.
-        # If validation fails, then it is the right side.
-        lat2 = lat_min
-        # Get longitude for the new node
-        lon2 = get_new_node_coordinates(
-            bottom_side_intersection,
-            lat1,
-            lon1,
-            lat2,
-            street_boundingbox_angle)
-        # Validate the latitude/longitude pair. # If validation fails,
-        # then intersection will be at the right side.
-        validated = validate_new_node_coordinates(lat2, lon2, bbox_coordinates)
-        if not validated:  # If validation fails,
-            # Set the bottom_side intersection to False.
-            bottom_side_intersection = False
-            lon2 = lon_max
-            lat2 = get_new_node_coordinates(
-                bottom_side_intersection, lat1, lon1,
-                lon2, street_boundingbox_angle)
-    elif (street_boundingbox_angle >= 180 and
-          street_boundingbox_angle < 270):
-        # If a street makes an angular intersection of
-        # between 180 and 270
-        # with the bounding box, it is likely such a street passes
-        # through either the bottom side or the left side of the bounding box.
-        # Validation is used to determine which of the
-        # two gives the true result.
-        # We first assume the street passes via the bottom side and validate.
-        # If validation fails, then it is the left side.
-        lat2 = lat_min
-        # Get longitude for the new node
-        lon2 = get_new_node_coordinates(
-            bottom_side_intersection,
-            lat1,
-            lon1,
-            lat2,
-            street_boundingbox_angle)
-        # Validate the latitude/longitude pair. # If validation fails,
-        # then intersection will be at the left side.
-        validated = validate_new_node_coordinates(lat2, lon2, bbox_coordinates)
-        if not validated:  # If validation fails,
-            # Set the bottom_side intersection to False.
-            bottom_side_intersection = False
-            lon2 = lon_min
-            lat2 = get_new_node_coordinates(
-                bottom_side_intersection, lat1, lon1,
-                lon2, street_boundingbox_angle)
-    elif (street_boundingbox_angle >= 270 and
-          street_boundingbox_angle <= 360):
-        # If a street makes an angular intersection of
-        # between 270 and 360 with the
-        # bounding box, it is likely such a street
-        # passes through either the
-        # top side or the left side of the bounding box.
-        # Validation is used to determine which of the
-        # two gives the true result.
-        # We first assume the street passes via the
-        # top side and validate. If validation fails, then it is the left side.
-        lat2 = lat_max
-        # Get longitude for the new node
-        lon2 = get_new_node_coordinates(
-            top_side_intersection,
-            lat1,
-            lon1,
-            lat2,
-            street_boundingbox_angle)
-        # Validate the latitude/longitude pair. # If validation fails,
-        # then intersection will be at the left side.
-        validated = validate_new_node_coordinates(lat2, lon2, bbox_coordinates)
-        if not validated:  # If  validation fails,
-            # the intercept takes place at the left side.
-            # Set the top_side intersection to False.
-            top_side_intersection = False
-            lon2 = lon_min
-            lat2 = get_new_node_coordinates(
-                top_side_intersection, lat1, lon1,
-                lon2, street_boundingbox_angle)
-    new_node = {
-        "id": node_parameters["id"],
-        "node_type": "displaced",
-        "lat": float(lat2),
-        "lon": float(lon2)
-    }
-    return new_node
+        for street in processed_OSM_data
+    ]
 
 
-# Get the latitude and the longitude of the new (immediate) node
+def node_key(node):
+    # Nodes are compared by value: a displaced node keeps the id of the
+    # node it replaces, but is a different point.
+    return frozenset(node.items())
 
 
-def get_new_node_coordinates(
-        coordinates_indicator,
-        lat1,
-        lon1,
-        node_coordinates,
-        street_boundingbox_angle):
-    if coordinates_indicator:  # if true, solve for longitude
-        lat2 = node_coordinates
-        # Compute longitude
-        lon2 = ((math.tan(radians(street_boundingbox_angle)) *
-                (lat2 - lat1)) / math.cos(radians(lat1))) + lon1
-        return lon2
-    else:  # solve for latitude
-        lon2 = node_coordinates
-        # Compute latitude
-        lat2 = ((lon2 - lon1) * math.cos(radians(lat1)) /
-                math.tan(radians(street_boundingbox_angle))) + lat1
-        return lat2
+def index_street_nodes(processed_OSM_data):
+    # Map every node to the (positions of the) streets it belongs to,
+    # in street order
+    street_index = {}
+    for position, street in enumerate(processed_OSM_data):
+        for node in street["nodes"]:
+            streets = street_index.setdefault(node_key(node), [])
+            if not streets or streets[-1] != position:
+                streets.append(position)
+    return street_index
 
 
-def validate_new_node_coordinates(lat2, lon2, bbox_coordinates):
-    lat_min = bbox_coordinates[0]
-    lat_max = bbox_coordinates[2]
-    lon_min = bbox_coordinates[1]
-    lon_max = bbox_coordinates[3]
-    if ((lat2 >= lat_min and lat2 <= lat_max) and
-            (lon2 >= lon_min and lon2 <= lon_max)):
-        return True
-
-
-def compare_street(street1, street2):  # Compare two streets
-    intersecting_points = [x for x in street1 if x in street2]
-    return intersecting_points
+def street_record(street, intersection_nodes):
+    # Identify a street by its name, or its type if it has no name
+    record = {"street_id": street["street_id"]}
+    if "street_name" in street:
+        record["street_name"] = street["street_name"]
+    elif "street_type" in street:
+        record["street_type"] = street["street_type"]
+    record["intersection_nodes"] = intersection_nodes
+    return record
 
 
 def extract_street(processed_OSM_data):  # extract two streets
-    intersection_record = []
-    for i in range(len(processed_OSM_data)):
-        for j in range(i + 1, len(processed_OSM_data)):
-            street1 = processed_OSM_data[i]["nodes"]
-            street2 = processed_OSM_data[j]["nodes"]
-            intersecting_points = compare_street(
-                street1, street2)  # function call
-            if len(intersecting_points):  # check if not empty
-                if "street_name" in processed_OSM_data[i]:
-                    street_object = {
-                        "street_id": processed_OSM_data[i]["street_id"],
-                        "street_name": processed_OSM_data[i]["street_name"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                elif "street_type" in processed_OSM_data[i]:
-                    street_object = {
-                        "street_id": processed_OSM_data[i]["street_id"],
-                        "street_type": processed_OSM_data[i]["street_type"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                else:
-                    street_object = {
-                        "street_id": processed_OSM_data[i]["street_id"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                intersection_record.append(street_object)
-                if "street_name" in processed_OSM_data[j]:
-                    street_object = {
-                        "street_id": processed_OSM_data[j]["street_id"],
-                        "street_name": processed_OSM_data[j]["street_name"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                elif "street_type" in processed_OSM_data[i]:
-                    street_object = {
-                        "street_id": processed_OSM_data[i]["street_id"],
-                        "street_type": processed_OSM_data[i]["street_type"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                else:
-                    street_object = {
-                        "street_id": processed_OSM_data[j]["street_id"],
-                        "intersection_nodes": intersecting_points,
-                    }
-                intersection_record.append(street_object)
-    # Group the streets by their ids
+    street_index = index_street_nodes(processed_OSM_data)
+    # Group the intersections by street id
     output = {}
-    for obj in intersection_record:
-        street_id = obj["street_id"]
-        if street_id not in output:
-            assert obj["intersection_nodes"] is not None
-            if "street_name" in obj:
-                record = {
-                    "street_id": obj["street_id"],
-                    "street_name": obj["street_name"],
-                    "intersection_nodes": obj["intersection_nodes"],
-                }
-            elif "street_type" in obj:
-                record = {
-                    "street_id": obj["street_id"],
-                    "street_type": obj["street_type"],
-                    "intersection_nodes": obj["intersection_nodes"],
-                }
+    for i, street1 in enumerate(processed_OSM_data):
+        # Nodes shared with each of the following streets, in the order
+        # of street1
+        intersecting_points = {}
+        for node in street1["nodes"]:
+            for j in street_index[node_key(node)]:
+                if j > i:
+                    intersecting_points.setdefault(j, []).append(node)
+        for j in sorted(intersecting_points):
+            street2 = processed_OSM_data[j]
+            records = [street_record(street1, intersecting_points[j])]
+            if "street_name" in street2:
+                records.append(street_record(street2, intersecting_points[j]))
+            elif "street_type" in street1:
+                # The second street has no name: it is recorded as the
+                # first one, with its type
+                records.append({
+                    "street_id": street1["street_id"],
+                    "street_type": street1["street_type"],
+                    "intersection_nodes": intersecting_points[j],
+                })
             else:
-                record = {
-                    "street_id": obj["street_id"],
-                    "intersection_nodes": obj["intersection_nodes"],
-                }
-            output[street_id] = record
-        else:
-            existing_record = output[street_id]
-            existing_intersection_nodes = existing_record["intersection_nodes"]
-            assert existing_intersection_nodes is not None
-            new_intersection_nodes = obj["intersection_nodes"]
-            q = new_intersection_nodes
-            assert q is not None
-            merged_intersection_nodes = existing_intersection_nodes + q
-            existing_record["intersection_nodes"] = merged_intersection_nodes
-            output[street_id] = existing_record
-    intersection_record_updated = list(output.values())
-    # Keep a unique set of intersections under each street segment
-    for obj in range(len(intersection_record_updated)):
-        unique_set = []
-        inter_sets = intersection_record_updated[obj]["intersection_nodes"]
-        unique_set = [item for item in inter_sets if item not in unique_set]
-        # for item in range(len(inter_sets)):
-        # if inter_sets[item] not in unique_set:
-        # unique_set.append(inter_sets[item])
-        intersection_record_updated[obj]["intersection_nodes"] = unique_set
-    return (intersection_record_updated)
+                records.append({
+                    "street_id": street2["street_id"],
+                    "intersection_nodes": intersecting_points[j],
+                })
+            for record in records:
+                if record["street_id"] not in output:
+                    record["intersection_nodes"] = list(
+                        record["intersection_nodes"])
+                    output[record["street_id"]] = record
+                else:
+                    output[record["street_id"]]["intersection_nodes"].extend(
+                        record["intersection_nodes"])
+    return list(output.values())
+
+
+def intersection_name(X, Y, id1, id2):
+    # Name an intersection after the names of its streets, or their
+    # types, or their ids
+    key1 = "street_name"
+    key2 = "street_type"
+    if key1 in X and key1 in Y:
+        return f"{X[key1]} intersecting {Y[key1]}"
+    elif key1 not in X and key1 in Y:
+        if key2 in X:  # Use street type if noname
+            return f"{X[key2]} intersecting {Y[key1]}"
+        return f"{id1} intersecting {Y[key1]}"
+    elif key1 in X and key1 not in Y:
+        if key2 in Y:  # Use street type if noname
+            return f"{X[key1]} intersecting {Y[key2]}"
+        return f"{X[key1]} intersecting {id2}"
+    elif key2 in X and key2 in Y:
+        return f"{X[key2]} intersecting {Y[key2]}"
+    return f"{id1} intersecting {id2}"
 
 
 def allot_intersection(processed_OSM_data, inters_rec_up
                        ):  # iterate & indicate common nodes
-    processed_OSM_data1 = deepcopy(processed_OSM_data)
-    inters = inters_rec_up
-    for obj in range(len(processed_OSM_data1)):
-        id1 = processed_OSM_data1[obj]["street_id"]
-        nodes = processed_OSM_data1[obj]["nodes"]
-        for i in range(len(nodes)):
-            for objs in range(len(inters)):
-                id2 = inters[objs]["street_id"]
-                intersection_nodes = inters[objs]["intersection_nodes"]
-                for items in range(len(intersection_nodes)):
-                    if id1 != id2:  # compare unique street only
-                        # check if a node represents an intersection
-                        if nodes[i] == intersection_nodes[items]:
-                            if "highway" in nodes[i]:
-                                nodes[i]["cat"] = nodes[i]["highway"]
-                            nodes[i]["intersection"] = [id1, id2]
-                            f = nodes[i]
-                            key1 = "street_name"
-                            key2 = "street_type"
-                            X = processed_OSM_data1[obj]
-                            Y = inters[objs]
-                            # Check if street_name key is empty or not to
-                            # format the output
-                            if key1 in X and key1 in Y:
-                                nm1 = X["street_name"]
-                                nm2 = Y["street_name"]
-                                f["name"] = f"{nm1} intersecting {nm2}"
-                            elif key1 not in X and key1 in Y:
-                                nm2 = Y["street_name"]
-                                if key2 in X:  # Use street type if noname
-                                    stp = X["street_type"]
-                                    f["name"] = f"{stp} intersecting {nm2}"
-                                else:
-                                    f["name"] = f"{id1} intersecting {nm2}"
-                            elif key1 in X and key1 not in Y:
-                                nm1 = X["street_name"]
-                                if key2 in Y:  # Use street type if noname
-                                    stp = Y["street_type"]
-                                    f["name"] = f"{nm1} intersecting {stp}"
-                                else:
-                                    f["name"] = f"{nm1} intersecting {id2}"
-                            else:
-                                if key2 in X and key2 in Y:
-                                    stp1 = X["street_type"]
-                                    stp2 = Y["street_type"]
-                                    f["name"] = f"{stp1} intersecting {stp2}"
-                                else:
-                                    f["name"] = f"{id1} intersecting {id2}"
+    processed_OSM_data1 = copy_streets(processed_OSM_data)
+    # Map every intersection node to the records holding it, in order
+    record_index = {}
+    for record in inters_rec_up:
+        for node in record["intersection_nodes"]:
+            records = record_index.setdefault(node_key(node), [])
+            if not records or records[-1] is not record:
+                records.append(record)
+    for X in processed_OSM_data1:
+        id1 = X["street_id"]
+        for node in X["nodes"]:
+            # The node is an intersection with the first other street
+            # holding it
+            Y = next((
+                record for record in record_index.get(node_key(node), ())
+                if record["street_id"] != id1), None)
+            if Y is None:
+                continue
+            id2 = Y["street_id"]
+            if "highway" in node:
+                node["cat"] = node["highway"]
+            node["intersection"] = [id1, id2]
+            node["name"] = intersection_name(X, Y, id1, id2)
     return processed_OSM_data1
 
 
+def add_amenity(amenity, amenity_ids, amenity_record):
+    # Add a record to the amenity list unless it is already there.
+    # Only records with the same id can be equal.
+    records = amenity_ids.setdefault(amenity_record.get("id"), [])
+    if amenity_record not in records:
+        records.append(amenity_record)
+        amenity.append(amenity_record)
+
+
 def get_amenities(bbox_coord):
     # Send request to OSM to get amenities which are part of
     # points of interest (POIs)
@@ -681,24 +565,12 @@ def get_amenities(bbox_coord):
     lat_max = bbox_coord[2]
     lon_min = bbox_coord[1]
     lon_max = bbox_coord[3]
-    # loop through all provided servers
-    for i in range(len(SERVERS)):
-        try:
-            amenities = server_config2(SERVERS[i], bbox_coord)
-            break
-        except Exception as e:
-            if (i+1) < len(SERVERS):
-                error = error = (
-                        f"{SERVERS[i]} not responding ({str(e)}), "
-                        f"so connecting to {SERVERS[i+1]}")
-            else:
-                error = (f"{SERVERS[i]} not responding ({str(e)}). "
-                         "Unable to get data. All servers down!")
-                amenities = None
-            LOGGER.debug(error)
+    amenities = query_servers(server_config2, bbox_coord)
 
     # Fetch the basic amenity tags
     amenity = []
+    # The records of the amenity list, by id
+    amenity_ids = {}
     if amenities is not None:
         if amenities.nodes:
             for node in amenities.nodes:
@@ -706,9 +578,9 @@ def get_amenities(bbox_coord):
                 if ((node.lat >= lat_min and node.lat <= lat_max) and (
                         node.lon >= lon_min and node.lon <= lon_max)):
                     amenity_record = {
-                        "id": int(node.id),
-                        "lat": float(node.lat),
-                        "lon": float(node.lon),
+                        "id": node.id,
+                        "lat": node.lat,
+                        "lon": node.lon,
                         "name": node.tags.get("name"),
                     }
                     # Fetch as many tags possible beyond the basic
@@ -722,8 +594,7 @@ def get_amenities(bbox_coord):
                         # Delete keys with no value
                         amenity_record = dict(
                             x for x in amenity_record.items() if all(x))
-                        if amenity_record not in amenity:
-                            amenity.append(amenity_record)
+                        add_amenity(amenity, amenity_ids, amenity_record)
                     if "highway" in node.tags:
                         amenity_record["cat"] = node.tags.get("highway")
                         node.tags.pop("highway", None)
@@ -732,19 +603,18 @@ def get_amenities(bbox_coord):
                         # Delete keys with no value
                         amenity_record = dict(
                             x for x in amenity_record.items() if all(x))
-                        if amenity_record not in amenity:
-                            amenity.append(amenity_record)
+                        add_amenity(amenity, amenity_ids, amenity_record)
 
         if amenities.ways:
             for way in amenities.ways:
                 # Extract only amenities(under ways) within the boundary
-                if (way.center_lat >= lat_min and way.center_lat <= lat_max
-                    and way.center_lon >= lon_min
-                        and way.center_lon <= lon_max):
+                if (way.lat >= lat_min and way.lat <= lat_max
+                    and way.lon >= lon_min
+                        and way.lon <= lon_max):
                     amenity_record = {
-                        "id": int(way.id),
-                        "lat": float(way.center_lat),
-                        "lon": float(way.center_lon),
+                        "id": way.id,
+                        "lat": way.lat,
+                        "lon": way.lon,
                         "name": way.tags.get("name"),
                     }
                     # Remove name tag
@@ -758,8 +628,7 @@ def get_amenities(bbox_coord):
                         # Delete keys with no value
                         amenity_record = dict(
                             x for x in amenity_record.items() if all(x))
-                        if amenity_record not in amenity:
-                            amenity.append(amenity_record)
+                        add_amenity(amenity, amenity_ids, amenity_record)
                     if "building" in way.tags:
                         amenity_record["cat"] = way.tags.get("building")
                         if amenity_record["cat"] == "yes":
@@ -771,19 +640,18 @@ def get_amenities(bbox_coord):
                         # Delete keys with no value
                         amenity_record = dict(
                             x for x in amenity_record.items() if all(x))
-                        if amenity_record not in amenity:
-                            amenity.append(amenity_record)
+                        add_amenity(amenity, amenity_ids, amenity_record)
 
         if amenities.relations:
             for rel in amenities.relations:
                 # Extract only amenities(under relations) within the boundary
-                if (rel.center_lat >= lat_min and rel.center_lat <= lat_max
-                    and rel.center_lon >= lon_min
-                        and rel.center_lon <= lon_max):
+                if (rel.lat >= lat_min and rel.lat <= lat_max
+                    and rel.lon >= lon_min
+                        and rel.lon <= lon_max):
                     amenity_record = {
-                        "id": int(rel.id),
-                        "lat": float(rel.center_lat),
-                        "lon": float(rel.center_lon),
+                        "id": rel.id,
+                        "lat": rel.lat,
+                        "lon": rel.lon,
                         "name": rel.tags.get("name")
                     }
                     # Remove name tag
@@ -793,141 +661,88 @@ def get_amenities(bbox_coord):
                         # Remove amenity tag and fetch other tags available
                         rel.tags.pop("amenity", None)
                         # Add other tags
-                        amenity_record.update(way.tags)
+                        amenity_record.update(rel.tags)
                         # Delete keys with no value
                         amenity_record = dict(
                             x for x in amenity_record.items() if all(x))
-                        if amenity_record not in amenity:
-                            amenity.append(amenity_record)
+                        add_amenity(amenity, amenity_ids, amenity_record)
     return amenity
 
 
 def enlist_POIs(processed_OSM_data1, amenity):
     # Keep all identified points of interest in a single list
-    POIs = []
-    nodes_ids = []
+    # Street nodes that are points of interest, by id (the first node
+    # of each id, to remove duplicate intersections)
+    street_POIs = {}
     if len(processed_OSM_data1):
-        for obj in range(len(processed_OSM_data1)):
-            nodes = processed_OSM_data1[obj]["nodes"]
-            for node in range(len(nodes)):
-                key_to_check = "cat"
+        for street in processed_OSM_data1:
+            for node in street["nodes"]:
                 # check if "cat" key is in the node
-                if (key_to_check in nodes[node]
-                        or "intersection" in nodes[node]):
-                    # Check to remove duplicate intersections
-                    if nodes[node] not in POIs:
-                        if nodes[node]["id"] not in nodes_ids:
-                            nodes_ids.append(nodes[node]["id"])
-                            nodes_ids.append(nodes[node]["id"])
-                            POIs.append(nodes[node])
+                if "cat" in node or "intersection" in node:
+                    street_POIs.setdefault(node["id"], node)
+    POIs = list(street_POIs.values())
     if amenity is not None and len(amenity) != 0:
-        for objs in range(len(amenity)):
-            POIs.append(amenity[objs])
+        POIs.extend(amenity)
     return POIs  # POIs is a list of all points of interest
 
 
 def OSM_preprocessor(processed_OSM_data, POIs, amenity):
-    id_list, node_list, POI_id_list = [], [], []
-    processed_OSM_data2 = deepcopy(processed_OSM_data)
-    if len(POIs):
-        # Iterate through the amenities
-        for i in range(len(
-                POIs)):
-            # check if true, then the points of interest are amenity,
-            # e.g. restaurants, bars, rentals, etc
-            if "intersection" not in POIs[i] and amenity is not None:
-                minimum_distance = []
-                for obj in range(len(processed_OSM_data)):
-                    nodes = processed_OSM_data[obj]["nodes"]
-                    for j in range(len(nodes)):
-                        lat1 = nodes[j]["lat"]
-                        lon1 = nodes[j]["lon"]
-                        lat2 = POIs[i]["lat"]
-                        lon2 = POIs[i]["lon"]
-                        location1 = (float(lat1), float(lon1))
-                        location2 = (float(lat2), float(lon2))
-                        # Compute the distance between a node and POI
-                        distance = hs.haversine(location1, location2)
-                        if (len(minimum_distance)) == 0:
-                            minimum_distance.append(distance)
-                            k = processed_OSM_data2[obj]["nodes"]
-                            reference_id = {
-                                "node_id": k[j]["id"], }
-                        else:
-                            if distance < minimum_distance[0]:
-                                minimum_distance[0] = distance
-                                k = processed_OSM_data2[obj]["nodes"]
-                                reference_id = {
-                                    "node_id": k[j]["id"], }
-                # iterate through the OSM data
-                # to reference the node that should
-                # hold the point of interest
-                for objs in range(len(processed_OSM_data2)):
-                    nodes = processed_OSM_data2[objs]["nodes"]
-                    for node in range(len(nodes)):  # if true,
-                        # the node will hold the point of interest
-                        if nodes[node]["id"] == reference_id["node_id"]:
-                            if nodes[node]["id"] not in id_list:  # id_list
-                                # stores all the node ids using the POIs
-                                id_list.append(nodes[node]["id"])
-                                nodes[node]["POIs_ID"] = [
-                                    POIs[i]["id"]]  # New key-pair in the node
-                                # node_list keeps all the nodes using POIs
-                                node_list.append(nodes[node])
-                                # POI_list keeps all the POI ids
-                                POI_id_list.append(POIs[i]["id"])
-                            else:
-                                for n in range(len(node_list)):
-                                    # identify the node in the list by using
-                                    # its id
-                                    if nodes[node]["id"] == node_list[n]["id"]:
-                                        # Existing amenity/POI's id(s)
-                                        existingid = node_list[n]["POIs_ID"]
-                                        # An id for new POI
-                                        new_id = POIs[i]["id"]
-                                        # Ensure new id is not in the existing
-                                        # id
-                                        if new_id not in POI_id_list:
-                                            POI_id_list.append(new_id)
-                                            # Two id's merged into a single
-                                            # list
-                                            merged_id = existingid + [new_id]
-                                            nodes[node]["POIs_ID"] = merged_id
-                                        else:
-                                            nodes[node]["POIs_ID"] = existingid
-            else:  # POIs here are intersections
-                for objs in range(len(processed_OSM_data2)):
-                    nodes = processed_OSM_data2[objs]["nodes"]
-                    for node in range(len(nodes)):
-                        # check if node is among the points of interest list
-                        if nodes[node]["id"] == POIs[i]["id"]:
-                            # check if this node has not been used by any POIs
-                            if nodes[node]["id"] not in id_list:
-                                # id_list stores all the node ids using the
-                                # POIs
-                                id_list.append(nodes[node]["id"])
-                                # create a new key-pair in the node
-                                nodes[node]["POIs_ID"] = [nodes[node]["id"]]
-                                # node_list keeps all the nodes using POIs
-                                node_list.append(nodes[node])
-                                # POI_list keeps all the POIs ids
-                                POI_id_list.append(nodes[node]["id"])
-                            else:
-                                for n in range(len(node_list)):
-                                    if nodes[node]["id"] == node_list[n]["id"]:
-                                        existingid = node_list[n]["POIs_ID"]
-                                        # node id for intersection (POI)
-                                        new_id = nodes[node]["id"]
-                                        # Ensure new id is not in the existing
-                                        # id
-                                        if new_id not in POI_id_list:
-                                            POI_id_list.append(new_id)
-                                            # Two id's merged into a single
-                                            # list
-                                            merged_id = existingid + [new_id]
-                                            nodes[node]["POIs_iD"] = merged_id
-                                        else:
-                                            nodes[node]["POIs_ID"] = existingid
+    processed_OSM_data2 = copy_streets(processed_OSM_data)
+    # All the street nodes, in street order, and the copied nodes by id
+    street_nodes = [
+        node for street in processed_OSM_data for node in street["nodes"]]
+    nodes_by_id = {}
+    for street in processed_OSM_data2:
+        for node in street["nodes"]:
+            nodes_by_id.setdefault(node["id"], []).append(node)
+    # node_list keeps the first node using POIs, by node id.
+    # POI_id_list keeps all the POI ids.
+    node_list, POI_id_list = {}, set()
+
+    # Find the street node nearest to every amenity (e.g. restaurants,
+    # bars, rentals, etc) in bulk, with a spatial index over the nodes
+    amenity_POIs = [
+        POI for POI in POIs
+        if "intersection" not in POI and amenity is not None]
+    grid = NodeGrid(
+        [(float(node["lat"]), float(node["lon"])) for node in street_nodes])
+    nearest = grid.nearest_many(
+        [(float(POI["lat"]), float(POI["lon"])) for POI in amenity_POIs])
+    reference_ids = {
+        id(POI): street_nodes[index]["id"]
+        for POI, index in zip(amenity_POIs, nearest) if index is not None}
+
+    for POI in POIs:
+        # check if true, then the points of interest are amenity
+        if "intersection" not in POI and amenity is not None:
+            if id(POI) not in reference_ids:
+                continue
+            # the nodes with this id hold the point of interest
+            reference_id = reference_ids[id(POI)]
+            new_id = POI["id"]
+            POIs_key = "POIs_ID"
+        else:  # POIs here are intersections
+            reference_id = POI["id"]
+            # node id for intersection (POI)
+            new_id = reference_id
+            POIs_key = "POIs_iD"
+        for node in nodes_by_id.get(reference_id, ()):
+            # check if this node has not been used by any POIs
+            if node["id"] not in node_list:
+                # create a new key-pair in the node
+                node["POIs_ID"] = [new_id]
+                node_list[node["id"]] = node
+                POI_id_list.add(new_id)
+            else:
+                # Existing amenity/POI's id(s)
+                existingid = node_list[node["id"]]["POIs_ID"]
+                # Ensure new id is not in the existing id
+                if new_id not in POI_id_list:
+                    POI_id_list.add(new_id)
+                    # Two id's merged into a single list
+                    node[POIs_key] = existingid + [new_id]
+                else:
+                    node["POIs_ID"] = existingid
     # Use Python Sort function
     processed_OSM_data2 = compute_street_length(processed_OSM_data2)
     processed_OSM_data2 = (
@@ -959,27 +774,14 @@ def OSM_preprocessor(processed_OSM_data, POIs, amenity):
 
 
 def compute_street_length(processed_OSM_data):
-    # Compute the overall path length
-    for obj in range(len(processed_OSM_data)):
-        nodes = processed_OSM_data[obj]["nodes"]
-        for node in range(len(nodes)):
-            if node <= 0:
-                i = 0
-                sum = 0
-                for j in range(i + 1, len(nodes)):
-                    lat1 = nodes[i]["lat"]
-                    lon1 = nodes[i]["lon"]
-                    lat2 = nodes[j]["lat"]
-                    lon2 = nodes[j]["lon"]
-                    location1 = (float(lat1), float(lon1))
-                    location2 = (float(lat2), float(lon2))
-                    # Compute the distance between two adjacent nodes of a way
-                    # (in metres)
-                    distance = (hs.haversine(location1, location2) * 1000)
-                    # Sum up the distance
-                    sum = sum + distance
-                    i = i + 1
-        processed_OSM_data[obj]["distance"] = sum
+    # Compute the overall path length (in metres) of every street
+    nodes = [
+        node for street in processed_OSM_data for node in street["nodes"]]
+    lengths = polyline_lengths(
+        [node["lat"] for node in nodes], [node["lon"] for node in nodes],
+        [len(street["nodes"]) for street in processed_OSM_data])
+    for street, length in zip(processed_OSM_data, lengths):
+        street["distance"] = length
     return processed_OSM_data
 
 
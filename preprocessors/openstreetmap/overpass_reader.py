@@ -0,0 +1,69 @@
+import json
+from collections import namedtuple
+
+# Elements of an [out:json] Overpass response. Coordinates are floats,
+# as in the response. Ways and relations are located at their center
+# (with "out center"), or at None. The nodes of a way are Node tuples.
+Node = namedtuple("Node", ["id", "lat", "lon", "tags"])
+Way = namedtuple("Way", ["id", "lat", "lon", "tags", "nodes"])
+Relation = namedtuple("Relation", ["id", "lat", "lon", "tags"])
+OverpassData = namedtuple("OverpassData", ["nodes", "ways", "relations"])
+
+
+class OverpassError(Exception):
+    """Error reported by an Overpass server in the remark of a response."""
+
+
+def check_remark(text):
+    """Raise OverpassError if an [out:json] response reports an error."""
+    # The remark follows the elements: only parse the responses that
+    # mention one
+    if '"remark"' in text:
+        remark = json.loads(text).get("remark")
+        if remark:
+            raise OverpassError(remark)
+
+
+def _center(element):
+    center = element.get("center")
+    if center is None:
+        return None, None
+    return center["lat"], center["lon"]
+
+
+def read_elements(elements):
+    """
+    OverpassData of the elements of an [out:json] response, in order.
+    The first element of a type and id is kept, and the nodes of a way
+    that are not in the response are left out.
+    """
+    nodes, ways, relations = {}, {}, {}
+    way_elements = []
+    for element in elements:
+        element_type = element["type"]
+        element_id = element["id"]
+        if element_type == "node":
+            if element_id not in nodes:
+                nodes[element_id] = Node(
+                    element_id, element["lat"], element["lon"],
+                    element.get("tags", {}))
+        elif element_type == "way":
+            # The nodes of the ways may follow them
+            way_elements.append(element)
+        elif element_type == "relation":
+            if element_id not in relations:
+                relations[element_id] = Relation(
+                    element_id, *_center(element), element.get("tags", {}))
+    for element in way_elements:
+        if element["id"] not in ways:
+            ways[element["id"]] = Way(
+                element["id"], *_center(element), element.get("tags", {}),
+                [nodes[ref] for ref in element.get("nodes", ())
+                 if ref in nodes])
+    return OverpassData(
+        list(nodes.values()), list(ways.values()), list(relations.values()))
+
+
+def read_response(text):
+    """OverpassData of an [out:json] response."""
+    return read_elements(json.loads(text)["elements"])
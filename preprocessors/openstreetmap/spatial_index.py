@@ -0,0 +1,127 @@
+import math
+import haversine as hs
+
+# Mean earth radius used by the haversine package, in km
+EARTH_RADIUS = 6371.0088
+# Relative slack between projected and haversine distances when
+# collecting candidates. The equirectangular projection stays well within
+# it over the areas of a request (see NodeGrid.max_distortion).
+CANDIDATE_SLACK = 0.01
+MAX_DISTORTION = CANDIDATE_SLACK / 4
+
+
+class NodeGrid:
+    """
+    Grid hash over street nodes, for nearest-node queries.
+
+    Nodes are projected on a local equirectangular plane (in km) and
+    bucketed in square cells holding about one node each. A query walks
+    the cells in rings around the point until no unvisited cell can hold
+    a node closer than the best one found. The nodes within the
+    projection slack of the best one are then compared with the same
+    haversine distance as the brute-force search, in the same order, so
+    the answer (ties included) is the one of the brute-force search.
+    """
+
+    def __init__(self, points):
+        """
+        points: list of (lat, lon) of the nodes, in search order
+        """
+        self.points = points
+        self.cells = {}
+        if not points:
+            return
+        lats = [lat for lat, _ in points]
+        lons = [lon for _, lon in points]
+        self.lat0 = (min(lats) + max(lats)) / 2
+        self.lon0 = (min(lons) + max(lons)) / 2
+        self.x_scale = EARTH_RADIUS * math.radians(1) * \
+            math.cos(math.radians(self.lat0))
+        self.y_scale = EARTH_RADIUS * math.radians(1)
+        # cos(lat) varies over the nodes: the projected distances
+        # are then off by up to this ratio
+        self.max_distortion = max(
+            abs(math.cos(math.radians(lat)) /
+                math.cos(math.radians(self.lat0)) - 1)
+            for lat in (min(lats), max(lats))
+        ) if abs(self.lat0) < 89 else math.inf
+        self.projected = [self._project(lat, lon) for lat, lon in points]
+
+        xs = [x for x, _ in self.projected]
+        ys = [y for _, y in self.projected]
+        area = max(max(xs) - min(xs), 1e-3) * max(max(ys) - min(ys), 1e-3)
+        self.cell_size = math.sqrt(area / len(points))
+        for i, (x, y) in enumerate(self.projected):
+            self.cells.setdefault(self._cell(x, y), []).append(i)
+        cell_xs = [cx for cx, _ in self.cells]
+        cell_ys = [cy for _, cy in self.cells]
+        self.bounds = (min(cell_xs), min(cell_ys), max(cell_xs), max(cell_ys))
+
+    def _project(self, lat, lon):
+        return ((lon - self.lon0) * self.x_scale,
+                (lat - self.lat0) * self.y_scale)
+
+    def _cell(self, x, y):
+        return (math.floor(x / self.cell_size),
+                math.floor(y / self.cell_size))
+
+    def _ring(self, cx, cy, r):
+        """Cells at Chebyshev distance r of (cx, cy), within the bounds."""
+        min_x, min_y, max_x, max_y = self.bounds
+        for x in range(max(cx - r, min_x), min(cx + r, max_x) + 1):
+            for y in (cy - r, cy + r) if r else (cy,):
+                if min_y <= y <= max_y:
+                    yield x, y
+        for y in range(max(cy - r + 1, min_y), min(cy + r - 1, max_y) + 1):
+            for x in (cx - r, cx + r) if r else ():
+                if min_x <= x <= max_x:
+                    yield x, y
+
+    def nearest(self, lat, lon):
+        """
+        Index of the node nearest to (lat, lon) by haversine distance,
+        the first one in search order on ties (None without nodes).
+        """
+        if not self.points:
+            return None
+        distortion = max(self.max_distortion, abs(
+            math.cos(math.radians(lat)) / math.cos(math.radians(self.lat0))
+            - 1))
+        if distortion > MAX_DISTORTION:
+            return self._nearest_brute_force(lat, lon)
+
+        x, y = self._project(lat, lon)
+        cx, cy = self._cell(x, y)
+        min_x, min_y, max_x, max_y = self.bounds
+        max_r = max(cx - min_x, max_x - cx, cy - min_y, max_y - cy)
+        seen = []
+        best = math.inf
+        for r in range(max_r + 1):
+            for cell in self._ring(cx, cy, r):
+                for i in self.cells.get(cell, ()):
+                    px, py = self.projected[i]
+                    d = math.hypot(px - x, py - y)
+                    seen.append((i, d))
+                    best = min(best, d)
+            # nodes beyond ring r are at least r cells away
+            if r * self.cell_size > best * (1 + CANDIDATE_SLACK) + 1e-9:
+                break
+
+        limit = best * (1 + CANDIDATE_SLACK) + 1e-9
+        candidates = sorted(i for i, d in seen if d <= limit)
+        return self._nearest_of(candidates, lat, lon)
+
+    def nearest_many(self, points):
+        """nearest for each (lat, lon) of points."""
+        return [self.nearest(lat, lon) for lat, lon in points]
+
+    def _nearest_brute_force(self, lat, lon):
+        return self._nearest_of(range(len(self.points)), lat, lon)
+
+    def _nearest_of(self, indices, lat, lon):
+        nearest, minimum_distance = None, None
+        for i in indices:
+            distance = hs.haversine(self.points[i], (lat, lon))
+            if minimum_distance is None or distance < minimum_distance:
+                nearest, minimum_distance = i, distance
+        return nearest
@@ -0,0 +1,76 @@
+"""
+Tests of the tile cache of the Overpass queries.
+
+Usage (from preprocessors/openstreetmap):
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import sys
+import unittest
+from unittest import mock
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, os.path.join(HERE, "..", "..", ".."))
+os.environ.setdefault("SERVERS", "http://localhost")
+
+import osm_service  # noqa: E402
+from overpass_reader import OverpassError  # noqa: E402
+from tile_cache import TileCache, tiles  # noqa: E402
+
+
+def tiles_response(tile_list, elements):
+    """Response to tiles_query, with every element in the first tile."""
+    response = []
+    for k, tile in enumerate(tile_list):
+        response += elements if k == 0 else []
+        response.append({
+            "type": "tile", "id": 1,
+            "tags": {"position": f"{tile[0]}:{tile[1]}"}})
+    return json.dumps({"elements": response})
+
+
+class TilesTest(unittest.TestCase):
+
+    def setUp(self):
+        with open(os.path.join(HERE, "fixtures", "city-4.json")) as f:
+            fixture = json.load(f)
+        self.bbox = fixture["bbox"]
+        self.elements = fixture["streets"]["elements"]
+        self.tile_list = tiles(self.bbox)
+        patcher = mock.patch.object(osm_service, "TILE_CACHE", TileCache())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_query(self):
+        response = tiles_response(self.tile_list, self.elements)
+        self.assertGreater(len(self.tile_list), 1)
+        with mock.patch.object(
+                osm_service, "fetch_json", return_value=response) as fetch:
+            data = osm_service.query_tiles(
+                "http://localhost", self.bbox, osm_service.streets_query)
+            cached = osm_service.query_tiles(
+                "http://localhost", self.bbox, osm_service.streets_query)
+        # the missing tiles are fetched at once, then read from the cache
+        fetch.assert_called_once()
+        query = fetch.call_args[0][1]
+        self.assertEqual(query.count("make tile"), len(self.tile_list))
+        expected = osm_service.read_response(
+            json.dumps({"elements": self.elements}))
+        self.assertEqual(data, expected)
+        self.assertEqual(cached, expected)
+
+    def test_incomplete_response(self):
+        response = tiles_response(self.tile_list[:-1], self.elements)
+        with mock.patch.object(
+                osm_service, "fetch_json", return_value=response):
+            with self.assertRaises(OverpassError):
+                osm_service.query_tiles(
+                    "http://localhost", self.bbox, osm_service.streets_query)
+        self.assertEqual(osm_service.TILE_CACHE.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Tile cache backend: memory, disk (memory in front of a directory) or none
+OSM_TILE_CACHE = os.environ.get('OSM_TILE_CACHE', 'memory').lower()
+# Side of a tile in degrees (0.002 is about 220 m of latitude, so that the
+# 200 m bounding box of the default 100 m radius spans 1 to 3 tiles by side)
+OSM_TILE_SIZE = float(os.environ.get('OSM_TILE_SIZE', '0.002'))
+# Time to live of the cached tiles in seconds
+OSM_TILE_CACHE_TTL = float(os.environ.get('OSM_TILE_CACHE_TTL', '3600'))
+# Number of tiles kept in memory
+OSM_TILE_CACHE_MAX_ENTRIES = int(
+    os.environ.get('OSM_TILE_CACHE_MAX_ENTRIES', '256'))
+OSM_TILE_CACHE_DIR = os.environ.get(
+    'OSM_TILE_CACHE_DIR', '/tmp/osm-tile-cache')
+
+LOGGER = logging.getLogger(__name__)
+
+
+def tiles(bbox_coord, tile_size=OSM_TILE_SIZE):
+    """(row, column) of the tiles covering a bounding box."""
+    lat_min, lon_min = bbox_coord[0], bbox_coord[1]
+    lat_max, lon_max = bbox_coord[2], bbox_coord[3]
+    return [
+        (row, column)
+        for row in range(math.floor(lat_min / tile_size),
+                         math.floor(lat_max / tile_size) + 1)
+        for column in range(math.floor(lon_min / tile_size),
+                            math.floor(lon_max / tile_size) + 1)
+    ]
+
+
+def tile_bbox(tile, tile_size=OSM_TILE_SIZE):
+    """Bounding box [lat_min, lon_min, lat_max, lon_max] of a tile."""
+    row, column = tile
+    return [round(row * tile_size, 7), round(column * tile_size, 7),
+            round((row + 1) * tile_size, 7),
+            round((column + 1) * tile_size, 7)]
+
+
+class TileCache:
+    """
+    Overpass responses of tiles, as JSON text. Tiles are kept in an
+    in-process LRU and, with a directory, in one file per tile shared by
+    the workers of the container.
+    """
+
+    def __init__(self, max_entries=256, ttl=None, directory=None):
+        """
+        max_entries: number of tiles kept in memory
+        ttl: time to live of the tiles in seconds (None: no expiry)
+        directory: directory of the disk cache (None: memory only)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Cached response of a tile, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored, text = entry
+                if self.ttl is None or stored + self.ttl >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return text
+                del self._entries[key]
+        text = self._load(key, now)
+        with self._lock:
+            if text is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return text
+
+    def set(self, key, text):
+        """Cache the response of a tile."""
+        self._remember(key, time.time(), text)
+        if self.directory:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}"
+            try:
+                with open(tmp_path, "w") as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                LOGGER.debug(f"Unable to write tile cache file: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses,
+                    "entries": len(self._entries)}
+
+    def _remember(self, key, stored, text):
+        with self._lock:
+            self._entries[key] = (stored, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return os.path.join(self.directory, f"{digest}.json")
+
+    def _load(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            stored = os.path.getmtime(path)
+            if self.ttl is not None and stored + self.ttl < now:
+                return None
+            with open(path) as f:
+                text = f.read()
+        except OSError:
+            return None
+        self._remember(key, stored, text)
+        return text
+
+
+def tile_cache_from_env():
+    """TileCache configured by the OSM_TILE_CACHE variables, or None."""
+    ttl = OSM_TILE_CACHE_TTL if OSM_TILE_CACHE_TTL > 0 else None
+    if OSM_TILE_CACHE == "memory":
+        return TileCache(OSM_TILE_CACHE_MAX_ENTRIES, ttl)
+    if OSM_TILE_CACHE == "disk":
+        return TileCache(OSM_TILE_CACHE_MAX_ENTRIES, ttl, OSM_TILE_CACHE_DIR)
+    if OSM_TILE_CACHE != "none":
+        LOGGER.warning(
+            f"Unknown OSM_TILE_CACHE '{OSM_TILE_CACHE}', tile cache disabled")
+    return None
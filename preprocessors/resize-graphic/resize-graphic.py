@@ -16,13 +16,11 @@
 
 import logging
 import time
-import base64
 import os
-from io import BytesIO
 from flask import Flask, request, jsonify
 from datetime import datetime
 from config.logging_utils import configure_logging
-from config.process_image import process_image
+from config.process_image import IMAGE_MIME_TYPES, resize_encoded_image
 from utils.validation import Validator
 
 configure_logging()
@@ -36,6 +34,20 @@ VALIDATOR = Validator(
     data_schema='./schemas/preprocessors/modify-request.schema.json'
 )
 
+MAX_GRAPHIC_DIMENSION = int(os.environ.get('MAX_GRAPHIC_DIMENSION', '2048'))
+# Format of resized graphics: PNG, WEBP or JPEG
+OUTPUT_FORMAT = os.environ.get('GRAPHIC_OUTPUT_FORMAT', 'PNG').upper()
+# Formats passed through unchanged when the graphic is small enough
+PASSTHROUGH_FORMATS = tuple(
+    f.strip().upper()
+    for f in os.environ.get('PASSTHROUGH_FORMATS', 'PNG').split(',')
+    if f.strip()
+)
+# zlib level of PNG output (0-9), lower is faster but larger
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', '6'))
+# Quality of WEBP and JPEG output (1-100)
+GRAPHIC_QUALITY = int(os.environ.get('GRAPHIC_QUALITY', '90'))
+
 
 @app.route("/preprocessor", methods=['POST'])
 def resize_graphic():
@@ -61,30 +73,31 @@ def resize_graphic():
     request_uuid = content["request_uuid"]
     timestamp = time.time()
 
-    # 2. Resize Image and convert to PNG
-    max_size = int(os.environ.get('MAX_GRAPHIC_DIMENSION', '2048'))
+    # 2. Resize Image and convert to OUTPUT_FORMAT, unless it is already
+    # small enough and in an accepted format
+    max_size = MAX_GRAPHIC_DIMENSION
     # Remove header (e.g. 'data:image/jpeg;base64,')
     graphic_data = content["graphic"]
     if ',' in graphic_data:
         graphic_data = graphic_data.split(',', 1)[1]
 
     try:
-        new_graphic = process_image(
+        encoded_data, graphic_format = resize_encoded_image(
             graphic_data,
             (max_size, max_size),
-            "PNG"
+            OUTPUT_FORMAT,
+            passthrough_formats=PASSTHROUGH_FORMATS,
+            png_compress_level=PNG_COMPRESS_LEVEL,
+            quality=GRAPHIC_QUALITY
         )
     except Exception as err:
         logging.error("Failed to process image")
         logging.debug(f"[image.process] {err}")
         return jsonify({"error": "Failed to process image"}), 422
 
-    # Convert image to base64 data URL format
-    buffer = BytesIO()
-    new_graphic.save(buffer, format='PNG')
-    buffer.seek(0)
-    encoded_data = base64.b64encode(buffer.getvalue()).decode('utf-8')
-    new_b64_graphic = f"data:image/png;base64,{encoded_data}"
+    # Build the base64 data URL
+    mime_type = IMAGE_MIME_TYPES[graphic_format]
+    new_b64_graphic = f"data:{mime_type};base64,{encoded_data}"
 
     data = {"graphic": new_b64_graphic}
 
@@ -14,7 +14,7 @@
 # If not, see
 # <https://github.com/Shared-Reality-Lab/IMAGE-server/blob/main/LICENSE>.
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import json
 import time
 import logging
@@ -24,6 +24,7 @@ from datetime import datetime
 from config.logging_utils import configure_logging
 from utils.llm import (
     LLMClient,
+    render_metrics,
     FOLLOWUP_PROMPT,
     FOLLOWUP_PROMPT_FOCUS
     )
@@ -43,7 +44,7 @@ with open(DATA_SCHEMA, 'r') as f:
 PREPROCESSOR_NAME = "ca.mcgill.a11y.image.preprocessor.text-followup"
 
 try:
-    llm_client = LLMClient()
+    llm_client = LLMClient(preprocessor=PREPROCESSOR_NAME)
     validator = Validator(data_schema=DATA_SCHEMA)
     logging.debug("LLM client and validator initialized")
 except Exception as e:
@@ -642,14 +643,27 @@ def history_stats():
 @app.route("/health", methods=["GET"])
 def health():
     """
-    Health check endpoint to verify if the service is running
+    Health check endpoint to verify if the service is running.
+    Reports "degraded" while the circuit breaker guarding the LLM backend
+    is not closed, in which case LLM requests fail fast.
     """
+    llm_health = llm_client.health()
+    breaker_closed = llm_health["circuit_breaker"]["state"] == "closed"
     return jsonify({
-        "status": "healthy",
-        "timestamp": datetime.now().isoformat()
+        "status": "healthy" if breaker_closed else "degraded",
+        "timestamp": datetime.now().isoformat(),
+        "llm": llm_health
     }), 200
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    LLM client metrics in the Prometheus text format
+    """
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
 @app.route("/warmup", methods=["GET"])
 def warmup():
     """
@@ -3,11 +3,13 @@ Image processing utilities.
 """
 
 from .qwen_resize import (
+    clear_resize_memo,
     decode_and_resize_image,
     get_image_dimensions
 )
 
 __all__ = [
+    'clear_resize_memo',
     'decode_and_resize_image',
     'get_image_dimensions'
-]
\ No newline at end of file
+]
@@ -19,35 +19,163 @@ Image processing utilities for Qwen-compatible image resizing and decoding.
 """
 
 import io
+import os
 import base64
+import hashlib
 import logging
+import threading
+from collections import OrderedDict
 from typing import Tuple, Optional
 from PIL import Image, UnidentifiedImageError
 from io import BytesIO
 from qwen_vl_utils import smart_resize
 
+# Codec of the resized image sent to the LLM: PNG, JPEG or WEBP
+QWEN_IMAGE_FORMAT = os.environ.get('QWEN_IMAGE_FORMAT', 'PNG').upper()
+# Quality of the lossy codecs (JPEG, WEBP)
+QWEN_IMAGE_QUALITY = int(os.environ.get('QWEN_IMAGE_QUALITY', '90'))
+# Total size of the resized images and encodings kept in memory, in MB
+# (0 disables the memo)
+QWEN_RESIZE_MEMO_MB = int(os.environ.get('QWEN_RESIZE_MEMO_MB', '64'))
+
+OUTPUT_FORMATS = ("PNG", "JPEG", "WEBP")
+
+
+class _ResizeMemo:
+    """
+    LRU of resized images and of their encodings, keyed by
+    (source digest, factor, min_pixels, max_pixels) and bounded by their
+    total size.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Maximum total size of the decoded images and of
+                their encodings (0 disables the memo)
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: tuple, entry: dict):
+        image = entry["image"]
+        entry["nbytes"] = (
+            image.width * image.height * len(image.getbands())
+            + sum(len(encoded) for encoded in entry["encoded"].values()))
+        if entry["nbytes"] > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous["nbytes"]
+            self._entries[key] = entry
+            self._nbytes += entry["nbytes"]
+            self._evict()
+
+    def add_encoding(
+        self, key: tuple, entry: dict, codec: tuple, encoded: str
+    ):
+        """Keep an encoding of the image of an entry."""
+        with self._lock:
+            if codec in entry["encoded"]:
+                return
+            entry["encoded"][codec] = encoded
+            entry["nbytes"] = entry.get("nbytes", 0) + len(encoded)
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+                self._nbytes += len(encoded)
+                self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def _evict(self):
+        # least recently used first; called with the lock held
+        while self._nbytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._nbytes -= evicted["nbytes"]
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the memoized images and encodings."""
+        return self._nbytes
+
+
+_memo = _ResizeMemo(QWEN_RESIZE_MEMO_MB * 1024 * 1024)
+
+
+def clear_resize_memo():
+    """Drop the resized images kept by decode_and_resize_image."""
+    _memo.clear()
+
+
+def _encode_image(image: Image.Image, output_format: str, quality: int) -> str:
+    buffer = io.BytesIO()
+    if output_format == "PNG":
+        image.save(buffer, format="PNG")
+    else:
+        image.save(buffer, format=output_format, quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
 
 def decode_and_resize_image(
     source: str,
     factor: int = 28,
     min_pixels: Optional[int] = None,
-    max_pixels: Optional[int] = None
-) -> Tuple[Optional[str], Optional[Image.Image], Optional[dict]]:
+    max_pixels: Optional[int] = None,
+    output_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    return_array: bool = False
+) -> Tuple[Optional[object], Optional[Image.Image], Optional[dict]]:
     """
     Decode base64 image data and resize it for Qwen model input.
 
+    The resized image and its encodings are memoized, so that resizing
+    the same graphic again in the process (e.g. for a second LLM request)
+    skips the decoding, the resize and the encoding.
+
     Args:
         source: Base64 encoded image string with data URI header
         factor: Resize factor for model input (default: 28 for Qwen)
         min_pixels: Minimum pixels for resize (optional)
         max_pixels: Maximum pixels for resize (optional)
+        output_format: Codec of the returned image, PNG, JPEG or WEBP
+            (default: QWEN_IMAGE_FORMAT)
+        quality: Quality of the JPEG and WEBP codecs
+            (default: QWEN_IMAGE_QUALITY)
+        return_array: Return the resized image as a NumPy RGB array
+            instead of encoding it
 
     Returns:
         Tuple of:
-        - Base64 encoded resized image
+        - Base64 encoded resized image (NumPy array if return_array)
         - PIL Image object (RGB format)
         - Error dict with message and code if failed, None if successful
     """
+    output_format = (output_format or QWEN_IMAGE_FORMAT).upper()
+    if output_format == "JPG":
+        output_format = "JPEG"
+    if quality is None:
+        quality = QWEN_IMAGE_QUALITY
+    if output_format not in OUTPUT_FORMATS:
+        error_msg = f"Unsupported output format: {output_format}"
+        logging.error(error_msg)
+        return None, None, {
+            "error": "Internal server error during image processing",
+            "code": 500
+            }
+
     try:
         # Validate input
         if not isinstance(source, str) or "," not in source:
@@ -57,6 +185,16 @@ def decode_and_resize_image(
 
         # Extract base64 data from data URI
         graphic_b64 = source.split(',', 1)[1]
+        memo_key = (
+            hashlib.sha256(graphic_b64.encode()).hexdigest(),
+            factor, min_pixels, max_pixels
+        )
+        entry = _memo.get(memo_key)
+        if entry is not None:
+            logging.debug("Using memoized resized image")
+            return _memo_result(
+                memo_key, entry, output_format, quality, return_array)
+
         img_data = base64.b64decode(graphic_b64)
         pil_image = Image.open(BytesIO(img_data))
 
@@ -84,14 +222,12 @@ def decode_and_resize_image(
             f"Resized image to model input size: {input_width}x{input_height}"
         )
 
-        # Convert resized image to base64
-        buffer = io.BytesIO()
-        pil_image_resized.save(buffer, format='PNG')
-        img_bytes = buffer.getvalue()
-        img_base64 = base64.b64encode(img_bytes).decode('utf-8')
+        entry = {"image": pil_image_resized, "encoded": {}}
+        _memo.set(memo_key, entry)
 
         # Return resized image (for SAM) and base64 (for LLM)
-        return img_base64, pil_image_resized, None
+        return _memo_result(
+            memo_key, entry, output_format, quality, return_array)
 
     except (ValueError, TypeError) as e:
         error_msg = f"Failed to decode base64 image data: {e}"
@@ -118,6 +254,32 @@ def decode_and_resize_image(
             }
 
 
+def _memo_result(
+    key: tuple,
+    entry: dict,
+    output_format: str,
+    quality: int,
+    return_array: bool
+) -> Tuple[object, Image.Image, None]:
+    """
+    Results of decode_and_resize_image from a memo entry, encoding the
+    image if that encoding was not requested before. The image is copied,
+    so that callers drawing on it do not alter the memoized one.
+    """
+    image = entry["image"]
+    if return_array:
+        # imported here as only the callers of this option need NumPy
+        import numpy as np
+        return np.array(image), image.copy(), None
+
+    codec = (output_format, quality if output_format != "PNG" else None)
+    encoded = entry["encoded"].get(codec)
+    if encoded is None:
+        encoded = _encode_image(image, output_format, quality)
+        _memo.add_encoding(key, entry, codec, encoded)
+    return encoded, image.copy(), None
+
+
 def get_image_dimensions(image: Image.Image) -> Tuple[int, int]:
     """
     Get image dimensions with validation.
@@ -2,13 +2,24 @@
 LLM utilities.
 """
 
-from .client import LLMClient
+from .client import LLMClient, LLMResponseError
+from .metrics import render_metrics
+from .graphic_description import (
+    GRAPHIC_DESCRIPTION_FUSED,
+    describe_graphic
+)
+from .cache import (
+    ResponseCache,
+    MemoryResponseCache,
+    DiskResponseCache
+)
 from .prompts import (
     MULTISTAGE_DIAGRAM_BASE_PROMPT,
     BOUNDING_BOX_PROMPT_TEMPLATE,
     BOUNDING_BOX_PROMPT_EXAMPLE,
     GRAPHIC_CAPTION_PROMPT,
     CATEGORISER_PROMPT,
+    GRAPHIC_DESCRIPTION_PROMPT,
     FOLLOWUP_PROMPT,
     FOLLOWUP_PROMPT_FOCUS,
     OBJECT_DETECTION_PROMPT
@@ -16,11 +27,19 @@ from .prompts import (
 
 __all__ = [
     'LLMClient',
+    'LLMResponseError',
+    'render_metrics',
+    'GRAPHIC_DESCRIPTION_FUSED',
+    'describe_graphic',
+    'ResponseCache',
+    'MemoryResponseCache',
+    'DiskResponseCache',
     'MULTISTAGE_DIAGRAM_BASE_PROMPT',
     'BOUNDING_BOX_PROMPT_TEMPLATE',
     'BOUNDING_BOX_PROMPT_EXAMPLE',
     'GRAPHIC_CAPTION_PROMPT',
     'CATEGORISER_PROMPT',
+    'GRAPHIC_DESCRIPTION_PROMPT',
     'FOLLOWUP_PROMPT',
     'FOLLOWUP_PROMPT_FOCUS',
     'OBJECT_DETECTION_PROMPT'
@@ -0,0 +1,278 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Response caches for LLMClient.
+Completions are keyed by a digest of the full request parameters
+(model, messages including images, schema and sampling parameters).
+"""
+
+import abc
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def request_digest(params: Dict[str, Any]) -> str:
+    """
+    Digest of the parameters of a chat completion request.
+
+    Args:
+        params: Parameters passed to chat.completions.create
+
+    Returns:
+        Hex digest identifying the request
+    """
+    encoded = json.dumps(
+        params, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResponseCache(abc.ABC):
+    """
+    Base class for LLM response caches.
+    Subclasses implement _load, _store and clear.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        """
+        Args:
+            ttl: Time to live of the entries in seconds (None: no expiry)
+        """
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached value for key, or None if missing/expired."""
+        value = None
+        try:
+            value = self._load(key)
+        except Exception as e:
+            logging.warning(f"LLM response cache read failed: {e}")
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]):
+        """Store a JSON-serializable value for key."""
+        expires = time.time() + self.ttl if self.ttl else None
+        try:
+            self._store(key, value, expires)
+        except Exception as e:
+            logging.warning(f"LLM response cache write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Hit and miss counters."""
+        return {"hits": self.hits, "misses": self.misses}
+
+    @abc.abstractmethod
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the value stored for key, or None if missing/expired."""
+
+    @abc.abstractmethod
+    def _store(
+        self,
+        key: str,
+        value: Dict[str, Any],
+        expires: Optional[float]
+    ):
+        """Store value for key, until the expires timestamp (None: never)."""
+
+    @abc.abstractmethod
+    def clear(self):
+        """Remove every entry."""
+
+
+class MemoryResponseCache(ResponseCache):
+    """In-process LRU cache."""
+
+    def __init__(self, max_entries: int = 256, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: Maximum number of cached responses
+            ttl: Time to live of the entries in seconds (None: no expiry)
+        """
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires is not None and expires < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _store(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DiskResponseCache(ResponseCache):
+    """
+    On-disk cache with one JSON file per entry, shared by the workers of
+    a container.
+    """
+
+    # Writes between two scans of the directory, which also account for
+    # the files written by the other workers
+    PRUNE_INTERVAL = 64
+    # Fraction of max_entries kept when the oldest files are removed, so
+    # that a full cache is not scanned again on the next write
+    PRUNE_TARGET = 0.9
+
+    def __init__(
+        self,
+        directory: str,
+        max_entries: int = 4096,
+        ttl: Optional[float] = None
+    ):
+        """
+        Args:
+            directory: Directory holding the cache files
+            max_entries: Maximum number of files kept; the oldest files
+                are removed when it is exceeded
+            ttl: Time to live of the entries in seconds (None: no expiry)
+        """
+        super().__init__(ttl)
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+        # Files in the directory, as counted by the last scan plus the
+        # files written by this process since
+        self._count = len(self._scan())
+        self._writes = 0
+        self._prune_lock = threading.Lock()
+
+    def _scan(self) -> list:
+        return [
+            e for e in os.scandir(self.directory) if e.name.endswith(".json")
+        ]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        expires = entry.get("expires")
+        if expires is not None and expires < time.time():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        return entry.get("value")
+
+    def _store(self, key, value, expires):
+        path = self._path(key)
+        added = not os.path.exists(path)
+        # write to a temporary file first so readers never see partial data
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"expires": expires, "value": value}, f)
+        os.replace(tmp_path, path)
+        with self._prune_lock:
+            self._count += added
+            self._writes += 1
+            due = (self._count > self.max_entries
+                   or self._writes >= self.PRUNE_INTERVAL)
+            if due:
+                self._writes = 0
+        if due:
+            self._prune()
+
+    def _prune(self):
+        """
+        Scan the directory and, if it holds more than max_entries files,
+        remove the oldest ones down to PRUNE_TARGET of max_entries.
+        """
+        entries = self._scan()
+        if len(entries) > self.max_entries:
+            keep = max(1, int(self.max_entries * self.PRUNE_TARGET))
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:len(entries) - keep]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+            entries = entries[len(entries) - keep:]
+        with self._prune_lock:
+            self._count = len(entries)
+
+    def clear(self):
+        for entry in self._scan():
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        with self._prune_lock:
+            self._count = 0
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """
+    Create the response cache configured by environment variables:
+        LLM_CACHE: "memory", "disk" or "none" (default: none)
+        LLM_CACHE_TTL: time to live in seconds (default: 3600, 0: no expiry)
+        LLM_CACHE_MAX_ENTRIES: maximum number of entries
+        LLM_CACHE_DIR: directory of the disk cache (default: /tmp/llm-cache)
+
+    Returns:
+        ResponseCache, or None if caching is disabled
+    """
+    backend = os.environ.get("LLM_CACHE", "none").lower()
+    ttl = float(os.environ.get("LLM_CACHE_TTL", "3600")) or None
+    max_entries = os.environ.get("LLM_CACHE_MAX_ENTRIES")
+
+    if backend == "memory":
+        return MemoryResponseCache(
+            max_entries=int(max_entries or 256), ttl=ttl
+        )
+    if backend == "disk":
+        return DiskResponseCache(
+            os.environ.get("LLM_CACHE_DIR", "/tmp/llm-cache"),
+            max_entries=int(max_entries or 4096),
+            ttl=ttl
+        )
+    if backend not in ("", "none"):
+        logging.warning(f"Unknown LLM_CACHE backend '{backend}', disabled")
+    return None
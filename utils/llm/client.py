@@ -17,13 +17,115 @@ Provides a generic interface for all LLM interactions.
 
 import os
 import json
+import asyncio
 import logging
+import threading
+import time
+import weakref
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from config.logging_utils import configure_logging
-from openai import OpenAI
-from typing import Optional, Dict, Any, Union
+from openai import (
+    OpenAI,
+    AsyncOpenAI,
+    APIStatusError,
+    DefaultHttpxClient,
+    DefaultAsyncHttpxClient
+)
+import httpx
+from types import SimpleNamespace
+from typing import Optional, Dict, Any, Iterator, List, Union
+from .metrics import METRICS
+from .prompts import SHARED_SYSTEM_PREAMBLE
+from .streaming import IncrementalJSONParser
+from .cache import ResponseCache, request_digest, response_cache_from_env
+from .resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    DEFAULT_BREAKER_COOLDOWN,
+    DEFAULT_BREAKER_THRESHOLD,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_BASE_DELAY,
+    DEFAULT_RETRY_MAX_DELAY,
+    DEFAULT_TIMEOUT,
+    backoff_delay,
+    is_retryable
+)
 
 configure_logging()
 
+# Maximum number of requests in flight per client, also the size of the
+# HTTP connection pool
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '8'))
+
+# Message layout: "legacy" (task instruction before the image) or
+# "canonical" (shared preamble and image first, task instruction last).
+# Canonical changes the prompts, so it is enabled per preprocessor.
+LLM_PROMPT_LAYOUT = os.environ.get('LLM_PROMPT_LAYOUT', 'legacy').lower()
+
+# Retry and circuit breaker policy (see resilience.py)
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', DEFAULT_TIMEOUT))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+LLM_RETRY_BASE_DELAY = float(
+    os.environ.get('LLM_RETRY_BASE_DELAY', DEFAULT_RETRY_BASE_DELAY)
+)
+LLM_RETRY_MAX_DELAY = float(
+    os.environ.get('LLM_RETRY_MAX_DELAY', DEFAULT_RETRY_MAX_DELAY)
+)
+LLM_BREAKER_THRESHOLD = int(
+    os.environ.get('LLM_BREAKER_THRESHOLD', DEFAULT_BREAKER_THRESHOLD)
+)
+LLM_BREAKER_COOLDOWN = float(
+    os.environ.get('LLM_BREAKER_COOLDOWN', DEFAULT_BREAKER_COOLDOWN)
+)
+
+
+def image_mime_type(image_base64: str) -> str:
+    """
+    MIME type of a base64 encoded image, from the encoding of its magic
+    number (PNG when it is not recognised, as sent so far).
+    """
+    if image_base64.startswith("/9j/"):
+        return "image/jpeg"
+    if image_base64.startswith("UklGR"):
+        return "image/webp"
+    return "image/png"
+
+
+@lru_cache(maxsize=4)
+def canonical_image_base64(image_base64: str) -> str:
+    """
+    Canonical encoding of a graphic for the LLM: the image produced by
+    utils.image_processing.decode_and_resize_image with its defaults
+    (PNG unless QWEN_IMAGE_FORMAT is set), which object-detection-llm
+    and multistage already send. Requests of
+    different preprocessors on the same graphic then carry identical
+    image bytes, a prerequisite for vLLM prefix caching.
+
+    Args:
+        image_base64: Base64 encoded image (without data URI prefix)
+
+    Returns:
+        Base64 encoded canonical image
+
+    Raises:
+        ValueError: if the image cannot be decoded
+    """
+    # imported here as only the callers of this function need qwen_vl_utils
+    from utils.image_processing import decode_and_resize_image
+
+    encoded, _, error = decode_and_resize_image(
+        f"data:image/png;base64,{image_base64}"
+    )
+    if error:
+        raise ValueError(error["error"])
+    return encoded
+
+
+class LLMResponseError(Exception):
+    """Raised when a response has no usable content."""
+
+
 class LLMClient:
     """Generic wrapper for OpenAI-compatible API clients."""
 
@@ -31,7 +133,14 @@ class LLMClient:
         self,
         api_key: Optional[str] = None,
         base_url: Optional[str] = None,
-        model: Optional[str] = None
+        model: Optional[str] = None,
+        cache: Optional[ResponseCache] = None,
+        max_concurrency: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        preprocessor: Optional[str] = None,
+        prompt_layout: Optional[str] = None
     ):
         """
         Initialize the LLM client with configuration from environment
@@ -41,10 +150,42 @@ class LLMClient:
             api_key: API key for the LLM service (defaults to env LLM_API_KEY)
             base_url: Base URL for the API (defaults to env LLM_URL)
             model: Model name to use (defaults to env LLM_MODEL)
+            cache: Response cache for deterministic completions
+                (defaults to the cache configured by env LLM_CACHE)
+            max_concurrency: Maximum number of concurrent requests
+                (defaults to env LLM_MAX_CONCURRENCY, or 8)
+            timeout: Default deadline of a chat completion in seconds,
+                retries included (defaults to env LLM_TIMEOUT, or 20)
+            max_retries: Retries of transient errors
+                (defaults to env LLM_MAX_RETRIES, or 2)
+            breaker: Circuit breaker guarding the backend (defaults to one
+                configured by env LLM_BREAKER_THRESHOLD and
+                LLM_BREAKER_COOLDOWN)
+            preprocessor: Name of the calling preprocessor, used to label
+                the metrics (defaults to env LLM_CLIENT_NAME)
+            prompt_layout: "legacy" or "canonical" message layout
+                (defaults to env LLM_PROMPT_LAYOUT, or legacy)
         """
         self.api_key = api_key or os.environ.get('LLM_API_KEY')
         self.base_url = base_url or os.environ.get('LLM_URL')
         self.model = model or os.environ.get('LLM_MODEL')
+        self.cache = cache if cache is not None else response_cache_from_env()
+        self.max_concurrency = max(1, max_concurrency or LLM_MAX_CONCURRENCY)
+        self.timeout = timeout or LLM_TIMEOUT
+        self.max_retries = (
+            LLM_MAX_RETRIES if max_retries is None else max_retries
+        )
+        self.breaker = breaker or CircuitBreaker(
+            LLM_BREAKER_THRESHOLD, LLM_BREAKER_COOLDOWN
+        )
+        self.preprocessor = preprocessor or \
+            os.environ.get('LLM_CLIENT_NAME', 'unknown')
+        self.prompt_layout = (prompt_layout or LLM_PROMPT_LAYOUT).lower()
+        if self.prompt_layout not in ("legacy", "canonical"):
+            logging.warning(
+                f"Unknown prompt layout '{self.prompt_layout}', using legacy"
+            )
+            self.prompt_layout = "legacy"
 
         if not self.api_key:
             logging.error("LLM API key not provided or found in environment")
@@ -55,15 +196,59 @@ class LLMClient:
         logging.debug(f"API Key starts with: {self.api_key[:5]}...")
 
         try:
+            # retries are handled by _create, not by the OpenAI client
             self.client = OpenAI(
                 api_key=self.api_key,
-                base_url=self.base_url
+                base_url=self.base_url,
+                timeout=self.timeout,
+                max_retries=0,
+                http_client=DefaultHttpxClient(limits=self._pool_limits())
             )
             logging.debug("OpenAI client initialized successfully")
         except Exception as e:
             logging.error(f"Failed to initialize OpenAI client: {e}")
             raise
 
+        # created on first use of the batched/async APIs; the connection
+        # pool of an AsyncOpenAI client is bound to the event loop it was
+        # first used in, so there is one client per loop
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._async_clients_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    def _pool_limits(self) -> httpx.Limits:
+        """Connection pool limits shared by the requests of this client."""
+        return httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        AsyncOpenAI client of the running event loop, used by the async
+        methods. Each loop (e.g. each asyncio.run in a Flask handler)
+        gets its own client, and those of closed loops are dropped.
+        """
+        loop = asyncio.get_running_loop()
+        with self._async_clients_lock:
+            for closed in [lp for lp in self._async_clients if lp.is_closed()]:
+                del self._async_clients[closed]
+            client = self._async_clients.get(loop)
+            if client is None:
+                client = AsyncOpenAI(
+                    api_key=self.api_key,
+                    base_url=self.base_url,
+                    timeout=self.timeout,
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(
+                        limits=self._pool_limits()
+                    )
+                )
+                self._async_clients[loop] = client
+        return client
+
     def chat_completion(
         self,
         prompt: str,
@@ -76,6 +261,8 @@ class LLMClient:
         system_prompt: Optional[str] = None,
         parse_json: bool = False,
         return_token_info=False,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
         **kwargs
     ) -> Union[str, Dict[str, Any], None]:
         """
@@ -95,7 +282,16 @@ class LLMClient:
             system_prompt: Optional system message
             parse_json: If True, attempt to parse response as JSON
             return_token_info: If True, return tuple of (response, token_info)
-            **kwargs: Additional parameters to pass to the API
+            use_cache: If True and a response cache is configured, reuse
+                the response to an identical request made with
+                temperature 0
+            timeout: Deadline of the call in seconds, retries included
+                (defaults to the client's timeout)
+            **kwargs: Additional parameters to pass to the API, and
+                canonical_image: if True and the client uses the
+                canonical layout, the image is re-encoded with
+                canonical_image_base64 so that every preprocessor sends
+                the same bytes for the same graphic
 
         Returns:
             - String response if parse_json=False
@@ -103,23 +299,630 @@ class LLMClient:
             - None if the request fails
         """
         try:
-            # compose response format from Pydantic model if provided
-            if json_schema:
-                # Set up structured output response format
-                response_format = {
-                    "type": "json_schema",
-                    "json_schema": {
-                        "name": schema_name,
-                        "schema": json_schema
-                    }
+            return self._complete(
+                prompt, image_base64, json_schema, schema_name, temperature,
+                max_tokens, response_format, system_prompt, parse_json,
+                return_token_info, use_cache, timeout, **kwargs
+            )
+        except Exception as e:
+            self._log_failure(e, "chat_completion")
+            return None
+
+    def _complete(
+        self,
+        prompt: str,
+        image_base64: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        schema_name: str = "response-format",
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        system_prompt: Optional[str] = None,
+        parse_json: bool = False,
+        return_token_info=False,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+        invalid_json_error: bool = False,
+        **kwargs
+    ):
+        """
+        chat_completion, raising its errors instead of returning None.
+        With invalid_json_error, a response that is parsed as JSON (with
+        parse_json or json_schema) and is not valid JSON is an error too.
+
+        Raises:
+            CircuitOpenError: if the circuit breaker rejects the request
+            LLMResponseError: if the response has no usable content
+            The API error if every attempt failed
+        """
+        params, parse_json = self._build_params(
+            prompt, image_base64, json_schema, schema_name, temperature,
+            max_tokens, response_format, system_prompt, parse_json,
+            **kwargs
+        )
+        cache_key, cached = self._lookup_cache(params, use_cache)
+
+        if cached is not None:
+            response_text, usage = cached["text"], cached["usage"]
+        else:
+            logging.debug(f"Making LLM request to model: {self.model}")
+            response = self._create(params, timeout)
+            logging.pii(response)
+            response_text, usage = self._extract_response(response)
+            if response_text is None:
+                raise LLMResponseError("LLM response has no usable content")
+
+        return self._finish(
+            response_text, usage, parse_json, cache_key, cached,
+            return_token_info, invalid_json_error
+        )
+
+    async def achat_completion(
+        self,
+        prompt: str,
+        image_base64: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        schema_name: str = "response-format",
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        system_prompt: Optional[str] = None,
+        parse_json: bool = False,
+        return_token_info=False,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Union[str, Dict[str, Any], None]:
+        """
+        Asyncio version of chat_completion, with the same arguments
+        and return values.
+        """
+        try:
+            return await self._acomplete(
+                prompt, image_base64, json_schema, schema_name, temperature,
+                max_tokens, response_format, system_prompt, parse_json,
+                return_token_info, use_cache, timeout, **kwargs
+            )
+        except Exception as e:
+            self._log_failure(e, "achat_completion")
+            return None
+
+    async def _acomplete(
+        self,
+        prompt: str,
+        image_base64: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        schema_name: str = "response-format",
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        system_prompt: Optional[str] = None,
+        parse_json: bool = False,
+        return_token_info=False,
+        use_cache: bool = True,
+        timeout: Optional[float] = None,
+        invalid_json_error: bool = False,
+        **kwargs
+    ):
+        """Asyncio version of _complete."""
+        params, parse_json = self._build_params(
+            prompt, image_base64, json_schema, schema_name, temperature,
+            max_tokens, response_format, system_prompt, parse_json,
+            **kwargs
+        )
+        cache_key, cached = self._lookup_cache(params, use_cache)
+
+        if cached is not None:
+            response_text, usage = cached["text"], cached["usage"]
+        else:
+            logging.debug(f"Making LLM request to model: {self.model}")
+            response = await self._acreate(params, timeout)
+            logging.pii(response)
+            response_text, usage = self._extract_response(response)
+            if response_text is None:
+                raise LLMResponseError("LLM response has no usable content")
+
+        return self._finish(
+            response_text, usage, parse_json, cache_key, cached,
+            return_token_info, invalid_json_error
+        )
+
+    def _log_failure(self, error: Exception, method: str):
+        """Log an error raised by _complete or _acomplete."""
+        if isinstance(error, CircuitOpenError):
+            logging.warning(f"LLM request rejected: {error}")
+        elif isinstance(error, LLMResponseError):
+            # the reason was logged by _validate_response
+            logging.error(f"Error in {method}: {error}")
+        else:
+            logging.error(
+                f"Error in {method}: {error}",
+                exc_info=(type(error), error, error.__traceback__)
+            )
+
+    def chat_completion_stream(
+        self,
+        prompt: str,
+        image_base64: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        schema_name: str = "response-format",
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        response_format: Optional[Dict[str, str]] = None,
+        system_prompt: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Streaming version of chat_completion, yielding the text of the
+        completion as it is generated. Streamed responses are not cached.
+
+        Closing the generator early (e.g. breaking out of the loop) closes
+        the connection, which makes vLLM abort the generation.
+
+        Args:
+            Same as chat_completion; timeout is the deadline of the
+            whole stream
+
+        Yields:
+            Chunks of the completion text. On failure the error is logged
+            and the generator stops.
+        """
+        try:
+            params, _ = self._build_params(
+                prompt, image_base64, json_schema, schema_name, temperature,
+                max_tokens, response_format, system_prompt, False,
+                **kwargs
+            )
+        except Exception as e:
+            logging.error(f"Error in chat_completion_stream: {e}")
+            return
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
+        deadline = time.monotonic() + (timeout or self.timeout)
+        self.last_token_usage = None
+
+        logging.debug(f"Streaming LLM request to model: {self.model}")
+        start = self._request_started(params)
+        stream = None
+        usage = None
+        first_token = True
+        try:
+            # retries only happen before the first chunk is received
+            stream = self._send(params, timeout)
+            for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    if first_token:
+                        METRICS.observe(
+                            "llm_time_to_first_token_seconds",
+                            time.monotonic() - start,
+                            preprocessor=self.preprocessor
+                        )
+                        first_token = False
+                    yield text
+                if time.monotonic() > deadline:
+                    raise TimeoutError("LLM stream deadline exceeded")
+        except GeneratorExit:
+            # closed by the caller before the end of the completion
+            self._request_finished(
+                start, response=SimpleNamespace(usage=usage)
+            )
+            raise
+        except CircuitOpenError as e:
+            self._request_finished(start, error=e)
+            logging.warning(f"LLM request rejected: {e}")
+            return
+        except Exception as e:
+            self._request_finished(start, error=e)
+            logging.error(f"Error in chat_completion_stream: {e}",
+                          exc_info=True)
+            return
+        finally:
+            if stream is not None:
+                stream.close()
+
+        # only reached if the stream was consumed to the end
+        if usage is not None:
+            self.last_token_usage = {
+                'prompt_tokens': usage.prompt_tokens,
+                'completion_tokens': usage.completion_tokens,
+                'total_tokens': usage.total_tokens
+            }
+        self._request_finished(start, response=SimpleNamespace(usage=usage))
+
+    def chat_completion_json_stream(
+        self,
+        prompt: str,
+        image_base64: Optional[str] = None,
+        json_schema: Optional[Dict[str, Any]] = None,
+        max_items: Optional[int] = None,
+        items_key: Optional[str] = None,
+        **kwargs
+    ) -> Optional[Any]:
+        """
+        Stream a JSON completion and stop the generation as soon as the
+        JSON document is complete, or once max_items items have been
+        generated, instead of waiting for the model to end its turn.
+
+        Args:
+            prompt: The main prompt text
+            image_base64: Optional base64 encoded image
+            json_schema: Optional JSON schema for structured output
+            max_items: Stop after this many items of the watched array,
+                and return the items generated so far
+            items_key: Key of the watched array in the top-level object
+                (None watches a top-level array)
+            **kwargs: Other arguments of chat_completion_stream
+
+        Returns:
+            Parsed JSON, or None if the request fails or the completion
+            is not valid JSON
+        """
+        parser = IncrementalJSONParser(max_items, items_key)
+        stream = self.chat_completion_stream(
+            prompt, image_base64=image_base64, json_schema=json_schema,
+            **kwargs
+        )
+        try:
+            for text in stream:
+                if parser.feed(text):
+                    break
+        finally:
+            stream.close()
+
+        if parser.truncated:
+            logging.debug(
+                f"Stopped LLM generation after {parser.item_count} items"
+            )
+        elif parser.complete:
+            logging.debug("Stopped LLM generation at end of JSON document")
+        result = parser.result()
+        if result is None and parser.text:
+            METRICS.inc(
+                "llm_json_parse_failures_total",
+                preprocessor=self.preprocessor
+            )
+            logging.pii(f"Response that failed to parse: {parser.text}")
+        elif result is not None:
+            logging.pii(f"Parsed JSON: {result}")
+        return result
+
+    def chat_completion_many(
+        self,
+        requests: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None
+    ) -> List[Union[str, Dict[str, Any], tuple, Exception]]:
+        """
+        Run several independent chat completions concurrently.
+
+        Args:
+            requests: List of keyword arguments for chat_completion,
+                e.g. [{"prompt": ..., "image_base64": ...}, ...]
+            max_concurrency: Maximum number of requests in flight
+                (defaults to the client's max_concurrency)
+
+        Returns:
+            List with the result of chat_completion for each request, in
+            the order of the requests. A failed request gives the
+            exception that made it fail (e.g. CircuitOpenError, an API
+            error or LLMResponseError) instead of None, without affecting
+            the others. Pass return_token_info=True in the requests to get
+            per-request token usage, as last_token_usage is shared by the
+            concurrent calls.
+        """
+        if not requests:
+            return []
+        limit = min(max_concurrency or self.max_concurrency,
+                    self.max_concurrency)
+        logging.debug(
+            f"Running {len(requests)} LLM requests, {limit} at a time"
+        )
+
+        if limit == 1 or len(requests) == 1:
+            return [self._complete_item(r) for r in requests]
+
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix="llm"
+                )
+
+        semaphore = threading.Semaphore(limit)
+
+        def run(request):
+            with semaphore:
+                return self._complete_item(request)
+
+        futures = [self._executor.submit(run, r) for r in requests]
+        return [f.result() for f in futures]
+
+    def _complete_item(self, request: Dict[str, Any]):
+        """Result of a request of chat_completion_many, or its error."""
+        try:
+            return self._complete(**request, invalid_json_error=True)
+        except Exception as e:
+            self._log_failure(e, "chat_completion_many")
+            return e
+
+    async def achat_completion_many(
+        self,
+        requests: List[Dict[str, Any]],
+        max_concurrency: Optional[int] = None
+    ) -> List[Union[str, Dict[str, Any], tuple, Exception]]:
+        """
+        Asyncio version of chat_completion_many, with the same arguments
+        and return values.
+        """
+        limit = min(max_concurrency or self.max_concurrency,
+                    self.max_concurrency)
+        semaphore = asyncio.Semaphore(limit)
+
+        async def run(request):
+            async with semaphore:
+                try:
+                    return await self._acomplete(
+                        **request, invalid_json_error=True)
+                except Exception as e:
+                    self._log_failure(e, "achat_completion_many")
+                    return e
+
+        return list(await asyncio.gather(*(run(r) for r in requests)))
+
+    def _create(self, params: Dict[str, Any], timeout: Optional[float]):
+        """Send a chat completion request and record its metrics."""
+        start = self._request_started(params)
+        try:
+            response = self._send(params, timeout)
+        except Exception as e:
+            self._request_finished(start, error=e)
+            raise
+        self._request_finished(start, response=response)
+        return response
+
+    async def _acreate(self, params: Dict[str, Any], timeout: Optional[float]):
+        """Asyncio version of _create."""
+        start = self._request_started(params)
+        try:
+            response = await self._asend(params, timeout)
+        except Exception as e:
+            self._request_finished(start, error=e)
+            raise
+        self._request_finished(start, response=response)
+        return response
+
+    def _request_started(self, params: Dict[str, Any]) -> float:
+        """
+        Record the image payload of a request.
+
+        Returns:
+            Start time of the request
+        """
+        image_bytes = 0
+        for message in params.get("messages", []):
+            content = message.get("content")
+            if not isinstance(content, list):
+                continue
+            for part in content:
+                if part.get("type") == "image_url":
+                    image_bytes += len(part["image_url"].get("url", ""))
+        if image_bytes:
+            METRICS.inc(
+                "llm_image_payload_bytes_total", image_bytes,
+                preprocessor=self.preprocessor
+            )
+        return time.monotonic()
+
+    def _request_finished(self, start: float, response=None, error=None):
+        """Record the outcome, duration and token usage of a request."""
+        if isinstance(error, CircuitOpenError):
+            outcome = "rejected"
+        else:
+            outcome = "error" if error is not None else "ok"
+        METRICS.inc(
+            "llm_requests_total",
+            preprocessor=self.preprocessor, outcome=outcome
+        )
+        if outcome == "rejected":
+            return
+        METRICS.observe(
+            "llm_request_duration_seconds", time.monotonic() - start,
+            preprocessor=self.preprocessor, outcome=outcome
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            METRICS.inc(
+                "llm_prompt_tokens_total", usage.prompt_tokens or 0,
+                preprocessor=self.preprocessor
+            )
+            METRICS.inc(
+                "llm_completion_tokens_total", usage.completion_tokens or 0,
+                preprocessor=self.preprocessor
+            )
+
+    def _send(self, params: Dict[str, Any], timeout: Optional[float]):
+        """
+        Send a chat completion request, retrying transient errors with
+        jittered exponential backoff until the deadline.
+
+        Raises:
+            CircuitOpenError: if the circuit breaker rejects the request
+            The last API error if every attempt failed
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            remaining = self._check_attempt(deadline)
+            recorded = False
+            try:
+                response = self.client.chat.completions.create(
+                    timeout=remaining, **params
+                )
+                self.breaker.record_success()
+                recorded = True
+                return response
+            except Exception as e:
+                recorded = True
+                delay = self._on_error(e, attempt, deadline)
+            finally:
+                if not recorded:
+                    # interrupted (e.g. KeyboardInterrupt): the attempt
+                    # says nothing about the backend
+                    self.breaker.release()
+            time.sleep(delay)
+            attempt += 1
+
+    async def _asend(self, params: Dict[str, Any], timeout: Optional[float]):
+        """Asyncio version of _send."""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            remaining = self._check_attempt(deadline)
+            recorded = False
+            try:
+                response = await self.async_client.chat.completions.create(
+                    timeout=remaining, **params
+                )
+                self.breaker.record_success()
+                recorded = True
+                return response
+            except Exception as e:
+                recorded = True
+                delay = self._on_error(e, attempt, deadline)
+            finally:
+                if not recorded:
+                    # cancelled (asyncio.CancelledError): the attempt
+                    # says nothing about the backend
+                    self.breaker.release()
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def _check_attempt(self, deadline: float) -> float:
+        """
+        Check that another attempt may be made. The deadline is checked
+        first, as a request allowed by a half-open breaker is its probe
+        and must be followed by record_success, record_failure or release.
+
+        Returns:
+            Seconds left before the deadline
+        """
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("LLM request deadline exceeded")
+        if not self.breaker.allow():
+            raise CircuitOpenError(
+                "circuit breaker is open, LLM backend marked unhealthy"
+            )
+        return remaining
+
+    def _on_error(
+        self,
+        error: Exception,
+        attempt: int,
+        deadline: float
+    ) -> float:
+        """
+        Record a failed attempt and decide whether to retry it.
+
+        Returns:
+            Delay before the next attempt
+
+        Raises:
+            The error if it is not retried
+        """
+        if not is_retryable(error):
+            if isinstance(error, APIStatusError):
+                # the backend answered, so it is up
+                self.breaker.record_success()
+            else:
+                self.breaker.release()
+            raise error
+        self.breaker.record_failure()
+        delay = backoff_delay(
+            attempt, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+        )
+        if attempt >= self.max_retries or \
+                time.monotonic() + delay >= deadline:
+            raise error
+        logging.warning(
+            f"LLM request failed ({type(error).__name__}), retrying in "
+            f"{delay:.2f}s ({attempt + 1}/{self.max_retries})"
+        )
+        return delay
+
+    def health(self) -> Dict[str, Any]:
+        """
+        State of the circuit breaker guarding the LLM backend,
+        for the health endpoints of the preprocessors.
+        """
+        return {"circuit_breaker": self.breaker.status()}
+
+    def _build_params(
+        self,
+        prompt: str,
+        image_base64: Optional[str],
+        json_schema: Optional[Dict[str, Any]],
+        schema_name: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        response_format: Optional[Dict[str, str]],
+        system_prompt: Optional[str],
+        parse_json: bool,
+        **kwargs
+    ) -> tuple:
+        """
+        Build the parameters of a chat.completions.create call.
+
+        Returns:
+            Tuple of (params, parse_json)
+        """
+        # compose response format from Pydantic model if provided
+        if json_schema:
+            # Set up structured output response format
+            response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": schema_name,
+                    "schema": json_schema
                 }
+            }
 
-                # parse output JSON
-                parse_json = True
+            # parse output JSON
+            parse_json = True
 
-            # Build messages list
-            messages = []
+        # only useful to share the prefix of the canonical layout
+        if kwargs.pop("canonical_image", False) and image_base64 and \
+                self.prompt_layout == "canonical":
+            image_base64 = canonical_image_base64(image_base64)
 
+        if image_base64:
+            image_content = {
+                "type": "image_url",
+                "image_url": {
+                    "url": f"data:{image_mime_type(image_base64)};"
+                           f"base64,{image_base64}"
+                }
+            }
+
+        # Build messages list
+        messages = []
+
+        if self.prompt_layout == "canonical":
+            # shared preamble and image first, so that requests on the same
+            # graphic share a token prefix; task instruction last
+            messages.append(
+                {"role": "system", "content": SHARED_SYSTEM_PREAMBLE}
+            )
+            user_content = [image_content] if image_base64 else []
+            text = f"{system_prompt}\n\n{prompt}" if system_prompt \
+                else prompt
+            user_content.append({"type": "text", "text": text})
+        else:
             # Add system prompt if provided
             if system_prompt:
                 messages.append(
@@ -133,62 +936,113 @@ class LLMClient:
 
             # Add image if provided
             if image_base64:
-                user_content.append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{image_base64}"
-                    }
-                })
-
-            messages.append({"role": "user", "content": user_content})
-
-            logging.pii(messages)
-
-            # Build API call parameters
-            params = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": temperature
-            }
+                user_content.append(image_content)
 
-            # Add optional parameters
-            if max_tokens:
-                params["max_tokens"] = max_tokens
-            if response_format:
-                params["response_format"] = response_format
+        messages.append({"role": "user", "content": user_content})
 
-            # Add any additional kwargs
-            params.update(kwargs)
+        logging.pii(messages)
 
-            logging.debug(f"Making LLM request to model: {self.model}")
-            response = self.client.chat.completions.create(**params)
-            logging.pii(response)
+        # Build API call parameters
+        params = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": temperature
+        }
 
-            # Validate and extract response
-            response_text = self._validate_response(response)
-            if response_text is None:
-                return None
+        # Add optional parameters
+        if max_tokens:
+            params["max_tokens"] = max_tokens
+        if response_format:
+            params["response_format"] = response_format
 
-            # Parse JSON if requested
-            if parse_json:
-                result = self._parse_json_response(response_text)
-            else:
-                result = response_text
+        # Add any additional kwargs
+        params.update(kwargs)
 
-            self.last_token_usage = {
-                'prompt_tokens': response.usage.prompt_tokens,
-                'completion_tokens': response.usage.completion_tokens,
-                'total_tokens': response.usage.total_tokens
-            }
+        return params, parse_json
 
-            if return_token_info:
-                return result, self.last_token_usage
-            else:
-                return result
+    def _lookup_cache(self, params: Dict[str, Any], use_cache: bool) -> tuple:
+        """
+        Look up a request in the response cache.
+        Only deterministic completions are served from the cache.
 
-        except Exception as e:
-            logging.error(f"Error in chat_completion: {e}", exc_info=True)
+        Returns:
+            Tuple of (cache key or None, cached entry or None)
+        """
+        if not use_cache or self.cache is None or params.get("temperature"):
+            return None, None
+        cache_key = request_digest(params)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            logging.debug("Using cached LLM response")
+            METRICS.inc(
+                "llm_requests_total",
+                preprocessor=self.preprocessor, outcome="cached"
+            )
+        return cache_key, cached
+
+    def _extract_response(self, response) -> tuple:
+        """
+        Validate a response and extract its text and token usage.
+
+        Returns:
+            Tuple of (response text or None, token usage dict)
+        """
+        response_text = self._validate_response(response)
+        if response_text is None:
+            return None, None
+        usage = {
+            'prompt_tokens': response.usage.prompt_tokens,
+            'completion_tokens': response.usage.completion_tokens,
+            'total_tokens': response.usage.total_tokens
+        }
+        return response_text, usage
+
+    def _finish(
+        self,
+        response_text: str,
+        usage: Dict[str, int],
+        parse_json: bool,
+        cache_key: Optional[str],
+        cached: Optional[Dict[str, Any]],
+        return_token_info: bool,
+        invalid_json_error: bool = False
+    ):
+        """
+        Parse a response, store it in the cache and build the result.
+
+        Raises:
+            LLMResponseError: if invalid_json_error and the response to
+                parse is not valid JSON
+        """
+        self.last_token_usage = usage
+
+        # Parse JSON if requested
+        if parse_json:
+            result = self._parse_json_response(response_text)
+            if result is None and invalid_json_error:
+                raise LLMResponseError("LLM response is not valid JSON")
+        else:
+            result = response_text
+
+        # Cache responses that could be used, i.e. parsed if requested
+        if cache_key is not None and cached is None and result is not None:
+            self.cache.set(cache_key, {"text": response_text, "usage": usage})
+
+        if return_token_info:
+            return result, usage
+        else:
+            return result
+
+    def cache_stats(self) -> Optional[Dict[str, int]]:
+        """
+        Hit and miss counters of the response cache.
+
+        Returns:
+            Dict with 'hits' and 'misses', or None if caching is disabled
+        """
+        if self.cache is None:
             return None
+        return self.cache.stats()
 
     def _validate_response(self, response) -> Optional[str]:
         """
@@ -260,6 +1114,10 @@ class LLMClient:
             return parsed_json
 
         except json.JSONDecodeError as e:
+            METRICS.inc(
+                "llm_json_parse_failures_total",
+                preprocessor=self.preprocessor
+            )
             logging.error(f"Failed to decode JSON response: {e}")
             logging.pii(f"Response that failed to parse: {response_text}")
             return None
@@ -294,7 +1152,8 @@ class LLMClient:
                 prompt="Describe this image in one word.",
                 image_base64=dummy_base64,
                 temperature=0.1,
-                max_tokens=10
+                max_tokens=10,
+                use_cache=False
             )
 
             if response:
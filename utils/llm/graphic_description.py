@@ -0,0 +1,193 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Categories and caption of a graphic from a single LLM request, shared by
+the content-categoriser and graphic-caption preprocessors.
+
+Both preprocessors receive the same graphic for every request. In fused
+mode the first one to ask sends one structured-output request returning
+both the categories and the caption, and stores the answer in a small
+cache. The second one is then served from the cache, so the image is only
+prefilled once. With a cache directory on a volume shared by the two
+containers, a lock makes the second preprocessor wait for the first
+request rather than sending its own.
+"""
+
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from .cache import (
+    DiskResponseCache,
+    MemoryResponseCache,
+    ResponseCache,
+    request_digest
+)
+from .prompts import GRAPHIC_DESCRIPTION_PROMPT
+
+# Use the fused request in content-categoriser and graphic-caption
+GRAPHIC_DESCRIPTION_FUSED = os.environ.get(
+    'GRAPHIC_DESCRIPTION_FUSED', 'false'
+).lower() == 'true'
+# Directory shared by the two preprocessors (default: in-memory cache)
+GRAPHIC_DESCRIPTION_CACHE_DIR = os.environ.get('GRAPHIC_DESCRIPTION_CACHE_DIR')
+# Time to live of the descriptions, in seconds
+GRAPHIC_DESCRIPTION_CACHE_TTL = float(
+    os.environ.get('GRAPHIC_DESCRIPTION_CACHE_TTL', '600')
+)
+
+if GRAPHIC_DESCRIPTION_FUSED and not GRAPHIC_DESCRIPTION_CACHE_DIR:
+    # Without a shared cache, each preprocessor would send the larger
+    # fused request on its own
+    logging.warning(
+        "GRAPHIC_DESCRIPTION_FUSED requires GRAPHIC_DESCRIPTION_CACHE_DIR "
+        "on a volume shared by content-categoriser and graphic-caption; "
+        "fused mode disabled"
+    )
+    GRAPHIC_DESCRIPTION_FUSED = False
+
+CATEGORISER_SCHEMA_PATH = \
+    './schemas/preprocessors/content-categoriser.schema.json'
+
+_cache: Optional[ResponseCache] = None
+_categoriser_schema: Optional[Dict[str, Any]] = None
+_lock = threading.Lock()
+_key_locks = [threading.Lock() for _ in range(16)]
+
+
+def _get_cache() -> ResponseCache:
+    global _cache
+    with _lock:
+        if _cache is None:
+            if GRAPHIC_DESCRIPTION_CACHE_DIR:
+                _cache = DiskResponseCache(
+                    GRAPHIC_DESCRIPTION_CACHE_DIR,
+                    max_entries=256,
+                    ttl=GRAPHIC_DESCRIPTION_CACHE_TTL
+                )
+            else:
+                _cache = MemoryResponseCache(
+                    max_entries=32, ttl=GRAPHIC_DESCRIPTION_CACHE_TTL
+                )
+        return _cache
+
+
+@contextmanager
+def _single_flight(cache: ResponseCache, key: str):
+    """
+    Serialize the computation of a description, across the processes
+    sharing a disk cache.
+    """
+    if isinstance(cache, DiskResponseCache):
+        # a few lock files shared by all keys, so they do not accumulate
+        path = os.path.join(cache.directory, f"lock-{key[:2]}")
+        with open(path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        with _key_locks[int(key[:2], 16) % len(_key_locks)]:
+            yield
+
+
+def _default_categoriser_schema() -> Dict[str, Any]:
+    """The schema at CATEGORISER_SCHEMA_PATH, read once."""
+    global _categoriser_schema
+    with _lock:
+        if _categoriser_schema is None:
+            with open(CATEGORISER_SCHEMA_PATH, 'r') as f:
+                _categoriser_schema = json.load(f)
+        return _categoriser_schema
+
+
+def description_schema(categoriser_schema: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    JSON schema of the fused answer: the categories of the
+    content-categoriser schema and a caption.
+    """
+    return {
+        "type": "object",
+        "properties": {
+            "categories": categoriser_schema["properties"]["categories"],
+            "caption": {"type": "string"}
+        },
+        "required": ["categories", "caption"]
+    }
+
+
+def describe_graphic(
+    llm_client,
+    image_base64: str,
+    categoriser_schema: Optional[Dict[str, Any]] = None
+) -> Optional[Dict[str, Any]]:
+    """
+    Get the categories and caption of a graphic, from the cache or from
+    a single LLM request.
+
+    Args:
+        llm_client: LLMClient
+        image_base64: Base64 encoded graphic (without data URI prefix)
+        categoriser_schema: content-categoriser data schema (defaults to
+            the one at CATEGORISER_SCHEMA_PATH, read once)
+
+    Returns:
+        Dict with "categories" (category -> bool) and "caption",
+        or None if the request fails
+    """
+    if categoriser_schema is None:
+        categoriser_schema = _default_categoriser_schema()
+    categories = categoriser_schema["properties"]["categories"]
+    prompt = GRAPHIC_DESCRIPTION_PROMPT.format(
+        categories=list(categories.get("properties", {}).keys())
+    )
+    schema = description_schema(categoriser_schema)
+
+    key = request_digest({
+        "model": llm_client.model,
+        "prompt": prompt,
+        "schema": schema,
+        "image": hashlib.sha256(image_base64.encode()).hexdigest()
+    })
+    cache = _get_cache()
+
+    with _single_flight(cache, key):
+        description = cache.get(key)
+        if description is not None:
+            logging.debug("Using cached graphic description")
+            return description
+
+        description = llm_client.chat_completion(
+            prompt=prompt,
+            image_base64=image_base64,
+            json_schema=schema,
+            schema_name="graphic-description",
+            temperature=0.0,
+            use_cache=False,
+            canonical_image=True
+        )
+        if not isinstance(description, dict) or \
+                not isinstance(description.get("categories"), dict) or \
+                not isinstance(description.get("caption"), str):
+            logging.error("Invalid graphic description from LLM")
+            logging.pii(f"Graphic description: {description}")
+            return None
+
+        cache.set(key, description)
+        return description
@@ -0,0 +1,167 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+In-process metrics of LLMClient, rendered in the Prometheus text
+exposition format so they can be scraped from a /metrics endpoint.
+"""
+
+import bisect
+import threading
+from typing import Dict, List, Tuple
+
+# Upper bounds of the histogram buckets, in seconds
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0,
+                   120.0)
+TTFT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """Cumulative histogram for one label set."""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class LLMMetrics:
+    """Thread-safe registry of the LLM client metrics."""
+
+    # name: (type, help)
+    METRICS = {
+        "llm_requests_total": (
+            "counter",
+            "LLM chat completion calls by outcome "
+            "(ok, error, rejected, cached)"
+        ),
+        "llm_request_duration_seconds": (
+            "histogram",
+            "Duration of LLM requests sent to the backend, retries included"
+        ),
+        "llm_time_to_first_token_seconds": (
+            "histogram",
+            "Time to the first token of streamed LLM completions"
+        ),
+        "llm_prompt_tokens_total": (
+            "counter", "Prompt tokens processed by the LLM backend"
+        ),
+        "llm_completion_tokens_total": (
+            "counter", "Completion tokens generated by the LLM backend"
+        ),
+        "llm_image_payload_bytes_total": (
+            "counter", "Bytes of image data URLs sent to the LLM backend"
+        ),
+        "llm_json_parse_failures_total": (
+            "counter", "LLM responses that could not be parsed as JSON"
+        ),
+    }
+
+    def __init__(self):
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Increase a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Add an observation to a histogram."""
+        buckets = TTFT_BUCKETS if name == "llm_time_to_first_token_seconds" \
+            else LATENCY_BUCKETS
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = _Histogram(buckets)
+            series[key].observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter."""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            return self._counters.get(name, {}).get(key, 0)
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for name, (kind, help_text) in self.METRICS.items():
+                if kind == "counter" and name in self._counters:
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} counter")
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(
+                            f"{name}{_format_labels(labels)} {value:g}"
+                        )
+                elif kind == "histogram" and name in self._histograms:
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} histogram")
+                    for labels, hist in sorted(
+                        self._histograms[name].items()
+                    ):
+                        lines.extend(_render_histogram(name, labels, hist))
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        """Reset every metric."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def _format_labels(labels: Labels, extra: str = "") -> str:
+    parts = [
+        f'{key}="{_escape(str(value))}"' for key, value in labels
+    ]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+def _render_histogram(name: str, labels: Labels, hist: _Histogram):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(hist.buckets, hist.counts):
+        cumulative += count
+        le = _format_labels(labels, f'le="{bound:g}"')
+        lines.append(f"{name}_bucket{le} {cumulative}")
+    cumulative += hist.counts[-1]
+    le = _format_labels(labels, 'le="+Inf"')
+    lines.append(f"{name}_bucket{le} {cumulative}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {hist.sum:g}")
+    lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return lines
+
+
+# Shared by every LLMClient in the process
+METRICS = LLMMetrics()
+
+
+def render_metrics() -> str:
+    """Metrics of every LLMClient of the process, for /metrics endpoints."""
+    return METRICS.render()
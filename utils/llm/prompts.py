@@ -8,6 +8,15 @@
 """
 Prompt templates for LLM interactions in the IMAGE project.
 """
+# System message shared by every request, so that requests on the same
+# graphic share a token prefix (see LLM_PROMPT_LAYOUT in client.py).
+# Changing it invalidates the prefix cache of the LLM server.
+SHARED_SYSTEM_PREAMBLE = """
+You are a helpful assistant describing graphics for people who are blind
+or have low vision. Follow the instructions given after the graphic.
+"""
+###
+
 # Object detection
 OBJECT_DETECTION_PROMPT = """
 Step 1:
@@ -82,6 +91,26 @@ Assign boolean values (true or false) to each of the following categories:
 """
 ###
 
+# Content categoriser and graphic caption in a single request
+GRAPHIC_DESCRIPTION_PROMPT = """
+Your task is to categorise the content of an image and to caption it.
+Answer only in JSON, with two keys.
+
+The key "categories" contains an object with a boolean value
+(true or false) for each of the following categories:
+{categories}
+
+The key "caption" contains a description of the image for a person
+who cannot see it.
+Use simple, descriptive, clear, and concise language.
+The caption is only one sentence.
+Do not give any intro like "Here's what in this image:",
+"The image depicts", or "This photograph showcases" unless
+the graphic type is significant (like oil painting or aerial photo).
+Instead, start describing the graphic right away.
+"""
+###
+
 # Followup
 FOLLOWUP_PROMPT = """
 The user cannot see this image. Answer user's questions about it.
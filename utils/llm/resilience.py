@@ -0,0 +1,169 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Retry and circuit breaker policy for LLMClient.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict
+from openai import (
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError
+)
+
+# Timeout of a whole chat completion call in seconds, including retries;
+# the calls of a request must fit within the gunicorn --timeout of the
+# preprocessor (30 s by default)
+DEFAULT_TIMEOUT = 20.0
+# Number of retries after the first attempt
+DEFAULT_MAX_RETRIES = 2
+# First retry delay and maximum retry delay in seconds
+DEFAULT_RETRY_BASE_DELAY = 0.5
+DEFAULT_RETRY_MAX_DELAY = 8.0
+# Consecutive failures opening the circuit, and seconds before a new try
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_COOLDOWN = 30.0
+
+
+class CircuitOpenError(Exception):
+    """Raised when a request is rejected because the circuit is open."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether an API error is transient: timeouts, connection errors,
+    rate limiting and server errors. Other 4xx errors are not retried.
+    """
+    if isinstance(error, (APITimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def backoff_delay(
+    attempt: int,
+    base_delay: float = DEFAULT_RETRY_BASE_DELAY,
+    max_delay: float = DEFAULT_RETRY_MAX_DELAY
+) -> float:
+    """
+    Delay before retry number attempt + 1, using exponential backoff
+    with full jitter.
+    """
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker.
+
+    The circuit opens after `threshold` consecutive failures and rejects
+    requests for `cooldown` seconds. It then lets a single request through
+    (half-open): its success closes the circuit, its failure opens it
+    again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        threshold: int = DEFAULT_BREAKER_THRESHOLD,
+        cooldown: float = DEFAULT_BREAKER_COOLDOWN
+    ):
+        """
+        Args:
+            threshold: Consecutive failures opening the circuit
+                (0 disables the breaker)
+            cooldown: Seconds the circuit stays open
+        """
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a request may be sent now."""
+        if self.threshold <= 0:
+            return True
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probing = False
+            # half-open: a single probe request at a time
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        """Record a request that reached a healthy backend."""
+        with self._lock:
+            if self._state != self.CLOSED:
+                logging.info("LLM circuit breaker closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        """Record a request that failed because of the backend."""
+        if self.threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self._state == self.HALF_OPEN or (
+                self._state == self.CLOSED
+                and self._failures >= self.threshold
+            ):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                logging.warning(
+                    f"LLM circuit breaker opened after {self._failures} "
+                    f"consecutive failures"
+                )
+
+    def release(self):
+        """Record a request whose outcome says nothing about the backend."""
+        with self._lock:
+            self._probing = False
+
+    def status(self) -> Dict[str, Any]:
+        """State of the breaker, for health endpoints."""
+        with self._lock:
+            status = {
+                "state": self._state,
+                "consecutive_failures": self._failures
+            }
+            if self._state == self.OPEN:
+                remaining = self.cooldown - (
+                    time.monotonic() - self._opened_at
+                )
+                status["retry_in_seconds"] = max(0.0, round(remaining, 1))
+            return status
+
+    @property
+    def state(self) -> str:
+        return self._state
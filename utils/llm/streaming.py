@@ -0,0 +1,166 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Incremental JSON parsing of streamed LLM completions.
+"""
+
+import json
+import logging
+from typing import Any, List, Optional
+
+
+class IncrementalJSONParser:
+    """
+    Follow the structure of a JSON document as it is streamed, to tell
+    when generation can stop.
+
+    The document is complete once its top-level object or array is
+    closed; any text before it (e.g. a markdown code fence) or after it is
+    ignored. With max_items, the document is also considered complete once
+    that many items of the watched array have been closed: the top-level
+    array, or the array under items_key in the top-level object. The
+    result is then the document truncated after the last item, with its
+    open containers closed.
+
+    Only containers are counted as items, which covers the object and
+    array items of the project's structured outputs.
+    """
+
+    def __init__(
+        self,
+        max_items: Optional[int] = None,
+        items_key: Optional[str] = None
+    ):
+        """
+        Args:
+            max_items: Stop after this many items of the watched array
+            items_key: Key of the watched array in the top-level object
+                (None watches the top-level array)
+        """
+        self.max_items = max_items
+        self.items_key = items_key
+        self.item_count = 0
+        self.complete = False
+        self.truncated = False
+
+        self._chars: List[str] = []
+        self._start: Optional[int] = None
+        self._end: Optional[int] = None
+        # open containers as [bracket, key in parent object]
+        self._stack: List[list] = []
+        self._in_string = False
+        self._escape = False
+        self._expect_key = False
+        self._reading_key = False
+        self._key: List[str] = []
+        self._last_key: Optional[str] = None
+
+    def feed(self, text: str) -> bool:
+        """
+        Consume a chunk of the completion.
+
+        Returns:
+            True once the document is complete and generation can stop
+        """
+        for ch in text:
+            if self.complete:
+                break
+            if self._start is None:
+                if ch not in "{[":
+                    continue
+                self._start = len(self._chars)
+            self._chars.append(ch)
+            self._consume(ch)
+        return self.complete
+
+    def _consume(self, ch: str):
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if self._reading_key:
+                    self._last_key = "".join(self._key)
+                    self._reading_key = False
+                return
+            if self._reading_key:
+                self._key.append(ch)
+            return
+
+        if ch == '"':
+            self._in_string = True
+            self._reading_key = self._expect_key
+            self._key = []
+        elif ch in "{[":
+            in_object = self._stack and self._stack[-1][0] == "{"
+            self._stack.append([ch, self._last_key if in_object else None])
+            self._expect_key = ch == "{"
+        elif ch in "}]":
+            self._stack.pop()
+            self._expect_key = False
+            if not self._stack:
+                self._finish()
+            elif self._is_watched(self._stack):
+                self.item_count += 1
+                if self.max_items is not None and \
+                        self.item_count >= self.max_items:
+                    self.truncated = True
+                    self._finish()
+        elif ch == ",":
+            self._expect_key = self._stack[-1][0] == "{"
+        elif ch == ":":
+            self._expect_key = False
+
+    def _is_watched(self, stack: List[list]) -> bool:
+        """Whether the innermost container of stack is the watched array."""
+        if stack[-1][0] != "[":
+            return False
+        if self.items_key is None:
+            return len(stack) == 1
+        return len(stack) == 2 and stack[0][0] == "{" \
+            and stack[-1][1] == self.items_key
+
+    def _finish(self):
+        self.complete = True
+        self._end = len(self._chars)
+
+    @property
+    def text(self) -> str:
+        """The JSON text consumed so far, closed if it was truncated."""
+        if self._start is None:
+            return ""
+        end = self._end if self._end is not None else len(self._chars)
+        text = "".join(self._chars[self._start:end])
+        if self.truncated:
+            text += "".join(
+                "}" if bracket == "{" else "]"
+                for bracket, _ in reversed(self._stack)
+            )
+        return text
+
+    def result(self) -> Optional[Any]:
+        """
+        Parse the document.
+
+        Returns:
+            Parsed JSON, or None if it is incomplete or invalid
+        """
+        if not self.complete:
+            return None
+        try:
+            return json.loads(self.text)
+        except json.JSONDecodeError as e:
+            logging.error(f"Failed to decode streamed JSON response: {e}")
+            return None
@@ -2,32 +2,69 @@
 Segmentation utilities.
 """
 
-from .sam_processor import (
-    SAMClient,
-    segment_stages,
-    segment_image_with_boxes
+from .embedding_cache import (
+    EmbeddingCache,
+    ImageEmbedding,
+    EMBEDDING_CACHE
 )
 
 from .contour_utils import (
     extract_normalized_contours,
+    extract_contours_per_mask,
     normalize_contour,
     calculate_contour_properties,
+    calculate_contours_properties,
     create_segment_from_contours,
     update_data_with_contours,
     filter_contours_by_area,
-    simplify_contour
+    simplify_contour,
+    reduce_contours
 )
 
 __all__ = [
     # SAM client and functions
     'SAMClient',
+    'get_sam_client',
+    'clear_sam_clients',
     'segment_stages',
     'segment_image_with_boxes',
+    'DEFAULT_SIMPLIFY_TOLERANCE',
+    'DEFAULT_MIN_CONTOUR_AREA',
+    'DEFAULT_MAX_POINTS',
+    # image embedding cache
+    'EmbeddingCache',
+    'ImageEmbedding',
+    'EMBEDDING_CACHE',
+    # contour utilities
     'extract_normalized_contours',
+    'extract_contours_per_mask',
     'normalize_contour',
     'calculate_contour_properties',
+    'calculate_contours_properties',
     'create_segment_from_contours',
     'update_data_with_contours',
     'filter_contours_by_area',
-    'simplify_contour'
+    'simplify_contour',
+    'reduce_contours'
 ]
+
+# The SAM client needs ultralytics and torch: sam_processor is imported on
+# first use of its names, so that the contour utilities (and
+# benchmark_contours) work without the SAM stack
+_SAM_PROCESSOR_NAMES = (
+    'SAMClient',
+    'get_sam_client',
+    'clear_sam_clients',
+    'segment_stages',
+    'segment_image_with_boxes',
+    'DEFAULT_SIMPLIFY_TOLERANCE',
+    'DEFAULT_MIN_CONTOUR_AREA',
+    'DEFAULT_MAX_POINTS'
+)
+
+
+def __getattr__(name):
+    if name in _SAM_PROCESSOR_NAMES:
+        from . import sam_processor
+        return getattr(sam_processor, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
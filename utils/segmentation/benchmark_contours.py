@@ -0,0 +1,97 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Benchmark for the contour pipeline using synthetic masks, so it can be
+measured without running SAM.
+
+Usage (from the repository root):
+    python -m utils.segmentation.benchmark_contours --masks 12 --size 2048
+"""
+
+import argparse
+import logging
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from config.logging_utils import configure_logging
+from utils.segmentation.contour_utils import (
+    extract_contours_per_mask,
+    update_data_with_contours
+)
+
+
+def make_results(num_masks: int, width: int, height: int, seed: int = 0):
+    """
+    Build an object shaped like ultralytics SAM results, holding a stack
+    of boolean masks with a few irregular blobs each.
+    """
+    rng = np.random.default_rng(seed)
+    masks = np.zeros((num_masks, height, width), dtype=np.uint8)
+    for mask in masks:
+        for _ in range(rng.integers(1, 4)):
+            centre = (int(rng.integers(0, width)),
+                      int(rng.integers(0, height)))
+            axes = (int(rng.integers(width // 20, width // 4)),
+                    int(rng.integers(height // 20, height // 4)))
+            angle = float(rng.uniform(0, 180))
+            cv2.ellipse(mask, centre, axes, angle, 0, 360, 1, -1)
+        # roughen the boundary so contours have many points
+        noise = rng.random((height // 8, width // 8)) > 0.7
+        noise = cv2.resize(noise.astype(np.uint8), (width, height),
+                           interpolation=cv2.INTER_NEAREST)
+        mask &= cv2.dilate(noise, np.ones((3, 3), np.uint8)) | \
+            cv2.erode(mask, np.ones((15, 15), np.uint8))
+    data = masks.astype(bool)
+    return [SimpleNamespace(masks=SimpleNamespace(data=data))]
+
+
+def run(num_masks: int, size: int, repeat: int):
+    width, height = size, (size * 3) // 4
+    results = make_results(num_masks, width, height)
+    labels = [f"Stage {i}" for i in range(num_masks)]
+    base_data = {"stages": [{"label": label} for label in labels]}
+
+    extract_times, update_times = [], []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        contours_per_mask = extract_contours_per_mask(results, width, height)
+        extract_times.append(time.perf_counter() - start)
+
+        contours_by_label = dict(zip(labels, contours_per_mask))
+        start = time.perf_counter()
+        update_data_with_contours(base_data, contours_by_label)
+        update_times.append(time.perf_counter() - start)
+
+    num_contours = sum(len(c) for c in contours_per_mask)
+    num_points = sum(len(p) for c in contours_per_mask for p in c)
+    print(f"{num_masks} masks of {width}x{height}: "
+          f"{num_contours} contours, {num_points} points")
+    print(f"extract_contours_per_mask: "
+          f"{1000 * np.median(extract_times):.1f} ms (median)")
+    print(f"update_data_with_contours: "
+          f"{1000 * np.median(update_times):.1f} ms (median)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--masks", type=int, default=12)
+    parser.add_argument("--size", type=int, default=2048)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    configure_logging()
+    logging.getLogger().setLevel(logging.WARNING)
+    run(args.masks, args.size, args.repeat)
@@ -15,94 +15,146 @@ Utilities for contour extraction and processing.
 """
 
 import logging
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 import cv2
 import numpy as np
-import copy
 
+# cv2.moments treats contours whose doubled area is below this as empty
+_MIN_MOMENT_AREA = float(np.finfo(np.float32).eps)
 
-def extract_normalized_contours(
-    results: list,
-    img_width: int,
-    img_height: int,
-    min_points: int = 3
-) -> List[List[List[float]]]:
+# upper bound on the tolerance reduce_contours uses to meet a point budget
+_MAX_SIMPLIFY_TOLERANCE = 0.02
+
+
+def masks_to_numpy(results: list) -> Optional[np.ndarray]:
     """
-    Extract and normalize contours from SAM results.
+    Copy the whole mask stack of SAM results to host memory at once.
 
     Args:
         results: SAM model results containing masks
-        img_width: Image width for normalization
-        img_height: Image height for normalization
-        min_points: Minimum number of points required for a valid contour
 
     Returns:
-        List of normalized contours, where each contour is a list of [x, y]
-        points with values in range [0, 1]
+        uint8 array of shape (N, H, W) with non-zero values inside the
+        masks, or None if the results contain no masks
     """
     if not results or len(results) == 0:
-        logging.info("No masks found in SAM results.")
-        return []
+        return None
 
     # Handle different result formats
     if hasattr(results[0], 'masks') and results[0].masks is not None:
-        masks_data = results[0].masks.data
+        masks_data = getattr(results[0].masks, 'data', results[0].masks)
     elif hasattr(results[0], 'masks'):
         # Sometimes masks might be directly accessible
         masks_data = results[0].masks
     else:
         logging.warning("No masks found in results")
-        return []
+        return None
 
     if masks_data is None:
         logging.debug("Masks data is None")
-        return []
+        return None
 
-    # Ensure we have numpy array
+    # Single device-to-host transfer for every mask
     if hasattr(masks_data, 'cpu'):
         masks = masks_data.cpu().numpy()
     else:
-        masks = np.array(masks_data)
+        masks = np.asarray(masks_data)
 
-    # Ensure masks is at least 2D
+    # Ensure masks is at least 3D
     if masks.ndim == 2:
         masks = masks[np.newaxis, ...]
 
-    normalized_contours_list = []
+    if masks.dtype == np.bool_:
+        return masks.view(np.uint8)
+    return (masks * 255).astype(np.uint8)
+
+
+def extract_contours_per_mask(
+    results: list,
+    img_width: int,
+    img_height: int,
+    min_points: int = 3
+) -> List[List[List[List[float]]]]:
+    """
+    Extract and normalize the contours of every mask in SAM results.
+
+    Args:
+        results: SAM model results containing masks
+        img_width: Image width for normalization
+        img_height: Image height for normalization
+        min_points: Minimum number of points required for a valid contour
+
+    Returns:
+        One entry per mask, in the order of the results, each holding the
+        list of normalized contours found in that mask
+    """
+    masks = masks_to_numpy(results)
+    if masks is None:
+        logging.info("No masks found in SAM results.")
+        return []
+
+    contours_per_mask = []
 
     for i, mask in enumerate(masks):
+        mask_contours = []
         try:
-            # Convert mask to uint8
-            mask_uint8 = (mask * 255).astype(np.uint8)
-
             # Find contours
             contours, _ = cv2.findContours(
-                mask_uint8, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+                mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
             )
 
-            if contours:
-                for contour in contours:
-                    if len(contour) < min_points:
-                        continue
+            if not contours:
+                logging.debug(f"No contours found for mask with index {i}.")
 
-                    # Normalize contour points
-                    normalized_contour = normalize_contour(
-                        contour, img_width, img_height
-                    )
+            for contour in contours:
+                if len(contour) < min_points:
+                    continue
 
-                    if normalized_contour:
-                        normalized_contours_list.append(normalized_contour)
-            else:
-                logging.debug(f"No contours found for mask with index {i}.")
+                # Normalize contour points
+                normalized_contour = normalize_contour(
+                    contour, img_width, img_height
+                )
+
+                if normalized_contour:
+                    mask_contours.append(normalized_contour)
 
         except Exception as e:
             logging.error(
                 f"Error extracting normalized contours for mask {i}: {e}",
                 exc_info=True
                 )
-            continue
 
-    return normalized_contours_list
+        contours_per_mask.append(mask_contours)
+
+    return contours_per_mask
+
+
+def extract_normalized_contours(
+    results: list,
+    img_width: int,
+    img_height: int,
+    min_points: int = 3
+) -> List[List[List[float]]]:
+    """
+    Extract and normalize contours from SAM results.
+
+    Args:
+        results: SAM model results containing masks
+        img_width: Image width for normalization
+        img_height: Image height for normalization
+        min_points: Minimum number of points required for a valid contour
+
+    Returns:
+        List of normalized contours, where each contour is a list of [x, y]
+        points with values in range [0, 1]
+    """
+    return [
+        contour
+        for mask_contours in extract_contours_per_mask(
+            results, img_width, img_height, min_points
+        )
+        for contour in mask_contours
+    ]
 
 
 def normalize_contour(
@@ -125,19 +177,63 @@ def normalize_contour(
         logging.error(f"Invalid image dimensions: {img_width}x{img_height}")
         return []
 
-    normalized_points = []
+    points = np.asarray(contour, dtype=np.float64).reshape(-1, 2)
+    normalized = points / np.array([img_width, img_height], dtype=np.float64)
 
-    for point in contour.reshape(-1, 2):
-        x_norm = float(point[0]) / img_width
-        y_norm = float(point[1]) / img_height
+    # Clamp to [0, 1] range
+    np.clip(normalized, 0.0, 1.0, out=normalized)
 
-        # Clamp to [0, 1] range
-        x_norm = max(0.0, min(1.0, x_norm))
-        y_norm = max(0.0, min(1.0, y_norm))
+    return normalized.tolist()
 
-        normalized_points.append([x_norm, y_norm])
 
-    return normalized_points
+def calculate_contours_properties(
+    contours: List[List[List[float]]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate centroids and areas of many normalized contours at once.
+    Matches cv2.moments / cv2.contourArea on each contour, falling back to
+    the mean of the points for contours with no area.
+
+    Args:
+        contours: List of contours, each a non-empty list or array of
+            [x, y] points
+
+    Returns:
+        Tuple of (centroids, areas): an (N, 2) array of centroids and an
+        (N,) array of areas, both clamped to [0, 1]
+    """
+    if not contours:
+        return np.zeros((0, 2)), np.zeros(0)
+
+    lengths = np.array([len(c) for c in contours], dtype=np.intp)
+    points = np.concatenate([
+        np.asarray(c, dtype=np.float64).reshape(-1, 2) for c in contours
+    ])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+
+    # index of the next vertex, wrapping around within each contour
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+
+    x, y = points[:, 0], points[:, 1]
+    x_next, y_next = x[following], y[following]
+    cross = x * y_next - x_next * y
+
+    # shoelace formula, one reduction per contour
+    doubled_area = np.add.reduceat(cross, starts)
+    cx_sum = np.add.reduceat((x + x_next) * cross, starts)
+    cy_sum = np.add.reduceat((y + y_next) * cross, starts)
+
+    has_area = np.abs(doubled_area) > _MIN_MOMENT_AREA
+    divisor = np.where(has_area, 3.0 * doubled_area, 1.0)
+    centroids = np.where(
+        has_area[:, np.newaxis],
+        np.stack([cx_sum, cy_sum], axis=1) / divisor[:, np.newaxis],
+        np.add.reduceat(points, starts) / lengths[:, np.newaxis]
+    )
+    areas = np.where(has_area, np.abs(doubled_area) / 2.0, 0.0)
+
+    return np.clip(centroids, 0.0, 1.0), np.clip(areas, 0.0, 1.0)
 
 
 def calculate_contour_properties(
@@ -156,33 +252,11 @@ def calculate_contour_properties(
         return {"centroid": [0.0, 0.0], "area": 0.0}
 
     try:
-        contour_np = np.array(contour, dtype=np.float32)
-
-        # Calculate moments
-        moments = cv2.moments(contour_np)
-
-        # Calculate centroid
-        if moments['m00'] != 0:
-            cx = float(moments['m10'] / moments['m00'])
-            cy = float(moments['m01'] / moments['m00'])
-        else:
-            # Fallback to geometric center
-            cx = float(np.mean(contour_np[:, 0]))
-            cy = float(np.mean(contour_np[:, 1]))
-
-        # Clamp centroid to [0, 1]
-        centroid = [
-            max(0.0, min(1.0, cx)),
-            max(0.0, min(1.0, cy))
-        ]
-
-        # Calculate area (normalized)
-        area = float(cv2.contourArea(contour_np))
-        area = max(0.0, min(1.0, area))
+        centroids, areas = calculate_contours_properties([contour])
 
         return {
-            "centroid": centroid,
-            "area": area
+            "centroid": centroids[0].tolist(),
+            "area": float(areas[0])
         }
 
     except Exception as e:
@@ -258,6 +332,8 @@ def update_data_with_contours(
     """
     Update a data structure with segmentation contours.
     This function maintains the exact format required for schema validation.
+    base_data itself is not modified: the top level, the stage list and the
+    stages are copied, everything else is shared with the input.
 
     Args:
         base_data: Base data structure to update
@@ -270,12 +346,17 @@ def update_data_with_contours(
         Updated data structure with contours added in the exact format
         required for schema validation
     """
-    updated_data = copy.deepcopy(base_data)
+    updated_data = dict(base_data)
 
     if stages_key not in updated_data:
         logging.warning(f"Key '{stages_key}' not found in base data")
         return updated_data
 
+    updated_data[stages_key] = [
+        dict(stage) if isinstance(stage, dict) else stage
+        for stage in updated_data[stages_key]
+    ]
+
     # Create lookup for stages by label
     stages_by_label = {}
     for stage in updated_data[stages_key]:
@@ -294,75 +375,61 @@ def update_data_with_contours(
         stage = stages_by_label[label]
 
         # Initialize segments if not present
-        if (
-            segments_key not in stage
-            or not isinstance(stage[segments_key], list)
-        ):
+        if isinstance(stage.get(segments_key), list):
+            stage[segments_key] = list(stage[segments_key])
+        else:
             stage[segments_key] = []
 
-        # Add segments for each contour
+        valid_contours = []
         for i, contour_coords in enumerate(contours_list):
-            if not contour_coords or len(contour_coords) < 3:
+            if contour_coords is None or len(contour_coords) < 3:
                 logging.pii(
                     f"Skipping invalid contour {i+1} for label '{label}' "
                     "(too few points)"
                     )
                 continue
+            valid_contours.append((i, np.asarray(
+                contour_coords, dtype=np.float64).reshape(-1, 2)))
 
-            try:
-                # Convert to numpy array for calculations
-                contour_np = np.array(contour_coords, dtype=np.float32)
-
-                # Calculate centroid
-                moments = cv2.moments(contour_np)
-                if moments['m00'] != 0:
-                    cx = float(moments['m10'] / moments['m00'])
-                    cy = float(moments['m01'] / moments['m00'])
-                else:
-                    # Fallback to geometric center
-                    cx = float(np.mean(contour_np[:, 0]))
-                    cy = float(np.mean(contour_np[:, 1]))
-
-                # Clamp centroid to [0, 1]
-                contour_centroid = [
-                    max(0.0, min(1.0, cx)),
-                    max(0.0, min(1.0, cy))
-                ]
-
-                # Calculate area (normalized)
-                contour_area = float(cv2.contourArea(contour_np))
-                contour_area = max(0.0, min(1.0, contour_area))
-
-                # Format coordinates as list of [x, y] pairs
-                formatted_coordinates = [
-                    [float(p[0]), float(p[1])] for p in contour_coords
-                ]
-
-                # Create contour object
-                contour_object = {
-                    "coordinates": formatted_coordinates,
-                    "centroid": contour_centroid,
-                    "area": contour_area
-                }
-
-                # Create segment
-                l_c = len(contours_list)
-                segment_name = f"{label} Part {i + 1}" if l_c > 1 else label
-                segment = {
-                    "name": segment_name,
-                    "contours": [contour_object],
-                    "centroid": contour_centroid,
-                    "area": contour_area
-                }
-
-                stage[segments_key].append(segment)
-
-            except Exception as e:
-                logging.pii(
-                    f"Error processing contour {i+1} for label '{label}': {e}",
-                    exc_info=True
-                    )
-                continue
+        if not valid_contours:
+            continue
+
+        try:
+            # Centroids and areas of all contours of the label at once
+            centroids, areas = calculate_contours_properties(
+                [points for _, points in valid_contours]
+            )
+        except Exception as e:
+            logging.pii(
+                f"Error processing contours for label '{label}': {e}",
+                exc_info=True
+                )
+            continue
+
+        l_c = len(contours_list)
+        for (i, points), centroid, area in zip(
+            valid_contours, centroids.tolist(), areas.tolist()
+        ):
+            # Format coordinates as list of [x, y] pairs
+            formatted_coordinates = points.tolist()
+
+            # Create contour object
+            contour_object = {
+                "coordinates": formatted_coordinates,
+                "centroid": centroid,
+                "area": area
+            }
+
+            # Create segment
+            segment_name = f"{label} Part {i + 1}" if l_c > 1 else label
+            segment = {
+                "name": segment_name,
+                "contours": [contour_object],
+                "centroid": centroid,
+                "area": area
+            }
+
+            stage[segments_key].append(segment)
 
     # Ensure all stages have segments key (even if empty)
     for stage in updated_data[stages_key]:
@@ -373,7 +440,7 @@ def update_data_with_contours(
 
 
 # The following two functions are optional utilities for further processing
-# They aren't used currently in the main workflow
+# They aren't used currently in the main workflow (see reduce_contours)
 def filter_contours_by_area(
     contours: List[List[List[float]]],
     min_area: float = 0.0001,
@@ -439,4 +506,93 @@ def simplify_contour(
 
     except Exception as e:
         logging.error(f"Error simplifying contour: {e}")
-        return contour
\ No newline at end of file
+        return contour
+
+
+def reduce_contours(
+    contours_per_mask: List[List[List[List[float]]]],
+    tolerance: Optional[float] = 0.002,
+    min_area: Optional[float] = 0.0001,
+    max_points: Optional[int] = None
+) -> List[List[List[List[float]]]]:
+    """
+    Drop small contours, simplify the rest with Douglas-Peucker and keep
+    the total number of points within a budget.
+
+    Args:
+        contours_per_mask: Normalized contours grouped by mask, as returned
+            by extract_contours_per_mask
+        tolerance: Maximum distance between the original and simplified
+            contour, in normalized units (None or 0 disables simplification)
+        min_area: Contours with a smaller normalized area are dropped
+            (None or 0 keeps every contour)
+        max_points: Maximum number of points over all contours. The
+            tolerance is doubled until the budget is met, after which the
+            smallest contours are dropped (None for no budget)
+
+    Returns:
+        Contours grouped by mask, in the same order as the input
+    """
+    flat = [
+        (m, np.asarray(contour, dtype=np.float32).reshape(-1, 1, 2))
+        for m, mask_contours in enumerate(contours_per_mask)
+        for contour in mask_contours
+        if len(contour) >= 3
+    ]
+    if not flat:
+        return [[] for _ in contours_per_mask]
+
+    _, areas = calculate_contours_properties([c for _, c in flat])
+    if min_area:
+        kept = areas >= min_area
+        flat = [item for item, keep in zip(flat, kept) if keep]
+        areas = areas[kept]
+
+    epsilon = tolerance or 0.0
+    while True:
+        simplified = [
+            cv2.approxPolyDP(contour, epsilon, True) if epsilon > 0
+            else contour
+            for _, contour in flat
+        ]
+        # contours simplified to fewer than 3 points are dropped below
+        total_points = sum(len(c) for c in simplified if len(c) >= 3)
+        if (
+            max_points is None
+            or total_points <= max_points
+            or epsilon >= _MAX_SIMPLIFY_TOLERANCE
+        ):
+            break
+        epsilon = min(max(2.0 * epsilon, 0.0005), _MAX_SIMPLIFY_TOLERANCE)
+
+    valid = np.array([len(c) >= 3 for c in simplified], dtype=bool)
+    flat = [item for item, ok in zip(flat, valid) if ok]
+    simplified = [c for c, ok in zip(simplified, valid) if ok]
+    areas = areas[valid]
+
+    keep = np.ones(len(simplified), dtype=bool)
+    if max_points is not None and total_points > max_points:
+        # still over budget: drop the smallest contours first
+        for index in np.argsort(areas):
+            if total_points <= max_points:
+                break
+            keep[index] = False
+            total_points -= len(simplified[index])
+        logging.debug(
+            f"Dropped {int((~keep).sum())} contours to meet "
+            f"the budget of {max_points} points"
+        )
+
+    reduced = [[] for _ in contours_per_mask]
+    for (m, _), contour, kept in zip(flat, simplified, keep):
+        if kept:
+            reduced[m].append(
+                np.clip(contour.reshape(-1, 2).astype(np.float64),
+                        0.0, 1.0).tolist()
+            )
+
+    logging.debug(
+        f"Reduced contours to {sum(len(c) for r in reduced for c in r)} "
+        f"points with tolerance {epsilon}"
+    )
+    return reduced
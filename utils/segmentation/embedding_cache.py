@@ -0,0 +1,145 @@
+# Copyright (c) 2025 IMAGE Project, Shared Reality Lab, McGill University
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+
+"""
+Cache of SAM image embeddings, keyed by image content and model.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Tuple
+from PIL import Image
+
+# Byte budget of the shared embedding cache (0 disables it)
+SAM_EMBEDDING_CACHE_MB = int(os.getenv('SAM_EMBEDDING_CACHE_MB', '256'))
+
+
+class ImageEmbedding:
+    """Output of the SAM image encoder for one image."""
+
+    def __init__(
+        self,
+        key: str,
+        model_path: str,
+        image_size: Tuple[int, int],
+        features: Any
+    ):
+        """
+        Args:
+            key: Digest of the image and model (see image_digest)
+            model_path: Path of the SAM model that computed the features
+            image_size: (width, height) of the encoded image
+            features: Image encoder output, as stored by the predictor
+        """
+        self.key = key
+        self.model_path = model_path
+        self.image_size = image_size
+        self.features = features
+        self.nbytes = features_nbytes(features)
+
+
+def image_digest(image: Image.Image, model_path: str) -> str:
+    """
+    Hash the decoded pixels of an image together with the model path.
+
+    Args:
+        image: PIL Image
+        model_path: Path of the SAM model computing the embedding
+
+    Returns:
+        Hex digest identifying the embedding
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(model_path.encode("utf-8"))
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+def features_nbytes(features: Any) -> int:
+    """Size in bytes of the tensors/arrays held by encoder features."""
+    if isinstance(features, dict):
+        return sum(features_nbytes(v) for v in features.values())
+    if isinstance(features, (list, tuple)):
+        return sum(features_nbytes(v) for v in features)
+    if hasattr(features, 'element_size') and hasattr(features, 'nelement'):
+        return features.element_size() * features.nelement()
+    return int(getattr(features, 'nbytes', 0))
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache of image embeddings bounded by their total size.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Maximum total size of the cached embeddings
+                (0 disables caching)
+        """
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, ImageEmbedding]" = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[ImageEmbedding]:
+        """Return the cached embedding for key, or None."""
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, embedding: ImageEmbedding):
+        """Cache an embedding, evicting the least recently used ones."""
+        if embedding.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(embedding.key, None)
+            if previous is not None:
+                self._nbytes -= previous.nbytes
+            self._entries[embedding.key] = embedding
+            self._nbytes += embedding.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+                logging.debug("Evicted SAM embedding from cache")
+
+    def clear(self, model_path: Optional[str] = None):
+        """Drop every embedding, or only those computed by model_path."""
+        with self._lock:
+            for key in list(self._entries):
+                embedding = self._entries[key]
+                if model_path is None or embedding.model_path == model_path:
+                    del self._entries[key]
+                    self._nbytes -= embedding.nbytes
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the cached embeddings."""
+        return self._nbytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Shared by every SAMClient in the process
+EMBEDDING_CACHE = EmbeddingCache(SAM_EMBEDDING_CACHE_MB * 1024 * 1024)
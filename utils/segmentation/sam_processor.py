@@ -14,16 +14,34 @@
 SAM (Segment Anything Model) processor for image segmentation.
 """
 
+import gc
 import logging
 import os
+import threading
+from collections import OrderedDict
 from typing import List, Dict, Optional, Any
 from PIL import Image
 import numpy as np
 from ultralytics import SAM
 from .contour_utils import (
-    extract_normalized_contours,
+    extract_contours_per_mask,
+    reduce_contours,
     update_data_with_contours
 )
+from .embedding_cache import (
+    EMBEDDING_CACHE,
+    ImageEmbedding,
+    image_digest
+)
+
+# Defaults for contour reduction in segment_with_boxes, in normalized units.
+# A tolerance of 0.002 is about 2 pixels on a 1000 pixel wide graphic.
+DEFAULT_SIMPLIFY_TOLERANCE = 0.002
+DEFAULT_MIN_CONTOUR_AREA = 0.0001
+DEFAULT_MAX_POINTS = 2000
+
+# Maximum number of SAM models kept in memory by get_sam_client
+SAM_MAX_MODELS = int(os.getenv('SAM_MAX_MODELS', '1'))
 
 
 class SAMClient:
@@ -32,12 +50,16 @@ class SAMClient:
     Follows the same initialization pattern as LLMClient.
     """
 
-    def __init__(self):
+    def __init__(self, model_path: Optional[str] = None):
         """
         Initialize SAM client using environment variables.
         Similar to LLMClient initialization pattern.
+
+        Args:
+            model_path: Path to the SAM model file
+                (defaults to env SAM_MODEL_PATH)
         """
-        self.model_path = os.getenv('SAM_MODEL_PATH')
+        self.model_path = model_path or os.getenv('SAM_MODEL_PATH')
         if not self.model_path:
             raise ValueError(
                 "SAM_MODEL_PATH environment variable must be set. "
@@ -45,6 +67,11 @@ class SAMClient:
             )
 
         self.model = None
+        # serializes model loading/unloading and inference on this client
+        self._lock = threading.RLock()
+        # called after the model is reloaded, set by get_sam_client; it
+        # returns the clients to unload once this client's lock is released
+        self._on_reload = None
         self._initialize_model()
         logging.debug(
             f"SAMClient initialized with model from {self.model_path}"
@@ -61,6 +88,125 @@ class SAMClient:
                 )
             raise RuntimeError(f"Could not initialize SAM model: {e}")
 
+    def _get_model(self):
+        """
+        Return the SAM model, reloading it if it was unloaded, and the
+        clients evicted by the reload. Called with self._lock held: the
+        caller unloads the evicted clients after releasing it, since
+        unloading takes their locks.
+        """
+        evicted = []
+        if self.model is None:
+            logging.debug(f"Reloading SAM model from {self.model_path}")
+            self._initialize_model()
+            if self._on_reload is not None:
+                evicted = self._on_reload(self)
+        return self.model, evicted
+
+    def _get_predictor(self):
+        """
+        Return the ultralytics predictor of the model, setting it up with
+        SAM's default prediction arguments if needed, and the clients
+        evicted by a reload of the model (see _get_model).
+        """
+        model, evicted = self._get_model()
+        if getattr(model, 'predictor', None) is None:
+            # the first prediction creates the predictor
+            dummy_pil = Image.new("RGB", (64, 64))
+            model(dummy_pil, bboxes=[[8, 8, 32, 32]])
+        return model.predictor, evicted
+
+    def encode_image(
+        self,
+        image: Image.Image,
+        use_cache: bool = True
+    ) -> ImageEmbedding:
+        """
+        Run the SAM image encoder, the expensive half of segmentation.
+        The result only depends on the image, so it can be computed before
+        the prompts are known and is reused from the embedding cache.
+
+        Args:
+            image: PIL Image to encode
+            use_cache: Whether to look up and store the embedding in the
+                shared embedding cache
+
+        Returns:
+            ImageEmbedding to pass to decode_boxes
+        """
+        key = image_digest(image, self.model_path)
+        if use_cache:
+            cached = EMBEDDING_CACHE.get(key)
+            if cached is not None:
+                logging.debug("Using cached SAM image embedding")
+                return cached
+
+        with self._lock:
+            predictor, evicted = self._get_predictor()
+            try:
+                predictor.set_image(image)
+                features = predictor.features
+            finally:
+                predictor.reset_image()
+        _unload_sam_clients(evicted)
+
+        embedding = ImageEmbedding(key, self.model_path, image.size, features)
+        if use_cache:
+            EMBEDDING_CACHE.put(embedding)
+        return embedding
+
+    def decode_boxes(
+        self,
+        image: Image.Image,
+        embedding: ImageEmbedding,
+        bboxes: List[List[float]],
+        labels: Optional[List[Any]] = None
+    ) -> list:
+        """
+        Run the SAM prompt encoder and mask decoder on an embedding.
+
+        Args:
+            image: PIL Image the embedding was computed from
+            embedding: Output of encode_image for this image
+            bboxes: Boxes in pixel coordinates, [x1, y1, x2, y2]
+            labels: Optional labels passed along with the boxes
+
+        Returns:
+            ultralytics results, as returned when calling the model
+        """
+        if embedding.image_size != image.size:
+            raise ValueError("Embedding was computed for another image")
+
+        with self._lock:
+            predictor, evicted = self._get_predictor()
+            try:
+                # features set on the predictor skip the image encoder
+                predictor.features = embedding.features
+                if labels is not None:
+                    results = predictor(image, bboxes=bboxes, labels=labels)
+                else:
+                    results = predictor(image, bboxes=bboxes)
+            finally:
+                predictor.reset_image()
+        _unload_sam_clients(evicted)
+        return results
+
+    def unload(self):
+        """Release the SAM model; it is reloaded on next use."""
+        with self._lock:
+            if self.model is None:
+                return
+            self.model = None
+            EMBEDDING_CACHE.clear(self.model_path)
+            gc.collect()
+            try:
+                import torch
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+            except ImportError:
+                pass
+            logging.debug(f"SAM model {self.model_path} unloaded")
+
     def segment_with_boxes(
         self,
         image: Image.Image,
@@ -68,7 +214,11 @@ class SAMClient:
         use_prompts: bool = False,
         aggregate_by_label: bool = True,
         return_structured: bool = False,
-        base_data: Optional[Dict[str, Any]] = None
+        base_data: Optional[Dict[str, Any]] = None,
+        simplify_tolerance: Optional[float] = DEFAULT_SIMPLIFY_TOLERANCE,
+        min_contour_area: Optional[float] = DEFAULT_MIN_CONTOUR_AREA,
+        max_points: Optional[int] = DEFAULT_MAX_POINTS,
+        embedding: Optional[ImageEmbedding] = None
     ) -> Dict[str, Any]:
         """
         Segment image regions using bounding boxes.
@@ -83,6 +233,14 @@ class SAMClient:
                              update_data_with_contours (for schema validation)
             base_data: Base data structure to update
                     (required if return_structured=True)
+            simplify_tolerance: Douglas-Peucker tolerance for the contours,
+                    in normalized units (None or 0 keeps every point)
+            min_contour_area: Contours with a smaller normalized area are
+                    dropped (None or 0 keeps every contour)
+            max_points: Maximum number of contour points over all labels
+                    (None for no budget)
+            embedding: Output of encode_image for this image; computed
+                    (or taken from the embedding cache) when omitted
 
         Returns:
             If return_structured=False: Dictionary mapping labels to lists
@@ -167,17 +325,22 @@ class SAMClient:
         aggregated_contour_data = {}
 
         try:
-            # Run SAM with all bounding boxes at once
-            if use_prompts:
-                # Use labels as prompts to help SAM understand what to segment
-                # The exact parameter name may vary by ultralytics version
-                results = self.model(image, bboxes=bboxes, labels=labels)
-                logging.debug(
-                    f"Running SAM with {len(bboxes)} boxes and text prompts"
-                    )
-            else:
-                results = self.model(image, bboxes=bboxes)
-                logging.debug(f"Running SAM with {len(bboxes)} boxes")
+            # Run SAM with all bounding boxes at once, reusing the
+            # image embedding when it is already known
+            if embedding is None:
+                embedding = self.encode_image(image)
+            # Use labels as prompts to help SAM understand what to segment
+            # The exact parameter name may vary by ultralytics version
+            results = self.decode_boxes(
+                image,
+                embedding,
+                bboxes,
+                labels=labels if use_prompts else None
+            )
+            logging.debug(
+                f"Running SAM with {len(bboxes)} boxes"
+                + (" and text prompts" if use_prompts else "")
+                )
 
             if not results or len(results) == 0:
                 logging.warning("SAM returned no results")
@@ -185,55 +348,45 @@ class SAMClient:
                     return update_data_with_contours(base_data, {})
                 return {}
 
+            # Copy all masks to the host at once and extract their contours
+            contours_per_mask = extract_contours_per_mask(
+                results, width, height
+            )
+
+            # Simplify and filter the contours to keep the payload small
+            if simplify_tolerance or min_contour_area or max_points:
+                contours_per_mask = reduce_contours(
+                    contours_per_mask,
+                    tolerance=simplify_tolerance,
+                    min_area=min_contour_area,
+                    max_points=max_points
+                )
+
             # Process results
             if aggregate_by_label:
                 aggregated_contour_data = {label: [] for label in labels}
 
                 # Process each result with its corresponding label
                 for i, label in enumerate(labels):
-                    try:
-                        if i < len(results[0]):
-                            # Create a wrapper list for the single result
-                            result_wrapper = [results[0][i]]
-                            normalized_contours = extract_normalized_contours(
-                                result_wrapper, width, height
+                    if i < len(contours_per_mask):
+                        normalized_contours = contours_per_mask[i]
+                        aggregated_contour_data[label].extend(
+                            normalized_contours
                             )
-                            aggregated_contour_data[label].extend(
-                                normalized_contours
-                                )
-                            l_c = len(normalized_contours)
-                            logging.pii(
-                                f"Extracted {l_c} contours for label '{label}'"
-                                )
-                        else:
-                            logging.warning(
-                                f"No result for label '{label}' at index {i}"
-                                )
-                    except Exception as e:
+                        l_c = len(normalized_contours)
                         logging.pii(
-                            f"Error processing result for label '{label}': "
-                            f"{e}",
-                            exc_info=True
+                            f"Extracted {l_c} contours for label '{label}'"
+                            )
+                    else:
+                        logging.warning(
+                            f"No result for label '{label}' at index {i}"
                             )
-                        continue
             else:
                 # Return with unique keys for each detection
                 for i, label in enumerate(labels):
-                    try:
-                        if i < len(results[0]):
-                            result_wrapper = [results[0][i]]
-                            normalized_contours = extract_normalized_contours(
-                                result_wrapper, width, height
-                            )
-                            key = f"{label}_{i}"
-                            aggregated_contour_data[key] = normalized_contours
-                    except Exception as e:
-                        logging.pii(
-                            f"Error processing result for label '{label}': "
-                            f"{e}",
-                            exc_info=True
-                            )
-                        continue
+                    if i < len(contours_per_mask):
+                        key = f"{label}_{i}"
+                        aggregated_contour_data[key] = contours_per_mask[i]
 
         except Exception as e:
             logging.error(f"Error during SAM processing: {e}", exc_info=True)
@@ -297,7 +450,10 @@ class SAMClient:
             dummy_pil = Image.fromarray(dummy_cv2)
 
             # Run dummy inference
-            _ = self.model(dummy_pil, bboxes=[[100, 100, 200, 200]])
+            with self._lock:
+                model, evicted = self._get_model()
+                _ = model(dummy_pil, bboxes=[[100, 100, 200, 200]])
+            _unload_sam_clients(evicted)
 
             logging.debug("SAM model warmed up successfully")
             return True
@@ -307,6 +463,106 @@ class SAMClient:
             return False
 
 
+# Process-wide registry of SAM clients, keyed by model path and ordered
+# from least to most recently used
+_SAM_CLIENTS: "OrderedDict[str, SAMClient]" = OrderedDict()
+_SAM_CLIENTS_LOCK = threading.Lock()
+# Maximum number of loaded models, set by the last get_sam_client call
+# passing max_models
+_SAM_CLIENTS_LIMIT = SAM_MAX_MODELS
+
+
+def _touch_sam_client(
+    client: SAMClient,
+    limit: Optional[int] = None
+) -> List[SAMClient]:
+    """
+    Mark a registered client as most recently used and return the clients
+    whose model must be unloaded to stay within the limit.
+    Must be called with _SAM_CLIENTS_LOCK held.
+    """
+    limit = max(1, limit if limit is not None else _SAM_CLIENTS_LIMIT)
+    _SAM_CLIENTS.move_to_end(client.model_path)
+
+    loaded = [c for c in _SAM_CLIENTS.values() if c.model is not None]
+    excess = len(loaded) - limit
+    return [c for c in loaded if c is not client][:max(0, excess)]
+
+
+def _unload_sam_clients(clients: List[SAMClient]):
+    """Unload models evicted from the registry (without holding its lock)"""
+    for client in clients:
+        logging.info(
+            f"Unloading least recently used SAM model {client.model_path}"
+            )
+        client.unload()
+
+
+def _on_sam_client_reload(client: SAMClient) -> List[SAMClient]:
+    """
+    Keeps the registry within its limit when an evicted model reloads.
+    Returns the clients to unload: the reloading client holds its lock,
+    so it unloads them itself once the lock is released.
+    """
+    with _SAM_CLIENTS_LOCK:
+        return _touch_sam_client(client)
+
+
+def get_sam_client(
+    model_path: Optional[str] = None,
+    warmup: bool = False,
+    max_models: Optional[int] = None
+) -> SAMClient:
+    """
+    Return the shared SAMClient for a model, loading it on first use.
+    When more than max_models models are loaded, the least recently used
+    ones are unloaded; their clients reload the model on next use.
+
+    Args:
+        model_path: Path to the SAM model file
+            (defaults to env SAM_MODEL_PATH)
+        warmup: Whether to run a warmup inference after the lookup
+        max_models: Maximum number of models kept in memory, also used
+            when an unloaded model reloads (defaults to the last value
+            passed, or env SAM_MAX_MODELS, or 1)
+
+    Returns:
+        SAMClient shared by every caller using the same model path
+    """
+    model_path = model_path or os.getenv('SAM_MODEL_PATH')
+    if not model_path:
+        raise ValueError(
+            "SAM_MODEL_PATH environment variable must be set. "
+            "Please set it to the path of your SAM model file."
+        )
+
+    global _SAM_CLIENTS_LIMIT
+    with _SAM_CLIENTS_LOCK:
+        if max_models is not None:
+            _SAM_CLIENTS_LIMIT = max_models
+        client = _SAM_CLIENTS.get(model_path)
+        if client is None:
+            client = SAMClient(model_path)
+            client._on_reload = _on_sam_client_reload
+            _SAM_CLIENTS[model_path] = client
+        evicted = _touch_sam_client(client)
+    _unload_sam_clients(evicted)
+
+    if warmup:
+        client.warmup()
+    return client
+
+
+def clear_sam_clients():
+    """Unload every SAM model held by the registry and forget the clients"""
+    with _SAM_CLIENTS_LOCK:
+        clients = list(_SAM_CLIENTS.values())
+        _SAM_CLIENTS.clear()
+    for client in clients:
+        client._on_reload = None
+        client.unload()
+
+
 # Convenience functions for backward compatibility and single-use cases
 # not used in the main SAMClient class or preprocessors
 def segment_stages(
@@ -326,7 +582,7 @@ def segment_stages(
     Returns:
         Dictionary mapping labels to lists of normalized contours
     """
-    client = SAMClient()
+    client = get_sam_client()
     return client.segment_stages(bounding_boxes_data, im, use_prompts)
 
 
@@ -337,8 +593,7 @@ def segment_image_with_boxes(
     aggregate_by_label: bool = True
 ) -> Dict[str, List[List[List[float]]]]:
     """
-    Convenience function to segment an image without creating a client
-    instance.
+    Convenience function to segment an image using the shared client.
 
     Args:
         image: PIL Image to segment
@@ -349,7 +604,7 @@ def segment_image_with_boxes(
     Returns:
         Dictionary mapping labels to lists of normalized contours
     """
-    client = SAMClient()
+    client = get_sam_client()
     return client.segment_with_boxes(
         image,
         bounding_boxes,